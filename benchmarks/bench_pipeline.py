@@ -0,0 +1,215 @@
+"""
+Simulated-market benchmark for the purchase pipeline (purchase_loop + delivery_loop).
+
+Usage:
+    python -m benchmarks.bench_pipeline [--accounts 20] [--users 200] [--scanners 3] [--virtual-seconds 30]
+                                        [--speedup 2] [--baseline benchmarks/baseline_pipeline.json] [--write-baseline]
+
+Seeds N accounts and M users (through apply_deposit) in a temporary SQLite database,
+then runs the real PurchaseService against FakeTelegramClient for a fixed virtual time.
+Virtual time runs --speedup times faster than the wall clock: scan interval, purchase
+pacing, injected RPC latency and the drop schedule are all scaled. Local CPU and DB
+time are scaled up with it, so compare runs made with the same --speedup only.
+
+Reports scan cycles/s, purchases/s, drop-to-first-buy latency percentiles, DB statements
+and RPCs per purchase and peak RSS. With --baseline, metrics worse than the baseline by
+more than --tolerance are flagged and the exit status is 1.
+"""
+import argparse
+import asyncio
+import contextlib
+import io
+import json
+import os
+import resource
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+DEFAULT_BASELINE = Path(__file__).with_name("baseline_pipeline.json")
+# metric -> True when higher is better
+METRICS = {
+    "scan_cycles_per_sec": True,
+    "purchases_per_sec": True,
+    "detect_to_buy_p50_sec": False,
+    "detect_to_buy_p95_sec": False,
+    "detect_to_buy_p99_sec": False,
+    "db_statements_per_purchase": False,
+    "rpcs_per_purchase": False,
+    "peak_rss_mb": False,
+}
+
+
+def _configure(args, tmp: str):
+    # Settings are read at import time: point them at the temp dir before importing the app
+    os.environ.update({
+        "TG_DATA_DIR": tmp,
+        "TG_DB_PATH": os.path.join(tmp, "bench.db"),
+        "TG_DB_DSN": "",
+        "TG_SESSIONS_DIR": os.path.join(tmp, "sessions"),
+        "TG_TDATA_DIR": os.path.join(tmp, "tdata"),
+        "TG_PROXIES_FILE": os.path.join(tmp, "proxies.json"),
+        "TG_BLACKLIST_FILE": os.path.join(tmp, "blacklist.json"),
+        "TG_SCAN_INTERVAL_SEC": str(args.scan_interval / args.speedup),
+        "TG_SCAN_ADAPTIVE": "0" if args.fixed_scan else "1",
+        "TG_SCAN_INTERVAL_MIN_SEC": str(args.scan_min / args.speedup),
+        "TG_SCAN_INTERVAL_MAX_SEC": str(args.scan_max / args.speedup),
+        "TG_SCANNER_COUNT": str(args.scanners),
+        "TG_BATCH_PURCHASE_SLEEP_MS": str(int(args.purchase_sleep_ms / args.speedup)),
+        "TG_MAX_STARS_PER_ACCOUNT": str(args.account_cap),
+        "TG_DELIVERY_RETRY_SEC": str(30.0 / args.speedup),
+        "TG_SNIPE_MODE": "1" if args.snipe else "0",
+        "TG_NOTIFY_ADMINS": "0",
+        "TG_ADMIN_IDS": "",
+        "TG_METRICS_ENABLED": "0",
+    })
+    for key, value in (("TG_BOT_TOKEN", "0:bench"), ("TG_API_ID", "1"), ("TG_API_HASH", "bench")):
+        os.environ.setdefault(key, value)
+
+
+def _percentile(values, q: float):
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * q))]
+
+
+async def _run(args) -> dict:
+    from sqlalchemy import event, func
+    from sqlmodel import select
+
+    from config.settings import CFG, ensure_dirs
+    from database.engine import async_session, get_async_engine
+    from database.schema import init_db
+    from database.repositories.account_repo import AccountRepository
+    from models.purchase import Purchase
+    from services.market_service import MarketService
+    from services.purchase_service import PurchaseService
+
+    from benchmarks.fake_client import FakeAccountService, FakeMarket
+
+    start = time.monotonic()
+    market = FakeMarket(clock=lambda: (time.monotonic() - start) * args.speedup, external_rate=args.external_rate)
+    for i in range(args.catalog):
+        market.add_gift(1_000 + i, 25 * (i + 1), None)
+    for n, at in enumerate(range(args.drop_every, int(args.virtual_seconds), args.drop_every)):
+        market.schedule_drop(at, 5_000 + n, 100 + 50 * (n % 5), args.drop_size)
+
+    account_service = FakeAccountService(market, args.latency / args.speedup)
+    purchase_service = PurchaseService(MarketService(), account_service)
+
+    ensure_dirs(CFG)
+    await init_db()
+    async_engine = get_async_engine()
+
+    async with async_session() as s:
+        await AccountRepository(s).bulk_upsert([
+            {"session_name": f"bench_{i}", "proxy": None, "blacklisted": False, "last_error": None}
+            for i in range(args.accounts)
+        ])
+    ledger = asyncio.create_task(purchase_service.ledger.run())
+    await asyncio.gather(*(purchase_service.apply_deposit(tg_id, args.deposit) for tg_id in range(1, args.users + 1)))
+
+    statements = 0
+
+    def count_statement(*_):
+        nonlocal statements
+        statements += 1
+
+    event.listen(async_engine.sync_engine, "before_cursor_execute", count_statement)
+    start = time.monotonic()  # the market clock starts with the run, not with seeding
+    market.reset_clock()
+    wall = args.virtual_seconds / args.speedup
+    with contextlib.redirect_stdout(io.StringIO()):
+        tasks = [asyncio.create_task(purchase_service.purchase_loop()),
+                 asyncio.create_task(purchase_service.delivery_loop())]
+        if args.snipe:
+            tasks.append(asyncio.create_task(purchase_service.snipe.run()))
+        await asyncio.sleep(wall)
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        ledger.cancel()
+        await asyncio.gather(ledger, return_exceptions=True)
+    event.remove(async_engine.sync_engine, "before_cursor_execute", count_statement)
+
+    async with async_session() as s:
+        purchases = (await s.exec(select(func.count()).select_from(Purchase))).one()
+    clients = account_service.clients.values()
+    scans = sum(c.rpc_counts["_RawGetStarGifts"] for c in clients)
+    rpcs = sum(c.total_rpcs for c in clients) - scans
+    latencies = market.detect_latencies
+    return {
+        "scan_cycles_per_sec": scans / args.virtual_seconds,
+        "purchases_per_sec": purchases / args.virtual_seconds,
+        "detect_to_buy_p50_sec": _percentile(latencies, 0.50),
+        "detect_to_buy_p95_sec": _percentile(latencies, 0.95),
+        "detect_to_buy_p99_sec": _percentile(latencies, 0.99),
+        "db_statements_per_purchase": statements / purchases if purchases else None,
+        "rpcs_per_purchase": rpcs / purchases if purchases else None,
+        "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+        "purchases": purchases,
+        "drops_bought": len(latencies),
+        "blacklisted": len(account_service.blacklisted),
+    }
+
+
+def _compare(result: dict, baseline: dict, tolerance: float) -> bool:
+    ok = True
+    for name, higher_is_better in METRICS.items():
+        value, base = result.get(name), baseline.get(name)
+        line = f"{name:>28}: {value if value is None else round(value, 4)}"
+        if value is not None and base:
+            change = (value - base) / base
+            worse = -change if higher_is_better else change
+            flag = "REGRESSION" if worse > tolerance else ""
+            ok = ok and not flag
+            line += f"  (baseline {round(base, 4)}, {change:+.1%}) {flag}"
+        print(line)
+    return ok
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--accounts", type=int, default=20)
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument("--deposit", type=int, default=20_000, help="Stars deposited per user")
+    parser.add_argument("--account-cap", type=int, default=1_000_000, help="MAX_STARS_PER_ACCOUNT")
+    parser.add_argument("--catalog", type=int, default=2, help="Unlimited gifts always on sale")
+    parser.add_argument("--drop-every", type=int, default=3, help="Virtual seconds between limited drops")
+    parser.add_argument("--drop-size", type=int, default=30, help="Units per limited drop")
+    parser.add_argument("--external-rate", type=float, default=2.0, help="Units/s bought by outside buyers")
+    parser.add_argument("--latency", type=float, default=0.05, help="Injected RPC round trip, virtual seconds")
+    parser.add_argument("--scan-interval", type=float, default=1.0, help="SCAN_INTERVAL_SEC, virtual seconds")
+    parser.add_argument("--fixed-scan", action="store_true", help="Disable SCAN_ADAPTIVE")
+    parser.add_argument("--scan-min", type=float, default=0.5, help="SCAN_INTERVAL_MIN_SEC, virtual seconds")
+    parser.add_argument("--scan-max", type=float, default=30.0, help="SCAN_INTERVAL_MAX_SEC, virtual seconds")
+    parser.add_argument("--scanners", type=int, default=3, help="SCANNER_COUNT")
+    parser.add_argument("--purchase-sleep-ms", type=float, default=400, help="BATCH_PURCHASE_SLEEP_MS, virtual")
+    parser.add_argument("--virtual-seconds", type=float, default=30.0)
+    parser.add_argument("--speedup", type=float, default=2.0)
+    parser.add_argument("--snipe", action="store_true", help="Run with SNIPE_MODE (pre-fetched payment forms)")
+    parser.add_argument("--baseline", type=Path, default=DEFAULT_BASELINE)
+    parser.add_argument("--write-baseline", action="store_true", help="Store this run as the new baseline")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="Allowed relative regression")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(prefix="autobuyer-bench-") as tmp:
+        _configure(args, tmp)
+        result = asyncio.run(_run(args))
+
+    print(f"purchases={result['purchases']} drops bought={result['drops_bought']}"
+          f" blacklisted={result['blacklisted']}")
+    if args.write_baseline:
+        args.baseline.write_text(json.dumps(result, indent=2, sort_keys=True) + "\n", encoding="utf-8")
+        _compare(result, {}, args.tolerance)
+        print(f"baseline written to {args.baseline}")
+        return
+    baseline = json.loads(args.baseline.read_text(encoding="utf-8")) if args.baseline.exists() else {}
+    if not _compare(result, baseline, args.tolerance):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+"""
+Buy latency and RPC count: cold purchase_gift (getPaymentForm + sendStarsForm) vs
+SnipeService with forms fetched ahead of time.
+
+Usage:
+    python -m benchmarks.bench_snipe [--accounts 20] [--latency 0.05] [--server-form-ttl 600] [--idle 0]
+
+Each account buys the scarcest gift once per mode against FakeTelegramClient.
+--idle longer than --server-form-ttl shows the fallback when the server drops
+a form before SNIPE_FORM_TTL_SEC.
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import tempfile
+import time
+
+
+def _configure(tmp: str):
+    # Settings are read at import time: point them at the temp dir before importing the app
+    os.environ.update({
+        "TG_DATA_DIR": tmp,
+        "TG_DB_PATH": os.path.join(tmp, "bench.db"),
+        "TG_DB_DSN": "",
+        "TG_SESSIONS_DIR": os.path.join(tmp, "sessions"),
+        "TG_TDATA_DIR": os.path.join(tmp, "tdata"),
+        "TG_PROXIES_FILE": os.path.join(tmp, "proxies.json"),
+        "TG_BLACKLIST_FILE": os.path.join(tmp, "blacklist.json"),
+        "TG_METRICS_ENABLED": "0",
+    })
+    for key, value in (("TG_BOT_TOKEN", "0:bench"), ("TG_API_ID", "1"), ("TG_API_HASH", "bench")):
+        os.environ.setdefault(key, value)
+
+
+async def _buy_all(accounts, account_service, buy):
+    latencies = []
+
+    async def one(acc):
+        client = await account_service.get_client(acc)
+        start = time.perf_counter()
+        ok, meta = await buy(acc, client)
+        latencies.append(time.perf_counter() - start)
+        return ok
+
+    ok = await asyncio.gather(*(one(acc) for acc in accounts))
+    return sum(ok), latencies
+
+
+def _rpcs(account_service) -> int:
+    return sum(c.total_rpcs for c in account_service.clients.values())
+
+
+def _report(name, bought, latencies, rpcs):
+    latencies = sorted(latencies)
+    p50 = statistics.median(latencies) * 1000
+    p99 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))] * 1000
+    print(f"{name:>6}: bought {bought}/{len(latencies)} | RPCs/buy {rpcs / len(latencies):.2f}"
+          f" | p50 {p50:.1f}ms p99 {p99:.1f}ms")
+
+
+async def main(args):
+    from models.account import Account
+    from models.market_gift import MarketGift
+    from services.market_service import MarketService
+    from services.snipe_service import SnipeService
+
+    from benchmarks.fake_client import FakeAccountService, FakeMarket
+
+    market = FakeMarket(form_ttl=args.server_form_ttl)
+    market.add_gift(1, 100, 10_000)
+    market.add_gift(2, 500, 50)
+    gift = MarketGift(code="2", title="Star Gift 500", price_stars=500, remaining=50)
+    account_service = FakeAccountService(market, args.latency)
+    market_service = MarketService()
+    accounts = [Account(id=i, session_name=f"acc_{i}", stars_wallet=0) for i in range(1, args.accounts + 1)]
+
+    bought, latencies = await _buy_all(
+        accounts, account_service, lambda acc, c: market_service.purchase_gift(c, gift.code, gift.price_stars))
+    _report("cold", bought, latencies, _rpcs(account_service))
+
+    snipe = SnipeService(market_service, account_service)
+    snipe.set_targets(accounts, [gift])
+    before = _rpcs(account_service)
+    await snipe._refresh()
+    print(f"warm-up: {_rpcs(account_service) - before} getPaymentForm calls")
+    await asyncio.sleep(args.idle)
+    before = _rpcs(account_service)
+    bought, latencies = await _buy_all(
+        accounts, account_service, lambda acc, c: snipe.buy(acc, c, gift.code, gift.price_stars))
+    _report("warm", bought, latencies, _rpcs(account_service) - before)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--accounts", type=int, default=20)
+    parser.add_argument("--latency", type=float, default=0.05, help="Injected round trip per RPC, seconds")
+    parser.add_argument("--server-form-ttl", type=float, default=600.0, help="Form lifetime on the fake server")
+    parser.add_argument("--idle", type=float, default=0.0, help="Pause between warm-up and the buys, seconds")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(prefix="autobuyer-bench-") as tmp:
+        _configure(tmp)
+        asyncio.run(main(args))
@@ -0,0 +1,132 @@
+"""
+Microbenchmark: zero-copy payments.StarGifts parser vs the old read_object() parser.
+
+Usage:
+    python -m benchmarks.bench_star_gift_parser [--gifts 100] [--rounds 200] [--payloads FILE ...]
+
+--payloads takes raw payments.StarGifts bodies (the bytes Telethon hands to
+read_result, starting at the constructor id) recorded from a live account.
+Without it, payloads are synthesized from real Telethon Document objects.
+Both parsers must agree on every payload the legacy parser understands.
+"""
+import argparse
+import random
+import struct
+import time
+from typing import List
+
+from telethon.extensions import BinaryReader
+from telethon.tl import types
+
+from utils.tl_utils import parse_star_gifts, StarGiftRecord
+
+
+def legacy_parse(payload: bytes):
+    """The pre-zero-copy parser: deserializes every sticker Document (with tgread_object)."""
+    reader = BinaryReader(payload)
+    cid = reader.read_int(signed=False)
+    if cid == 0xA388A368:
+        return None
+    hash_ = reader.read_int()
+    reader.read_int(signed=False)
+    count = reader.read_int()
+    results = []
+    for _ in range(count):
+        item_cid = reader.read_int(signed=False)
+        if item_cid != 0x49C577CD:
+            raise ValueError(f"Unexpected constructor id for StarGift: {hex(item_cid)}")
+        flags = reader.read_int()
+        limited = bool(flags & 1)
+        sold_out = bool(flags & 2)
+        id_ = reader.read_long()
+        reader.tgread_object()
+        stars = reader.read_long()
+        remains = 999999
+        if limited:
+            remains = reader.read_int()
+            reader.read_int()
+        reader.read_long()
+        if sold_out:
+            remains = 0
+            reader.read_int()
+            reader.read_int()
+        results.append(StarGiftRecord(id_, stars, remains, limited, sold_out))
+    return hash_, results
+
+
+def _sticker(rng: random.Random) -> bytes:
+    return bytes(types.Document(
+        id=rng.getrandbits(63), access_hash=rng.getrandbits(63), file_reference=rng.randbytes(29),
+        date=None, mime_type="application/x-tgsticker", size=rng.randint(10_000, 60_000), dc_id=2,
+        attributes=[
+            types.DocumentAttributeImageSize(w=512, h=512),
+            types.DocumentAttributeSticker(alt="🎁", stickerset=types.InputStickerSetID(
+                id=rng.getrandbits(63), access_hash=rng.getrandbits(63))),
+            types.DocumentAttributeFilename(file_name="AnimatedSticker.tgs"),
+        ],
+        thumbs=[
+            types.PhotoPathSize(type="j", bytes=rng.randbytes(rng.randint(200, 900))),
+            types.PhotoSize(type="m", w=128, h=128, size=rng.randint(3000, 9000)),
+            types.PhotoSizeProgressive(type="x", w=512, h=512, sizes=[1200, 4800, 9600]),
+        ],
+        video_thumbs=[types.VideoSize(type="u", w=100, h=100, size=rng.randint(1000, 5000), video_start_ts=0.5)],
+    ))
+
+
+def synth_payload(n: int, seed: int = 1) -> bytes:
+    """payments.starGifts#901689ea with n starGift#49c577cd items."""
+    rng = random.Random(seed)
+    out = bytearray(struct.pack("<IiIi", 0x901689EA, rng.getrandbits(31), 0x1CB5C415, n))
+    for i in range(n):
+        limited = rng.random() < 0.6
+        sold_out = limited and rng.random() < 0.3
+        flags = (1 if limited else 0) | (2 if sold_out else 0)
+        out += struct.pack("<IIq", 0x49C577CD, flags, 5_000_000_000 + i)
+        out += _sticker(rng)
+        out += struct.pack("<q", rng.choice((15, 25, 50, 100, 500, 2500)))
+        if limited:
+            out += struct.pack("<ii", rng.randint(0, 10_000), 10_000)
+        out += struct.pack("<q", rng.randint(10, 2000))
+        if sold_out:
+            out += struct.pack("<ii", 1_700_000_000, 1_700_100_000)
+    return bytes(out)
+
+
+def _time(fn, payload: bytes, rounds: int) -> float:
+    start = time.perf_counter()
+    for _ in range(rounds):
+        fn(payload)
+    return (time.perf_counter() - start) / rounds
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--gifts", type=int, default=100, help="Gifts per synthesized payload")
+    parser.add_argument("--rounds", type=int, default=200, help="Parses per measurement")
+    parser.add_argument("--payloads", nargs="*", default=[], help="Recorded raw payments.StarGifts bodies")
+    args = parser.parse_args()
+
+    payloads: List[tuple] = [(f"synthetic x{args.gifts}", synth_payload(args.gifts))]
+    for path in args.payloads:
+        with open(path, "rb") as f:
+            payloads.append((path, f.read()))
+
+    for name, payload in payloads:
+        fast = parse_star_gifts(payload)[0]
+        try:
+            legacy = legacy_parse(payload)
+        except Exception as e:  # newer StarGift layouts the old parser never understood
+            legacy = None
+            print(f"{name}: legacy parser cannot read this payload ({e}); timing new parser only")
+        else:
+            assert fast == legacy, f"{name}: parsers disagree"
+        t_fast = _time(lambda p: parse_star_gifts(p), payload, args.rounds)
+        line = f"{name}: {len(payload)} bytes, {len(fast[1]) if fast else 0} gifts | zero-copy {t_fast * 1e6:.1f}µs"
+        if legacy is not None:
+            t_legacy = _time(legacy_parse, payload, args.rounds)
+            line += f" | legacy {t_legacy * 1e6:.1f}µs | x{t_legacy / t_fast:.1f}"
+        print(line)
+
+
+if __name__ == "__main__":
+    main()
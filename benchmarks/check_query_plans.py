@@ -0,0 +1,246 @@
+"""
+Query-plan regression check for the repositories (SQLite).
+
+Usage:
+    python -m benchmarks.check_query_plans [--verbose]
+
+Builds a temporary database through database.schema.init_db (so the migrations are
+exercised too), calls every public repository method once and runs EXPLAIN QUERY PLAN
+on each SELECT / UPDATE / DELETE it issued. A full scan of a table or of one of its
+indexes (SCAN <table>; index lookups show as SEARCH) fails the check unless the method
+is listed in FULL_SCANS: reads that want every row anyway. A repository method missing from _calls() fails it as well,
+so a new query cannot skip the check. The exit status is 1 on any failure.
+"""
+import argparse
+import asyncio
+import inspect
+import os
+import re
+import sqlite3
+import sys
+import tempfile
+
+# "Repository.method" -> tables it may scan in full, and why
+FULL_SCANS = {
+    "AccountRepository.get_all": {"account"},  # account list: every row
+    "AccountRepository.stats": {"account"},  # aggregate over every account
+    "AccountRepository.page": {"account"},  # first page: primary key walk that stops after limit + 1
+    "GiftTypeRepository.get_all": {"gifttype"},  # the catalog: a few hundred rows at most
+    "GiftTypeRepository.count": {"gifttype"},  # catalog-sized
+    "GiftTypeRepository.page": {"gifttype"},  # expression sort key (-price_stars); catalog-sized
+    "PurchaseRepository.stats_by_status": {"purchase"},  # totals over every purchase, index-only
+    "UserRepository.get_all": {"user"},  # allocation plans for every funded user
+    "LeaseRepository.live": {"lease"},  # one row per account and worker; prefix LIKE can't seek
+    # Rows only live for one purchase cycle; owner != / NOT IN can't seek
+    "ReservationRepository.take_orphaned": {"reservation", "lease"},
+}
+SCAN = re.compile(r"\bSCAN (\w+)\b")
+
+
+def _configure(tmp: str):
+    os.environ.update({
+        "TG_DATA_DIR": tmp,
+        "TG_DB_PATH": os.path.join(tmp, "plans.db"),
+        "TG_DB_DSN": "",
+        "TG_SESSIONS_DIR": os.path.join(tmp, "sessions"),
+        "TG_TDATA_DIR": os.path.join(tmp, "tdata"),
+        "TG_PROXIES_FILE": os.path.join(tmp, "proxies.json"),
+        "TG_BLACKLIST_FILE": os.path.join(tmp, "blacklist.json"),
+        "TG_METRICS_ENABLED": "0",
+    })
+    for key, value in (("TG_BOT_TOKEN", "0:plans"), ("TG_API_ID", "1"), ("TG_API_HASH", "plans")):
+        os.environ.setdefault(key, value)
+
+
+def _calls(s):
+    """Repository class -> {method: coroutine factory}; each call runs against seeded rows."""
+    from database.repositories.account_repo import AccountRepository
+    from database.repositories.catalog_snapshot_repo import CatalogSnapshotRepository
+    from database.repositories.deposit_repo import DepositRepository
+    from database.repositories.gift_type_repo import GiftTypeRepository
+    from database.repositories.lease_repo import LeaseRepository
+    from database.repositories.purchase_repo import PurchaseRepository
+    from database.repositories.reservation_repo import ReservationRepository
+    from database.repositories.stock_history_repo import StockHistoryRepository
+    from database.repositories.user_repo import UserRepository
+
+    accounts, deposits, gifts = AccountRepository(s), DepositRepository(s), GiftTypeRepository(s)
+    leases, purchases, history, users = LeaseRepository(s), PurchaseRepository(s), StockHistoryRepository(s), UserRepository(s)
+    snapshot, reservations = CatalogSnapshotRepository(s), ReservationRepository(s)
+
+    return {
+        AccountRepository: {
+            "get_or_create_account": lambda: accounts.get_or_create_account("plans_1"),
+            "bulk_upsert": lambda: accounts.bulk_upsert([{"session_name": "plans_2", "proxy": None,
+                                                          "blacklisted": False, "last_error": None}]),
+            "mark_removed": lambda: accounts.mark_removed(["plans_3"]),
+            "get_by_session_names": lambda: accounts.get_by_session_names(["plans_1", "plans_2"]),
+            "get_all_non_blacklisted": lambda: accounts.get_all_non_blacklisted(),
+            "get_by_id": lambda: accounts.get_by_id(1),
+            "update": lambda: _with(accounts.get_by_id(1), accounts.update),
+            "add_to_wallet": lambda: accounts.add_to_wallet(1, 10),
+            "blacklist": lambda: _with(accounts.get_by_id(2), lambda a: accounts.blacklist(a, "plans")),
+            "get_all": lambda: accounts.get_all(),
+            "stats": lambda: accounts.stats(),
+            "page": lambda: _all(accounts.page(), accounts.page(after_id=1), accounts.page(before_id=2)),
+        },
+        CatalogSnapshotRepository: {
+            "publish": lambda: _all(snapshot.publish("[]"), snapshot.publish("[]")),
+            "version": lambda: snapshot.version(),
+            "get": lambda: snapshot.get(),
+        },
+        GiftTypeRepository: {
+            "create_or_update": lambda: _all(gifts.create_or_update("1", "A", 100, 5), gifts.create_or_update("1", "A", 90, 4)),
+            "upsert_many": lambda: _all(
+                gifts.upsert_many([{"code": "2", "title": "B", "price_stars": 50, "remaining_global": 9}]),
+                gifts.upsert_many([{"code": "2", "title": "B", "price_stars": 50, "remaining_global": 8}])),
+            "get_refs_by_codes": lambda: gifts.get_refs_by_codes(["1", "2"]),
+            "get_by_code": lambda: gifts.get_by_code("1"),
+            "get_all": lambda: gifts.get_all(),
+            "count": lambda: gifts.count(),
+            "page": lambda: _all(gifts.page(), gifts.page(after=(4, 90, 1)), gifts.page(before=(4, 90, 1))),
+            "decrement_remaining": lambda: _with(gifts.get_by_code("1"), gifts.decrement_remaining),
+            "decrement_remaining_by_id": lambda: gifts.decrement_remaining_by_id(1),
+        },
+        UserRepository: {
+            "create_or_update": lambda: users.create_or_update(1001),
+            "get_by_tg_id": lambda: users.get_by_tg_id(1001),
+            "get_by_id": lambda: users.get_by_id(1),
+            "update": lambda: _with(users.get_by_id(1), users.update),
+            "credit": lambda: users.credit(1, 90, 100),
+            "debit": lambda: users.debit(1, 10),
+            "get_all": lambda: users.get_all(),
+        },
+        DepositRepository: {
+            "create_deposit": lambda: deposits.create_deposit(1, 100, 0.1),
+            "apply_realization_fifo": lambda: deposits.apply_realization_fifo(1, 10),
+            "get_by_user_id": lambda: deposits.get_by_user_id(1),
+        },
+        PurchaseRepository: {
+            "create_purchase": lambda: purchases.create_purchase(1, 1, 100, 1, {}),
+            "get_pending": lambda: purchases.get_pending(),
+            "get_all_pending": lambda: purchases.get_all_pending(),
+            "get_pending_with_parties": lambda: _all(purchases.get_pending_with_parties(),
+                                                     purchases.get_pending_with_parties([1]),
+                                                     purchases.get_pending_with_parties(None, {1})),
+            "stats_by_status": lambda: purchases.stats_by_status(),
+            "mark_delivered_by_id": lambda: purchases.mark_delivered_by_id(1),
+            "mark_delivered": lambda: _with(s.get(_purchase_model(), 1), purchases.mark_delivered),
+        },
+        LeaseRepository: {
+            "acquire": lambda: leases.acquire(["account:1", "account:2"], "plans", 30, 0),
+            "renew": lambda: leases.renew("plans", 30, 0),
+            "live": lambda: leases.live("account:", 0),
+            "release": lambda: _all(leases.release("plans", ["account:2"]), leases.release("plans")),
+        },
+        ReservationRepository: {
+            "add": lambda: reservations.add("plans", [(1, 10), (1, 20)]),
+            "park": lambda: reservations.park(1, 1, "1", {}),
+            "take": lambda: reservations.take([1]),
+            "take_by_owner": lambda: reservations.take_by_owner("plans"),
+            "take_orphaned": lambda: _all(reservations.take_orphaned("plans", None, 0),
+                                          reservations.take_orphaned("plans", "worker:", 0)),
+        },
+        StockHistoryRepository: {
+            "append": lambda: history.append([{"gift_type_id": 1, "ts": 100, "remaining": 5, "price_stars": 90}]),
+            "since": lambda: history.since(0),
+            "downsample": lambda: history.downsample(200, 60),
+            "purge": lambda: history.purge(50),
+        },
+    }
+
+
+def _purchase_model():
+    from models.purchase import Purchase
+    return Purchase
+
+
+async def _with(getter, action):
+    return await action(await getter)
+
+
+async def _all(*coros):
+    for coro in coros:
+        await coro
+
+
+def _public_methods(cls):
+    return {name for name, fn in inspect.getmembers(cls, inspect.iscoroutinefunction) if not name.startswith("_")}
+
+
+async def _collect():
+    """[(\"Repository.method\", sql, params)] for every statement the repositories issue."""
+    from sqlalchemy import event
+    from config.settings import CFG, ensure_dirs
+    from database.engine import async_session, get_async_engine
+    from database.schema import init_db
+
+    ensure_dirs(CFG)
+    await init_db()
+    current = None
+    statements = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        if not executemany:
+            statements.append((current, statement, parameters))
+
+    engine = get_async_engine()
+    event.listen(engine.sync_engine, "before_cursor_execute", record)
+    missing = []
+    async with async_session() as s:
+        for cls, methods in _calls(s).items():
+            for name in sorted(_public_methods(cls) - set(methods)):
+                missing.append(f"{cls.__name__}.{name}")
+            for name, call in methods.items():
+                current = f"{cls.__name__}.{name}"
+                await call()
+    event.remove(engine.sync_engine, "before_cursor_execute", record)
+    await engine.dispose()
+    return statements, missing, CFG.DB_PATH
+
+
+def _check(statements, db_path: str, verbose: bool):
+    from sqlmodel import SQLModel
+    tables = set(SQLModel.metadata.tables)
+    failures = []
+    conn = sqlite3.connect(db_path)
+    seen = set()
+    for method, sql, params in statements:
+        if not re.match(r"\s*(SELECT|UPDATE|DELETE)\b", sql, re.I) or (method, sql) in seen:
+            continue
+        seen.add((method, sql))
+        plan = [row[-1] for row in conn.execute("EXPLAIN QUERY PLAN " + sql, params or ())]
+        scans = {m.group(1) for line in plan for m in [SCAN.search(line)] if m and m.group(1) in tables}
+        bad = scans - FULL_SCANS.get(method, set())
+        if verbose or bad:
+            print(f"{'FAIL' if bad else 'ok  '} {method}: {' '.join(sql.split())[:140]}")
+            for line in plan:
+                print(f"       {line}")
+        if bad:
+            failures.append((method, sorted(bad)))
+    conn.close()
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--verbose", action="store_true", help="Print every plan, not only failing ones")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(prefix="autobuyer-plans-") as tmp:
+        _configure(tmp)
+        statements, missing, db_path = asyncio.run(_collect())
+        failures = _check(statements, db_path, args.verbose)
+
+    for name in missing:
+        print(f"UNCHECKED {name}: add it to _calls()")
+    for method, tables in failures:
+        print(f"FULL SCAN {method}: {', '.join(tables)}")
+    checked = len({method for method, _, _ in statements})
+    print(f"{checked} repository methods checked, {len(failures)} full scans, {len(missing)} unchecked")
+    if failures or missing:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
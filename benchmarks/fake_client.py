@@ -0,0 +1,195 @@
+"""
+In-process stand-ins for TelegramClient and AccountService used by the benchmarks.
+
+FakeTelegramClient answers the raw Stars gift requests from a shared FakeMarket.
+Each call serializes the request the way Telethon does, waits the injected round
+trip, builds a TL response and parses it with the request's own read_result. So
+encoding and decoding run on the real code path, and only the network is simulated.
+"""
+import asyncio
+import contextlib
+import struct
+import time
+from collections import defaultdict
+from typing import AsyncIterator, Callable, Dict, List, Optional
+
+from telethon.errors import BadRequestError
+from telethon.extensions import BinaryReader
+
+from utils.tl_utils import _RawGetPaymentForm, _RawGetStarGifts, _RawSendStarsForm
+
+
+def _tl_string(s: str) -> bytes:
+    data = s.encode("utf-8")
+    out = bytes([len(data)]) + data
+    return out + b"\x00" * (-len(out) % 4)
+
+
+class FakeMarket:
+    """
+    Gift stock and issued payment forms shared by every fake client.
+
+    Limited drops can be scheduled with schedule_drop(); outside buyers deplete limited
+    stock at external_rate units per second. Time comes from clock (seconds), so a
+    harness can run the market on a scaled clock. For every drop, detect_latencies gets
+    the time from its release to our first successful sendStarsForm.
+    """
+
+    def __init__(self, form_ttl: float = 600.0, clock: Callable[[], float] = time.monotonic,
+                 external_rate: float = 0.0):
+        self.gifts: Dict[int, List[int]] = {}  # gift id -> [price, remaining]; remaining None = unlimited
+        self.hash = 1
+        self.form_ttl = form_ttl
+        self.clock = clock
+        self.external_rate = external_rate
+        self.detect_latencies: List[float] = []
+        self.sold = 0
+        self._forms: Dict[int, tuple] = {}  # form id -> (gift id, amount, expires_at)
+        self._next_form_id = 1000
+        self._drops: List[tuple] = []  # (at, gift id, price, units), sorted by release time
+        self._released_at: Dict[int, float] = {}  # drop gift id -> release time, until our first buy
+        self._last_tick = clock()
+        self._external_debt = 0.0
+
+    def add_gift(self, gift_id: int, price: int, remaining: Optional[int]):
+        self.gifts[gift_id] = [price, remaining]
+        self.hash += 1
+
+    def schedule_drop(self, at: float, gift_id: int, price: int, units: int):
+        self._drops.append((at, gift_id, price, units))
+        self._drops.sort()
+
+    def reset_clock(self):
+        """Forget time elapsed so far (e.g. while a harness was seeding) for outside buyers."""
+        self._last_tick = self.clock()
+
+    def tick(self):
+        """Release due drops and let outside buyers take their share of limited stock."""
+        now = self.clock()
+        while self._drops and self._drops[0][0] <= now:
+            at, gift_id, price, units = self._drops.pop(0)
+            self.add_gift(gift_id, price, units)
+            self._released_at[gift_id] = at
+        self._external_debt += (now - self._last_tick) * self.external_rate
+        self._last_tick = now
+        while self._external_debt >= 1:
+            in_stock = [g for g in self.gifts.values() if g[1] is not None and g[1] > 0]
+            if not in_stock:
+                self._external_debt = 0.0
+                break
+            min(in_stock, key=lambda g: g[1])[1] -= 1
+            self._external_debt -= 1
+            self.hash += 1
+
+    def issue_form(self, gift_id: int) -> tuple:
+        self._next_form_id += 1
+        amount = self.gifts[gift_id][0]
+        self._forms[self._next_form_id] = (gift_id, amount, self.clock() + self.form_ttl)
+        return self._next_form_id, amount
+
+    def redeem_form(self, request, form_id: int):
+        form = self._forms.pop(form_id, None)
+        if form is None or form[2] <= self.clock():
+            raise BadRequestError(request, "FORM_EXPIRED")
+        gift = self.gifts[form[0]]
+        if gift[1] is not None:
+            if gift[1] <= 0:
+                raise BadRequestError(request, "STARGIFT_USAGE_LIMITED")
+            gift[1] -= 1
+            self.hash += 1
+        self.sold += 1
+        released_at = self._released_at.pop(form[0], None)
+        if released_at is not None:
+            self.detect_latencies.append(self.clock() - released_at)
+
+    def star_gifts_payload(self, known_hash: int) -> bytes:
+        if known_hash == self.hash:
+            return struct.pack("<I", 0xA388A368)  # starGiftsNotModified
+        out = bytearray(struct.pack("<IiIi", 0x901689EA, self.hash, 0x1CB5C415, len(self.gifts)))
+        for gift_id, (price, remaining) in self.gifts.items():
+            flags = 0 if remaining is None else 1 | (2 if remaining <= 0 else 0)
+            out += struct.pack("<IIqIqq", 0x49C577CD, flags, gift_id, 0x36F8C871, gift_id, price)  # documentEmpty
+            if remaining is not None:
+                out += struct.pack("<ii", max(remaining, 0), 10_000)
+            out += struct.pack("<q", price // 2)
+            if flags & 2:
+                out += struct.pack("<ii", 1_700_000_000, 1_700_000_100)
+        return bytes(out)
+
+
+class FakeTelegramClient:
+    """Counts RPCs per request type and their wall time, including the injected latency."""
+
+    def __init__(self, market: FakeMarket, latency: float = 0.05):
+        self.market = market
+        self.latency = latency
+        self.rpc_counts: Dict[str, int] = defaultdict(int)
+        self.rpc_time: Dict[str, float] = defaultdict(float)
+
+    def is_connected(self) -> bool:
+        return True
+
+    async def __call__(self, request):
+        start = time.perf_counter()
+        payload = bytes(request)
+        await asyncio.sleep(self.latency)
+        try:
+            return self._answer(request, payload)
+        finally:
+            name = type(request).__name__
+            self.rpc_counts[name] += 1
+            self.rpc_time[name] += time.perf_counter() - start
+
+    def _answer(self, request, payload: bytes):
+        self.market.tick()
+        if isinstance(request, _RawGetStarGifts):
+            body = self.market.star_gifts_payload(struct.unpack_from("<i", payload, 4)[0])
+        elif isinstance(request, _RawGetPaymentForm):
+            gift_id = struct.unpack_from("<q", payload, len(payload) - 8)[0]
+            form_id, amount = self.market.issue_form(gift_id)
+            body = (struct.pack("<IqIi", 0xB425CFE1, form_id, 0x049EE584, 0) + _tl_string("XTR")
+                    + struct.pack("<IiI", 0x1CB5C415, 1, 0xCB296BF8) + _tl_string("Gift") + struct.pack("<q", amount))
+        elif isinstance(request, _RawSendStarsForm):
+            self.market.redeem_form(request, struct.unpack_from("<q", payload, 4)[0])
+            body = struct.pack("<II", 0x4E5F810D, 0xE317AF7E)  # paymentResult(updatesTooLong)
+        else:
+            raise NotImplementedError(type(request).__name__)
+        return request.read_result(BinaryReader(body))
+
+    @property
+    def total_rpcs(self) -> int:
+        return sum(self.rpc_counts.values())
+
+
+class FakeAccountService:
+    """Hands out one FakeTelegramClient per account id; accounts come straight from the DB."""
+
+    def __init__(self, market: FakeMarket, latency: float = 0.05):
+        self.market = market
+        self.latency = latency
+        self.clients: Dict[int, FakeTelegramClient] = {}
+        self.accounts_version = 0
+        self.owned = None
+        self.blacklisted: List[str] = []
+
+    def owns(self, acc_id: int) -> bool:
+        return True
+
+    async def scan_sessions(self) -> bool:
+        return False
+
+    async def blacklist_account(self, acc, reason: str, repo):
+        await repo.blacklist(acc, reason)
+        self.blacklisted.append(f"{acc.session_name}: {reason}")
+        self.accounts_version += 1
+        self.clients.pop(acc.id, None)
+
+    async def get_client(self, acc) -> FakeTelegramClient:
+        client = self.clients.get(acc.id)
+        if client is None:
+            client = self.clients[acc.id] = FakeTelegramClient(self.market, self.latency)
+        return client
+
+    @contextlib.asynccontextmanager
+    async def using(self, acc) -> AsyncIterator[FakeTelegramClient]:
+        yield await self.get_client(acc)
@@ -1,5 +1,13 @@
-from aiogram import Bot, Dispatcher, F
-from config.settings import CFG
-
-bot = Bot(CFG.BOT_TOKEN)
-dp = Dispatcher()
\ No newline at end of file
+from aiogram import Bot, Dispatcher, F
+from config.settings import CFG
+
+dp = Dispatcher()
+_bot: Bot | None = None
+
+
+def get_bot() -> Bot:
+    """The Bot is built on first use, so importing the dispatcher reads no settings."""
+    global _bot
+    if _bot is None:
+        _bot = Bot(CFG.BOT_TOKEN)
+    return _bot
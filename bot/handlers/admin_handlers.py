@@ -1,31 +1,171 @@
-from aiogram.types import Message
-from aiogram.filters import Command
-from bot.dispatcher import dp
-from utils.helpers import is_admin
-from database.engine import engine
-from sqlmodel import Session, select
-from models.gift_type import GiftType
-from models.account import Account
-from models.purchase import Purchase
-
-@dp.message(Command("admin"))
-async def admin_panel(message: Message):
-    if not is_admin(message.from_user.id):
-        return
-    with Session(engine) as s:
-        gifts = s.exec(select(GiftType)).all()
-        print(gifts)
-        accounts = s.exec(select(Account)).all()
-        pending = s.exec(select(Purchase).where(Purchase.status == "purchased")).all()
-    gifts_sorted = sorted(gifts, key=lambda g: (g.remaining_global, -g.price_stars))
-    lines = ["📊 Админ-панель:"]
-    if gifts_sorted:
-        lines.append("\nОстатки подарков (чем меньше, тем выше приоритет):")
-        for g in gifts_sorted:
-            lines.append(f"• {g.title} — {g.price_stars}⭐ | осталось≈ {g.remaining_global}")
-    lines.append("\nАккаунты:")
-    for a in accounts[:50]:
-        status = "BL" if a.blacklisted else "OK"
-        lines.append(f"• {a.session_name} [{status}] кошелёк≈{a.stars_wallet}⭐ proxy={'yes' if a.proxy else 'no'}")
-    lines.append(f"\nНепоставленные покупки: {len(pending)}")
-    await message.answer("\n".join(lines))
\ No newline at end of file
+from aiogram.types import Message, CallbackQuery, InlineKeyboardMarkup
+from aiogram.filters import Command
+from aiogram.utils.keyboard import InlineKeyboardBuilder
+from aiogram import F
+from aiogram.exceptions import TelegramBadRequest
+from bot.dispatcher import dp
+from config.settings import CFG
+from utils.helpers import is_admin
+from database.engine import async_session
+from database.repositories.account_repo import AccountRepository
+from database.repositories.gift_type_repo import GiftTypeRepository
+from database.repositories.purchase_repo import PurchaseRepository
+from typing import Awaitable, Callable, Dict, Tuple
+import asyncio
+import time
+
+purchase_service = None  # Set in main; its stock_history feeds sell rates into the gift view
+
+# Rendered views shared between admins for ADMIN_PANEL_CACHE_SEC: key -> (expires_at, text, markup)
+_view_cache: Dict[str, Tuple[float, str, InlineKeyboardMarkup]] = {}
+_view_lock = asyncio.Lock()
+
+
+async def _cached_view(key: str, render: Callable[[], Awaitable[Tuple[str, InlineKeyboardMarkup]]]):
+    # One lock: concurrent /admin calls wait for the first render instead of running their own queries
+    async with _view_lock:
+        hit = _view_cache.get(key)
+        if hit and hit[0] > time.monotonic():
+            return hit[1], hit[2]
+        text, markup = await render()
+        now = time.monotonic()
+        for stale in [k for k, v in _view_cache.items() if v[0] <= now]:
+            del _view_cache[stale]
+        _view_cache[key] = (now + CFG.ADMIN_PANEL_CACHE_SEC, text, markup)
+        return text, markup
+
+
+async def _render_summary():
+    async with async_session() as s:
+        gift_count = await GiftTypeRepository(s).count()
+        acc = await AccountRepository(s).stats()
+        purchases = await PurchaseRepository(s).stats_by_status()
+    lines = [
+        "📊 Админ-панель:",
+        f"\nПодарков в каталоге: {gift_count}",
+        f"Аккаунты: {acc['total']} (BL: {acc['blacklisted']}), кошельки≈{acc['wallet_total']}⭐",
+    ]
+    if purchases:
+        lines.append("\nПокупки:")
+        for status, (cnt, total) in sorted(purchases.items()):
+            lines.append(f"• {status}: {cnt} на {total}⭐")
+    lines.append(f"\nНепоставленные покупки: {purchases.get('purchased', (0, 0))[0]}")
+    kb = InlineKeyboardBuilder()
+    kb.button(text="🎁 Подарки", callback_data="adm:gift:n:")
+    kb.button(text="👤 Аккаунты", callback_data="adm:acc:n:")
+    return "\n".join(lines), kb.as_markup()
+
+
+def _nav_markup(view: str, first: str | None, last: str | None):
+    kb = InlineKeyboardBuilder()
+    if first is not None:
+        kb.button(text="◀", callback_data=f"adm:{view}:p:{first}")
+    if last is not None:
+        kb.button(text="▶", callback_data=f"adm:{view}:n:{last}")
+    kb.button(text="⬅ Панель", callback_data="adm:home")
+    return kb.as_markup()
+
+
+async def _render_accounts(direction: str, cursor: str):
+    limit = CFG.ADMIN_PANEL_PAGE_SIZE
+    cursor_id = int(cursor) if cursor else None
+    async with async_session() as s:
+        repo = AccountRepository(s)
+        if direction == "p":
+            rows = await repo.page(before_id=cursor_id, limit=limit)
+            has_prev, has_next = len(rows) > limit, True
+            rows = rows[-limit:]
+        else:
+            rows = await repo.page(after_id=cursor_id, limit=limit)
+            has_prev, has_next = cursor_id is not None, len(rows) > limit
+            rows = rows[:limit]
+    lines = ["👤 Аккаунты:"]
+    for a in rows:
+        status = "BL" if a.blacklisted else "OK"
+        lines.append(f"• {a.session_name} [{status}] кошелёк≈{a.stars_wallet}⭐ proxy={'yes' if a.proxy else 'no'}")
+    if not rows:
+        lines.append("— пусто —")
+    first = str(rows[0].id) if rows and has_prev else None
+    last = str(rows[-1].id) if rows and has_next else None
+    return "\n".join(lines), _nav_markup("acc", first, last)
+
+
+def _format_duration(sec: float) -> str:
+    if sec < 60:
+        return f"{int(sec)} с"
+    if sec < 3600:
+        return f"{int(sec // 60)} мин"
+    if sec < 86400:
+        return f"{sec / 3600:.1f} ч"
+    return f"{sec / 86400:.1f} дн"
+
+
+def _stock_trend(code: str) -> str:
+    if purchase_service is None:
+        return ""
+    history = purchase_service.stock_history
+    window = CFG.STOCK_RATE_WINDOW_SEC
+    rate = history.sell_rate(code, window)
+    if not rate:
+        return ""
+    text = f" | ↓{rate * 60:.1f}/мин"
+    eta = history.eta_sell_out(code, window)
+    if eta is not None:
+        text += f", закончится через ≈{_format_duration(eta)}"
+    return text
+
+
+def _gift_cursor(g) -> str:
+    return f"{g.remaining_global}_{g.price_stars}_{g.id}"
+
+
+async def _render_gifts(direction: str, cursor: str):
+    limit = CFG.ADMIN_PANEL_PAGE_SIZE
+    key = tuple(int(x) for x in cursor.split("_")) if cursor else None
+    async with async_session() as s:
+        repo = GiftTypeRepository(s)
+        if direction == "p":
+            rows = await repo.page(before=key, limit=limit)
+            has_prev, has_next = len(rows) > limit, True
+            rows = rows[-limit:]
+        else:
+            rows = await repo.page(after=key, limit=limit)
+            has_prev, has_next = key is not None, len(rows) > limit
+            rows = rows[:limit]
+    lines = ["🎁 Остатки подарков (чем меньше, тем выше приоритет):"]
+    for g in rows:
+        lines.append(f"• {g.title} — {g.price_stars}⭐ | осталось≈ {g.remaining_global}{_stock_trend(g.code)}")
+    if not rows:
+        lines.append("— пусто —")
+    first = _gift_cursor(rows[0]) if rows and has_prev else None
+    last = _gift_cursor(rows[-1]) if rows and has_next else None
+    return "\n".join(lines), _nav_markup("gift", first, last)
+
+
+@dp.message(Command("admin"))
+async def admin_panel(message: Message):
+    if not is_admin(message.from_user.id):
+        return
+    text, markup = await _cached_view("home", _render_summary)
+    await message.answer(text, reply_markup=markup)
+
+
+@dp.callback_query(F.data.startswith("adm:"))
+async def admin_nav(cb: CallbackQuery):
+    if not is_admin(cb.from_user.id):
+        await cb.answer()
+        return
+    parts = cb.data.split(":")
+    view = parts[1]
+    if view == "home":
+        text, markup = await _cached_view("home", _render_summary)
+    else:
+        direction, cursor = parts[2], parts[3]
+        render = _render_accounts if view == "acc" else _render_gifts
+        text, markup = await _cached_view(cb.data, lambda: render(direction, cursor))
+    try:
+        await cb.message.edit_text(text, reply_markup=markup)
+    except TelegramBadRequest as e:
+        if "not modified" not in str(e):
+            raise
+    await cb.answer()
@@ -0,0 +1,106 @@
+"""
+Webhook mode: Telegram POSTs updates to a local aiohttp server instead of being long-polled.
+
+Every request is answered as soon as its secret token and JSON are checked; the update is
+queued and handled by WEBHOOK_WORKERS tasks. Updates are sharded by user, so one user's
+updates stay in order while different users are handled in parallel. A full shard answers
+503 and Telegram redelivers later, so a backlog never grows without bound.
+
+Local test with a recorded update (without WEBHOOK_URL setWebhook is not called):
+    TG_BOT_MODE=webhook TG_WEBHOOK_SECRET=dev python main_new.py
+    curl -H "X-Telegram-Bot-Api-Secret-Token: dev" -H "Content-Type: application/json" \\
+         -d @update.json http://127.0.0.1:8080/webhook
+"""
+from aiogram import Bot, Dispatcher
+from aiogram.types import Update
+from aiohttp import web
+from config.settings import CFG
+from typing import List
+from utils.metrics import QUEUE_DEPTH
+import asyncio
+import hmac
+import secrets
+
+SECRET_HEADER = "X-Telegram-Bot-Api-Secret-Token"
+
+
+class WebhookServer:
+    def __init__(self, bot: Bot, dp: Dispatcher):
+        self.bot = bot
+        self.dp = dp
+        self.cfg = CFG
+        # Without a configured secret a random one is registered with setWebhook
+        self.secret = self.cfg.WEBHOOK_SECRET or secrets.token_urlsafe(32)
+        workers = max(1, self.cfg.WEBHOOK_WORKERS)
+        shard_size = max(1, self.cfg.WEBHOOK_QUEUE_SIZE // workers)
+        self._shards: List[asyncio.Queue] = [asyncio.Queue(maxsize=shard_size) for _ in range(workers)]
+        self._accepting = False
+        QUEUE_DEPTH.labels("webhook").set_function(lambda: sum(q.qsize() for q in self._shards))
+
+    def _shard(self, update: Update) -> asyncio.Queue:
+        event = update.message or update.callback_query
+        user = getattr(event, "from_user", None)
+        key = user.id if user is not None else update.update_id
+        return self._shards[key % len(self._shards)]
+
+    async def _handle(self, request: web.Request) -> web.Response:
+        if not hmac.compare_digest(request.headers.get(SECRET_HEADER, ""), self.secret):
+            return web.Response(status=401)
+        if not self._accepting:
+            return web.Response(status=503)  # draining: Telegram keeps the update and retries
+        try:
+            update = Update.model_validate(await request.json(), context={"bot": self.bot})
+        except Exception as e:
+            print(f"[webhook] bad update: {e}")
+            return web.Response(status=400)
+        try:
+            self._shard(update).put_nowait(update)
+        except asyncio.QueueFull:
+            return web.Response(status=503)
+        return web.Response()
+
+    async def _worker(self, shard: asyncio.Queue):
+        while True:
+            update = await shard.get()
+            try:
+                await self.dp.feed_update(self.bot, update)
+            except Exception as e:
+                print(f"[webhook] update {update.update_id} failed: {e}")
+            finally:
+                shard.task_done()
+
+    async def serve(self, stop: asyncio.Event, allowed_updates: List[str]):
+        """Serve until stop is set, then stop accepting and drain queued updates (WEBHOOK_DRAIN_SEC)."""
+        app = web.Application()
+        app.router.add_post(self.cfg.WEBHOOK_PATH, self._handle)
+        runner = web.AppRunner(app, access_log=None)
+        await runner.setup()
+        site = web.TCPSite(runner, self.cfg.WEBHOOK_HOST, self.cfg.WEBHOOK_PORT)
+        await site.start()
+        workers = [asyncio.create_task(self._worker(shard)) for shard in self._shards]
+        self._accepting = True
+        try:
+            await self.dp.emit_startup(bot=self.bot)
+            if self.cfg.WEBHOOK_URL:
+                await self.bot.set_webhook(
+                    url=self.cfg.WEBHOOK_URL.rstrip("/") + self.cfg.WEBHOOK_PATH,
+                    secret_token=self.secret,
+                    allowed_updates=allowed_updates,
+                )
+            print(f"[webhook] listening on {self.cfg.WEBHOOK_HOST}:{self.cfg.WEBHOOK_PORT}{self.cfg.WEBHOOK_PATH}")
+            await stop.wait()
+        finally:
+            self._accepting = False
+            await site.stop()
+            pending = asyncio.gather(*(shard.join() for shard in self._shards))
+            try:
+                await asyncio.wait_for(pending, self.cfg.WEBHOOK_DRAIN_SEC)
+            except asyncio.TimeoutError:
+                left = sum(shard.qsize() for shard in self._shards)
+                print(f"[webhook] drain timed out, {left} acknowledged updates dropped")
+            for task in workers:
+                task.cancel()
+            await asyncio.gather(*workers, return_exceptions=True)
+            await runner.cleanup()
+            await self.dp.emit_shutdown(bot=self.bot)
+            await self.bot.session.close()
@@ -1,60 +1,151 @@
-from __future__ import annotations
-import os
-from datetime import datetime, timezone
-from pathlib import Path
-from pydantic_settings import BaseSettings, SettingsConfigDict
-from sqlalchemy import Column, DateTime
-from sqlmodel import Field
-
-class Settings(BaseSettings):
-    model_config = SettingsConfigDict(env_file=".env", env_prefix="TG_", extra="ignore")
-
-    BOT_TOKEN: str
-    ADMIN_IDS: str | None = None
-
-    API_ID: int
-    API_HASH: str
-    PHONE_NUMBER: str | None = None
-    SESSION_NAME: str = "default"
-
-    COMMISSION_RATE: float = 0.10
-    MAX_STARS_PER_ACCOUNT: int = 2000
-
-    DATA_DIR: str = "./data"
-    DB_PATH: str = "./data/app.db"
-    DB_DSN: str | None = None
-    SESSIONS_DIR: str = "./data/sessions"
-    TDATA_DIR: str = "./data/tdata"
-    PROXIES_FILE: str = "./data/proxies.json"
-    BLACKLIST_FILE: str = "./data/blacklist.json"
-
-    SCAN_INTERVAL_SEC: float = 5.0
-    BATCH_PURCHASE_SLEEP_MS: int = 400
-
-    STARS_CURRENCY: str = "XTR"
-
-    PURCHASE_MODE: str = "limited"
-
-    NOTIFY_ADMINS: bool = True
-
-    # Login
-    LOGIN_METHOD: str = "code"
-    FORCE_SMS: bool = False
-
-
-def ensure_dirs(cfg: Settings):
-    Path(cfg.DATA_DIR).mkdir(parents=True, exist_ok=True)
-    Path(cfg.SESSIONS_DIR).mkdir(parents=True, exist_ok=True)
-    Path(cfg.TDATA_DIR).mkdir(parents=True, exist_ok=True)
-    if not Path(cfg.PROXIES_FILE).exists():
-        Path(cfg.PROXIES_FILE).write_text("{}", encoding="utf-8")
-    if not Path(cfg.BLACKLIST_FILE).exists():
-        Path(cfg.BLACKLIST_FILE).write_text("[]", encoding="utf-8")
-
-
-CFG = Settings()  # Load .env
-ensure_dirs(CFG)
-
-ADMIN_IDS: set[int] = set()
-if CFG.ADMIN_IDS:
-    ADMIN_IDS = {int(x.strip()) for x in CFG.ADMIN_IDS.split(",") if x.strip().isdigit()}
\ No newline at end of file
+from __future__ import annotations
+from functools import lru_cache
+from pathlib import Path
+from pydantic_settings import BaseSettings, SettingsConfigDict
+
+class Settings(BaseSettings):
+    model_config = SettingsConfigDict(env_file=".env", env_prefix="TG_", extra="ignore")
+
+    BOT_TOKEN: str
+    ADMIN_IDS: str | None = None
+
+    API_ID: int
+    API_HASH: str
+    PHONE_NUMBER: str | None = None
+    SESSION_NAME: str = "default"
+
+    COMMISSION_RATE: float = 0.10
+    MAX_STARS_PER_ACCOUNT: int = 2000
+
+    DATA_DIR: str = "./data"
+    DB_PATH: str = "./data/app.db"
+    DB_DSN: str | None = None
+    SQLITE_WAL: bool = True  # journal_mode=WAL: readers and the ledger writer don't block each other
+    SQLITE_SYNCHRONOUS: str = "FULL"  # FULL: a resolved ledger future survives power loss; NORMAL: only crashes
+    SQLITE_BUSY_TIMEOUT_MS: int = 5000  # wait for another process' write lock instead of failing
+    SESSIONS_DIR: str = "./data/sessions"
+    TDATA_DIR: str = "./data/tdata"
+    PROXIES_FILE: str = "./data/proxies.json"
+    BLACKLIST_FILE: str = "./data/blacklist.json"
+
+    SCAN_INTERVAL_SEC: float = 5.0  # fixed scan interval without SCAN_ADAPTIVE; retry delay after errors
+    SCAN_ADAPTIVE: bool = True  # scan fast while the catalog moves, back off while it is quiet
+    SCAN_INTERVAL_MIN_SEC: float = 0.5  # right after a change; keep above the scanner's flood limit
+    SCAN_INTERVAL_MAX_SEC: float = 30.0  # ceiling after a long quiet period
+    SCAN_BACKOFF_FACTOR: float = 1.5  # interval growth per unchanged scan
+    SCANNER_COUNT: int = 3  # accounts polling the catalog at staggered offsets: effective interval / K
+    SCANNER_TIMEOUT_SEC: float = 10.0  # a scan taking longer benches its scanner
+    SCANNER_COOLDOWN_SEC: float = 60.0  # bench time after a timeout or failed fetch (flood waits use their own)
+    SESSIONS_POLL_SEC: float = 5.0  # how often SESSIONS_DIR is checked for added/removed .session files
+    BATCH_PURCHASE_SLEEP_MS: int = 400  # per-account pause between its own purchase RPCs
+    # Allocation objective per unit: price^ALLOCATION_PRICE_EXP / remaining^ALLOCATION_RARITY_EXP
+    ALLOCATION_PRICE_EXP: float = 1.0  # 0 = count units, 1 = stars value
+    ALLOCATION_RARITY_EXP: float = 1.0  # 0 = ignore scarcity; higher favours rare gifts more
+    MAX_INFLIGHT_RPCS: int = 16  # cap on concurrent purchase RPCs across all accounts
+    DELIVERY_RETRY_SEC: float = 30.0  # delay before a failed delivery is queued again
+    # Ledger writer: all balance/purchase/delivery writes go through one task in group commits
+    LEDGER_BATCH_MS: float = 5.0  # a group waits at most this long for more commands; 0 = commit what is queued
+    LEDGER_BATCH_MAX: int = 200  # commands per transaction
+
+    # Telethon client pool
+    CLIENT_CONNECT_CONCURRENCY: int = 8  # parallel connects during warm-up / health checks
+    CLIENT_PING_INTERVAL_SEC: float = 60.0  # clients idle longer than this get pinged
+    CLIENT_PING_TIMEOUT_SEC: float = 10.0
+    CLIENT_IDLE_EVICT_SEC: float = 0  # disconnect clients unused for this long; 0 = never
+
+    # Sniping: buy through payment forms fetched ahead of time
+    SNIPE_MODE: bool = False  # one pre-fetched sendStarsForm per buy instead of getPaymentForm + send
+    SNIPE_FORM_GIFTS: int = 5  # forms are kept for this many top-priority gifts per account
+    SNIPE_FORM_TTL_SEC: float = 600.0  # a fetched form is treated as expired after this long
+    SNIPE_FORM_REFRESH_SEC: float = 30.0  # refresh sweep; forms expiring within this are re-fetched
+    SNIPE_PREFETCH_CONCURRENCY: int = 4  # parallel getPaymentForm calls while warming forms
+
+    STARS_CURRENCY: str = "XTR"
+
+    PURCHASE_MODE: str = "limited"
+
+    NOTIFY_ADMINS: bool = True
+    NOTIFY_COALESCE_SEC: float = 10.0  # market changes within this window go out as one broadcast
+    NOTIFY_REMAINING_DROP_RATIO: float = 0.1  # report a remaining drop of at least this share
+    NOTIFY_MAX_ATTEMPTS: int = 3  # Bot API attempts per message when flood-limited (retry_after)
+
+    # Stock history: changes only, raw rows downsampled with age, recent samples kept in memory
+    STOCK_HISTORY_RING_SIZE: int = 512  # in-memory samples per gift in the current catalog
+    STOCK_HISTORY_RAW_SEC: int = 86400  # rows older than this keep one sample per bucket
+    STOCK_HISTORY_BUCKET_SEC: int = 300
+    STOCK_HISTORY_RETENTION_DAYS: int = 90  # 0 = keep downsampled rows forever
+    STOCK_HISTORY_MAINTAIN_SEC: float = 3600.0
+    STOCK_RATE_WINDOW_SEC: int = 600  # window for sell rate / sell-out ETA in the admin panel
+
+    ADMIN_PANEL_CACHE_SEC: float = 5.0  # rendered /admin views are shared for this long
+    ADMIN_PANEL_PAGE_SIZE: int = 20
+
+    BOT_MODE: str = "polling"  # polling | webhook
+    WEBHOOK_URL: str | None = None  # public base URL for setWebhook; unset = serve only (local testing)
+    WEBHOOK_PATH: str = "/webhook"
+    WEBHOOK_HOST: str = "0.0.0.0"
+    WEBHOOK_PORT: int = 8080
+    WEBHOOK_SECRET: str | None = None  # X-Telegram-Bot-Api-Secret-Token; random per start when unset
+    WEBHOOK_WORKERS: int = 16  # concurrent update handlers
+    WEBHOOK_QUEUE_SIZE: int = 1024  # acknowledged, unhandled updates before new ones get 503
+    WEBHOOK_DRAIN_SEC: float = 10.0  # on shutdown, time to finish already acknowledged updates
+
+    METRICS_ENABLED: bool = False  # collect stage timings and serve them on /metrics
+    METRICS_HOST: str = "127.0.0.1"
+    METRICS_PORT: int = 9108
+
+    # Scale-out: all = everything in one process; coordinator = bot + scanning; worker = buying and
+    # delivery on the accounts it leases (run any number against the same database)
+    ROLE: str = "all"
+    WORKER_ID: str | None = None  # lease owner name; defaults to host:pid
+    LEASE_TTL_SEC: float = 30.0  # a lease not renewed for this long is free to claim
+    LEASE_HEARTBEAT_SEC: float = 10.0  # renewal and rebalancing period; keep well below LEASE_TTL_SEC
+    WORKER_CATALOG_POLL_SEC: float = 0.25  # how often a worker checks the coordinator's catalog snapshot
+
+    # Login
+    LOGIN_METHOD: str = "code"
+    FORCE_SMS: bool = False
+
+
+def ensure_dirs(cfg: Settings):
+    Path(cfg.DATA_DIR).mkdir(parents=True, exist_ok=True)
+    Path(cfg.SESSIONS_DIR).mkdir(parents=True, exist_ok=True)
+    Path(cfg.TDATA_DIR).mkdir(parents=True, exist_ok=True)
+    if not Path(cfg.PROXIES_FILE).exists():
+        Path(cfg.PROXIES_FILE).write_text("{}", encoding="utf-8")
+    if not Path(cfg.BLACKLIST_FILE).exists():
+        Path(cfg.BLACKLIST_FILE).write_text("[]", encoding="utf-8")
+
+
+class _LazySettings:
+    """
+    CFG: the Settings instance is built (.env read) on first attribute access, not on import.
+    Startup calls ensure_dirs(CFG) explicitly once it actually runs.
+    """
+    __slots__ = ("_settings",)
+
+    def __init__(self):
+        object.__setattr__(self, "_settings", None)
+
+    def _load(self) -> Settings:
+        settings = object.__getattribute__(self, "_settings")
+        if settings is None:
+            settings = Settings()
+            object.__setattr__(self, "_settings", settings)
+        return settings
+
+    def __getattr__(self, name):
+        return getattr(self._load(), name)
+
+    def __setattr__(self, name, value):
+        setattr(self._load(), name, value)
+
+
+CFG: Settings = _LazySettings()  # type: ignore[assignment]
+
+
+@lru_cache(maxsize=None)
+def admin_ids() -> frozenset[int]:
+    if not CFG.ADMIN_IDS:
+        return frozenset()
+    return frozenset(int(x.strip()) for x in CFG.ADMIN_IDS.split(",") if x.strip().isdigit())
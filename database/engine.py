@@ -1,8 +1,53 @@
-from sqlmodel import create_engine, SQLModel
-from config.settings import CFG
-
-if CFG.DB_DSN:
-    engine = create_engine(CFG.DB_DSN, echo=False)
-else:
-    engine = create_engine(f"sqlite:///{CFG.DB_PATH}", echo=False)
-SQLModel.metadata.create_all(engine)
\ No newline at end of file
+from sqlmodel.ext.asyncio.session import AsyncSession
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncEngine, create_async_engine, async_sessionmaker
+from config.settings import CFG
+from typing import Optional
+
+# Built on first use: importing this module opens nothing and creates no tables
+# (the schema is checked by database.schema.init_db at startup)
+_async_engine: Optional[AsyncEngine] = None
+_session_factory: Optional[async_sessionmaker] = None
+
+
+def _async_url(url: str) -> str:
+    # Map a sync DSN onto its async driver: asyncpg for Postgres, aiosqlite for SQLite
+    scheme, sep, rest = url.partition("://")
+    base = scheme.split("+", 1)[0]
+    if base in ("postgresql", "postgres"):
+        return f"postgresql+asyncpg{sep}{rest}"
+    if base == "sqlite":
+        return f"sqlite+aiosqlite{sep}{rest}"
+    return url
+
+
+def db_url() -> str:
+    return CFG.DB_DSN or f"sqlite:///{CFG.DB_PATH}"
+
+
+def _sqlite_pragmas(dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    if CFG.SQLITE_WAL:
+        cursor.execute("PRAGMA journal_mode=WAL")
+    cursor.execute(f"PRAGMA synchronous={CFG.SQLITE_SYNCHRONOUS}")
+    cursor.execute(f"PRAGMA busy_timeout={int(CFG.SQLITE_BUSY_TIMEOUT_MS)}")
+    cursor.execute("PRAGMA temp_store=MEMORY")
+    cursor.execute("PRAGMA cache_size=-16000")  # KiB
+    cursor.close()
+
+
+def get_async_engine() -> AsyncEngine:
+    global _async_engine, _session_factory
+    if _async_engine is None:
+        _async_engine = create_async_engine(_async_url(db_url()), echo=False)
+        if _async_engine.dialect.name == "sqlite":
+            event.listen(_async_engine.sync_engine, "connect", _sqlite_pragmas)
+        # expire_on_commit=False: objects stay readable after commit without a lazy (blocking) refresh
+        _session_factory = async_sessionmaker(_async_engine, class_=AsyncSession, expire_on_commit=False)
+    return _async_engine
+
+
+def async_session() -> AsyncSession:
+    if _session_factory is None:
+        get_async_engine()
+    return _session_factory()
@@ -1,38 +1,115 @@
-from sqlmodel import select, Session
-from sqlalchemy.exc import IntegrityError
-from models.account import Account
-from database.repositories.base_repo import BaseRepository
-
-class AccountRepository(BaseRepository):
-    def get_or_create_account(self, session_name: str) -> Account:
-        account = self.session.exec(select(Account).where(Account.session_name == session_name)).first()
-        if account:
-            return account
-
-        account = Account(session_name=session_name)
-        self.session.add(account)
-        try:
-            self.session.commit()
-        except IntegrityError:
-            self.session.rollback()
-            account = self.session.exec(select(Account).where(Account.session_name == session_name)).first()
-        return account
-
-    def get_all_non_blacklisted(self):
-        return self.session.exec(select(Account).where(Account.blacklisted == False)).all()
-
-    def get_by_id(self, acc_id: int) -> Account | None:
-        return self.session.get(Account, acc_id)
-
-    def update(self, account: Account):
-        self.session.add(account)
-        self.session.commit()
-
-    def blacklist(self, acc: Account, reason: str):
-        acc.blacklisted = True
-        acc.last_error = reason
-        self.session.add(acc)
-        self.session.commit()
-
-    def get_all(self):
-        return self.session.exec(select(Account)).all()
\ No newline at end of file
+from datetime import datetime, timezone
+from sqlmodel import select, update
+from sqlalchemy import case, func, or_
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.exc import IntegrityError
+from models.account import Account, SESSION_REMOVED
+from database.repositories.base_repo import BaseRepository
+
+class AccountRepository(BaseRepository):
+    async def get_or_create_account(self, session_name: str) -> Account:
+        account = (await self.session.exec(select(Account).where(Account.session_name == session_name))).first()
+        if account:
+            return account
+
+        account = Account(session_name=session_name)
+        self.session.add(account)
+        try:
+            await self.session.commit()
+        except IntegrityError:
+            await self.session.rollback()
+            account = (await self.session.exec(select(Account).where(Account.session_name == session_name))).first()
+        return account
+
+    async def bulk_upsert(self, rows: list[dict], chunk_size: int = 500):
+        """
+        Insert accounts keyed by session_name with INSERT ... ON CONFLICT DO UPDATE, one statement
+        per chunk and a single commit. Existing rows keep their proxy/last_error and can only
+        become blacklisted, never un-blacklisted, except an account whose session file had been
+        removed (mark_removed): it gets the new row's state back.
+        """
+        if not rows:
+            return
+        insert = pg_insert if self.session.bind.dialect.name == "postgresql" else sqlite_insert
+        now = datetime.now(timezone.utc)
+        for i in range(0, len(rows), chunk_size):
+            stmt = insert(Account).values([
+                {"stars_wallet": 0, "created_at": now, **row} for row in rows[i:i + chunk_size]
+            ])
+            removed = Account.last_error == SESSION_REMOVED
+            stmt = stmt.on_conflict_do_update(
+                index_elements=[Account.session_name],
+                set_={
+                    "proxy": func.coalesce(Account.proxy, stmt.excluded.proxy),
+                    "blacklisted": case((removed, stmt.excluded.blacklisted),
+                                        else_=or_(Account.blacklisted, stmt.excluded.blacklisted)),
+                    "last_error": case((removed, stmt.excluded.last_error),
+                                       else_=func.coalesce(Account.last_error, stmt.excluded.last_error)),
+                },
+            )
+            await self.session.exec(stmt)
+        await self.session.commit()
+
+    async def mark_removed(self, names, commit: bool = True) -> list[int]:
+        """Blacklist usable accounts whose session file is gone (last_error SESSION_REMOVED); returns their ids."""
+        if not names:
+            return []
+        rows = await self.session.exec(
+            update(Account).where(Account.session_name.in_(names), Account.blacklisted == False)
+            .values(blacklisted=True, last_error=SESSION_REMOVED)
+            .returning(Account.id)
+        )
+        ids = list(rows.scalars())
+        if commit:
+            await self.session.commit()
+        return ids
+
+    async def get_by_session_names(self, names):
+        return (await self.session.exec(select(Account).where(Account.session_name.in_(names)))).all()
+
+    async def get_all_non_blacklisted(self):
+        return (await self.session.exec(select(Account).where(Account.blacklisted == False))).all()
+
+    async def get_by_id(self, acc_id: int) -> Account | None:
+        return await self.session.get(Account, acc_id)
+
+    async def update(self, account: Account):
+        self.session.add(account)
+        await self.session.commit()
+
+    async def add_to_wallet(self, acc_id: int, amount: int, commit: bool = True):
+        await self.session.exec(
+            update(Account).where(Account.id == acc_id).values(stars_wallet=Account.stars_wallet + amount)
+        )
+        if commit:
+            await self.session.commit()
+
+    async def blacklist(self, acc: Account, reason: str):
+        acc.blacklisted = True
+        acc.last_error = reason
+        self.session.add(acc)
+        await self.session.commit()
+
+    async def get_all(self):
+        return (await self.session.exec(select(Account))).all()
+
+    async def stats(self) -> dict:
+        total, blacklisted, wallet_total = (await self.session.exec(select(
+            func.count(Account.id),
+            func.coalesce(func.sum(case((Account.blacklisted == True, 1), else_=0)), 0),
+            func.coalesce(func.sum(Account.stars_wallet), 0),
+        ))).one()
+        return {"total": total, "blacklisted": blacklisted, "wallet_total": wallet_total}
+
+    async def page(self, after_id: int | None = None, before_id: int | None = None, limit: int = 20):
+        """Keyset page ordered by id: limit + 1 rows after after_id (or before before_id), ascending."""
+        q = select(Account)
+        if before_id is not None:
+            q = q.where(Account.id < before_id).order_by(Account.id.desc())
+        else:
+            if after_id is not None:
+                q = q.where(Account.id > after_id)
+            q = q.order_by(Account.id.asc())
+        rows = list((await self.session.exec(q.limit(limit + 1))).all())
+        return rows[::-1] if before_id is not None else rows
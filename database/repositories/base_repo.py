@@ -1,3 +1,5 @@
-class BaseRepository:
-    def __init__(self, session):
-        self.session = session
\ No newline at end of file
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+class BaseRepository:
+    def __init__(self, session: AsyncSession):
+        self.session = session
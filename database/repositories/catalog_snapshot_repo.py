@@ -0,0 +1,25 @@
+from datetime import datetime, timezone
+from sqlmodel import select, update
+from models.catalog_snapshot import CatalogSnapshot
+from database.repositories.base_repo import BaseRepository
+
+SNAPSHOT_ID = 1
+
+class CatalogSnapshotRepository(BaseRepository):
+    async def publish(self, gifts_json: str):
+        """Replace the snapshot and bump its version (one UPDATE; the row is created on first publish)."""
+        now = datetime.now(timezone.utc)
+        result = await self.session.exec(
+            update(CatalogSnapshot).where(CatalogSnapshot.id == SNAPSHOT_ID).values(
+                version=CatalogSnapshot.version + 1, gifts=gifts_json, updated_at=now)
+        )
+        if result.rowcount == 0:
+            self.session.add(CatalogSnapshot(id=SNAPSHOT_ID, version=1, gifts=gifts_json, updated_at=now))
+        await self.session.commit()
+
+    async def version(self) -> int | None:
+        return (await self.session.exec(
+            select(CatalogSnapshot.version).where(CatalogSnapshot.id == SNAPSHOT_ID))).first()
+
+    async def get(self) -> CatalogSnapshot | None:
+        return await self.session.get(CatalogSnapshot, SNAPSHOT_ID)
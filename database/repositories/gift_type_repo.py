@@ -1,33 +1,105 @@
-from sqlmodel import select, Session
-from models.gift_type import GiftType
-from database.repositories.base_repo import BaseRepository
-
-class GiftTypeRepository(BaseRepository):
-    def get_by_code(self, code: str) -> GiftType | None:
-        return self.session.exec(select(GiftType).where(GiftType.code == code)).first()
-
-    def create_or_update(self, code: str, title: str, price_stars: int, remaining_global: int) -> GiftType:
-        gt = self.get_by_code(code)
-        if not gt:
-            gt = GiftType(
-                code=code,
-                title=title,
-                price_stars=price_stars,
-                remaining_global=remaining_global,
-            )
-            self.session.add(gt)
-        else:
-            gt.price_stars = price_stars
-            gt.remaining_global = remaining_global
-            gt.title = title
-            self.session.add(gt)
-        self.session.commit()
-        return gt
-
-    def get_all(self):
-        return self.session.exec(select(GiftType)).all()
-
-    def decrement_remaining(self, gt: GiftType):
-        gt.remaining_global = max(0, gt.remaining_global - 1)
-        self.session.add(gt)
-        self.session.commit()
\ No newline at end of file
+from datetime import datetime, timezone
+from sqlmodel import select, update
+from sqlalchemy import case, func, or_, tuple_
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from models.gift_type import GiftType
+from database.repositories.base_repo import BaseRepository
+
+class GiftTypeRepository(BaseRepository):
+    async def get_by_code(self, code: str) -> GiftType | None:
+        return (await self.session.exec(select(GiftType).where(GiftType.code == code))).first()
+
+    async def create_or_update(self, code: str, title: str, price_stars: int, remaining_global: int) -> GiftType:
+        gt = await self.get_by_code(code)
+        if not gt:
+            gt = GiftType(
+                code=code,
+                title=title,
+                price_stars=price_stars,
+                remaining_global=remaining_global,
+            )
+            self.session.add(gt)
+        else:
+            gt.price_stars = price_stars
+            gt.remaining_global = remaining_global
+            gt.title = title
+            self.session.add(gt)
+        await self.session.commit()
+        return gt
+
+    async def upsert_many(self, rows: list[dict], commit: bool = True) -> dict[str, int]:
+        """
+        rows: {code, title, price_stars, remaining_global}. One INSERT ... ON CONFLICT DO UPDATE
+        for the whole catalog; an existing row is rewritten (and its updated_at bumped) only if
+        its title, price or stock differs. Returns code -> id of the inserted or rewritten rows.
+        """
+        if not rows:
+            return {}
+        insert = pg_insert if self.session.bind.dialect.name == "postgresql" else sqlite_insert
+        now = datetime.now(timezone.utc)
+        stmt = insert(GiftType).values([{**row, "updated_at": now} for row in rows])
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[GiftType.code],
+            set_={
+                "title": stmt.excluded.title,
+                "price_stars": stmt.excluded.price_stars,
+                "remaining_global": stmt.excluded.remaining_global,
+                "updated_at": stmt.excluded.updated_at,
+            },
+            where=or_(
+                GiftType.title != stmt.excluded.title,
+                GiftType.price_stars != stmt.excluded.price_stars,
+                GiftType.remaining_global != stmt.excluded.remaining_global,
+            ),
+        ).returning(GiftType.code, GiftType.id)
+        written = dict((await self.session.exec(stmt)).all())
+        if commit:
+            await self.session.commit()
+        return written
+
+    async def get_refs_by_codes(self, codes) -> list[tuple[str, int, int, int]]:
+        """(code, id, price_stars, remaining_global) of the given codes."""
+        return (await self.session.exec(
+            select(GiftType.code, GiftType.id, GiftType.price_stars, GiftType.remaining_global)
+            .where(GiftType.code.in_(codes))
+        )).all()
+
+    async def get_all(self):
+        return (await self.session.exec(select(GiftType))).all()
+
+    async def count(self) -> int:
+        return (await self.session.exec(select(func.count(GiftType.id)))).one()
+
+    async def page(self, after: tuple | None = None, before: tuple | None = None, limit: int = 20):
+        """
+        Keyset page in purchase priority order (remaining_global, -price_stars, id); cursors are
+        (remaining_global, price_stars, id) of a boundary row. Returns up to limit + 1 rows, ascending.
+        """
+        key = tuple_(GiftType.remaining_global, -GiftType.price_stars, GiftType.id)
+        q = select(GiftType)
+        if before is not None:
+            r, p, i = before
+            q = q.where(key < tuple_(r, -p, i)).order_by(
+                GiftType.remaining_global.desc(), GiftType.price_stars.asc(), GiftType.id.desc())
+        else:
+            if after is not None:
+                r, p, i = after
+                q = q.where(key > tuple_(r, -p, i))
+            q = q.order_by(GiftType.remaining_global.asc(), GiftType.price_stars.desc(), GiftType.id.asc())
+        rows = list((await self.session.exec(q.limit(limit + 1))).all())
+        return rows[::-1] if before is not None else rows
+
+    async def decrement_remaining(self, gt: GiftType):
+        gt.remaining_global = max(0, gt.remaining_global - 1)
+        self.session.add(gt)
+        await self.session.commit()
+
+    async def decrement_remaining_by_id(self, gift_type_id: int, commit: bool = True):
+        await self.session.exec(
+            update(GiftType).where(GiftType.id == gift_type_id).values(
+                remaining_global=case((GiftType.remaining_global > 0, GiftType.remaining_global - 1), else_=0)
+            )
+        )
+        if commit:
+            await self.session.commit()
@@ -0,0 +1,46 @@
+from sqlmodel import select, delete, update
+from sqlalchemy import or_
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from models.lease import Lease
+from database.repositories.base_repo import BaseRepository
+
+class LeaseRepository(BaseRepository):
+    async def acquire(self, keys: list[str], owner: str, ttl: float, now: float) -> set[str]:
+        """
+        Claim keys that are free, expired or already ours in one INSERT ... ON CONFLICT DO UPDATE;
+        a live lease of another owner is left alone. Returns the keys owner holds afterwards.
+        """
+        if not keys:
+            return set()
+        insert = pg_insert if self.session.bind.dialect.name == "postgresql" else sqlite_insert
+        stmt = insert(Lease).values([{"key": k, "owner": owner, "expires_at": now + ttl} for k in keys])
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[Lease.key],
+            set_={"owner": stmt.excluded.owner, "expires_at": stmt.excluded.expires_at},
+            where=or_(Lease.expires_at <= now, Lease.owner == owner),
+        )
+        await self.session.exec(stmt)
+        await self.session.commit()
+        held = await self.session.exec(select(Lease.key).where(Lease.key.in_(keys), Lease.owner == owner))
+        return set(held.all())
+
+    async def renew(self, owner: str, ttl: float, now: float):
+        await self.session.exec(update(Lease).where(Lease.owner == owner).values(expires_at=now + ttl))
+        await self.session.commit()
+
+    async def live(self, prefix: str, now: float) -> dict[str, str]:
+        """key -> owner of unexpired leases whose key starts with prefix."""
+        rows = await self.session.exec(
+            select(Lease.key, Lease.owner).where(Lease.key.startswith(prefix), Lease.expires_at > now)
+        )
+        return dict(rows.all())
+
+    async def release(self, owner: str, keys: list[str] | None = None):
+        stmt = delete(Lease).where(Lease.owner == owner)
+        if keys is not None:
+            if not keys:
+                return
+            stmt = stmt.where(Lease.key.in_(keys))
+        await self.session.exec(stmt)
+        await self.session.commit()
@@ -1,29 +1,61 @@
-from sqlmodel import select, Session
-from models.purchase import Purchase
-from database.repositories.base_repo import BaseRepository
-import json
-
-class PurchaseRepository(BaseRepository):
-    def create_purchase(self, gift_type_id: int, account_id: int, price_stars: int, owner_user_id: int, meta: dict) -> Purchase:
-        p = Purchase(
-            gift_type_id=gift_type_id,
-            account_id=account_id,
-            price_stars=price_stars,
-            status="purchased",
-            owner_user_id=owner_user_id,
-            ext_payload=json.dumps(meta, ensure_ascii=False)
-        )
-        self.session.add(p)
-        self.session.commit()
-        return p
-
-    def get_pending(self):
-        return self.session.exec(select(Purchase).where(Purchase.status == "purchased")).all()
-
-    def mark_delivered(self, purchase: Purchase):
-        purchase.status = "delivered"
-        self.session.add(purchase)
-        self.session.commit()
-
-    def get_all_pending(self):
-        return self.get_pending()
\ No newline at end of file
+from sqlmodel import select, update
+from sqlalchemy import func
+from models.purchase import Purchase
+from models.user import User
+from models.account import Account
+from database.repositories.base_repo import BaseRepository
+import json
+
+class PurchaseRepository(BaseRepository):
+    async def create_purchase(self, gift_type_id: int, account_id: int, price_stars: int, owner_user_id: int, meta: dict,
+                              commit: bool = True) -> Purchase:
+        p = Purchase(
+            gift_type_id=gift_type_id,
+            account_id=account_id,
+            price_stars=price_stars,
+            status="purchased",
+            owner_user_id=owner_user_id,
+            ext_payload=json.dumps(meta, ensure_ascii=False)
+        )
+        self.session.add(p)
+        if commit:
+            await self.session.commit()
+        return p
+
+    async def get_pending(self):
+        return (await self.session.exec(select(Purchase).where(Purchase.status == "purchased"))).all()
+
+    async def get_pending_with_parties(self, ids: list[int] | None = None, account_ids=None):
+        """Pending purchases joined with their owner and account in one query: [(purchase, user, account)]."""
+        q = (
+            select(Purchase, User, Account)
+            .join(User, User.id == Purchase.owner_user_id)
+            .join(Account, Account.id == Purchase.account_id)
+            .where(Purchase.status == "purchased")
+        )
+        if ids is not None:
+            q = q.where(Purchase.id.in_(ids))
+        if account_ids is not None:
+            q = q.where(Purchase.account_id.in_(account_ids))
+        return (await self.session.exec(q.order_by(Purchase.id))).all()
+
+    async def stats_by_status(self) -> dict[str, tuple[int, int]]:
+        """{status: (count, total price_stars)}"""
+        rows = (await self.session.exec(
+            select(Purchase.status, func.count(Purchase.id), func.coalesce(func.sum(Purchase.price_stars), 0))
+            .group_by(Purchase.status)
+        )).all()
+        return {status: (cnt, total) for status, cnt, total in rows}
+
+    async def mark_delivered(self, purchase: Purchase):
+        purchase.status = "delivered"
+        self.session.add(purchase)
+        await self.session.commit()
+
+    async def mark_delivered_by_id(self, purchase_id: int, commit: bool = True):
+        await self.session.exec(update(Purchase).where(Purchase.id == purchase_id).values(status="delivered"))
+        if commit:
+            await self.session.commit()
+
+    async def get_all_pending(self):
+        return await self.get_pending()
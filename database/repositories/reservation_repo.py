@@ -0,0 +1,58 @@
+import json
+from sqlmodel import select, delete, update
+from models.lease import Lease
+from models.reservation import Reservation
+from database.repositories.base_repo import BaseRepository
+
+class ReservationRepository(BaseRepository):
+    async def add(self, owner: str, units: list[tuple[int, int]], commit: bool = True) -> list[int]:
+        """One Reservation per (user id, amount) unit; returns their ids in the same order."""
+        rows = [Reservation(owner=owner, user_id=user_id, amount=amount) for user_id, amount in units]
+        if not rows:
+            return []
+        self.session.add_all(rows)
+        await self.session.flush()
+        ids = [r.id for r in rows]
+        if commit:
+            await self.session.commit()
+        return ids
+
+    async def park(self, reservation_id: int, account_id: int, gift_code: str, meta: dict, commit: bool = True) -> bool:
+        """Mark a reservation as paid for (purchase not booked yet); False if it no longer exists."""
+        result = await self.session.exec(
+            update(Reservation).where(Reservation.id == reservation_id)
+            .values(account_id=account_id, gift_code=gift_code, meta=json.dumps(meta, ensure_ascii=False))
+        )
+        if commit:
+            await self.session.commit()
+        return result.rowcount == 1
+
+    async def take(self, ids: list[int], commit: bool = True) -> list:
+        """Delete reservations by id; the rows that still existed."""
+        if not ids:
+            return []
+        return await self._take(delete(Reservation).where(Reservation.id.in_(ids)), commit)
+
+    async def take_by_owner(self, owner: str, commit: bool = True) -> list:
+        return await self._take(delete(Reservation).where(Reservation.owner == owner), commit)
+
+    async def take_orphaned(self, owner: str, live_prefix: str | None, now: float,
+                            commit: bool = True) -> list:
+        """
+        Delete the reservations of other owners: all of them with live_prefix None, otherwise
+        those whose owner holds no unexpired lease <live_prefix><owner>.
+        """
+        stmt = delete(Reservation).where(Reservation.owner != owner)
+        if live_prefix is not None:
+            live = select(Lease.owner).where(Lease.key.startswith(live_prefix), Lease.expires_at > now)
+            stmt = stmt.where(Reservation.owner.not_in(live))
+        return await self._take(stmt, commit)
+
+    async def _take(self, stmt, commit: bool) -> list:
+        # DELETE ... RETURNING: two processes reclaiming the same rows can't both credit them
+        rows = (await self.session.exec(stmt.returning(
+            Reservation.user_id, Reservation.amount, Reservation.account_id, Reservation.gift_code, Reservation.meta,
+        ))).all()
+        if commit:
+            await self.session.commit()
+        return list(rows)
@@ -0,0 +1,43 @@
+from sqlmodel import select, insert, delete
+from sqlalchemy import func
+from models.gift_type import GiftType
+from models.stock_sample import StockSample
+from database.repositories.base_repo import BaseRepository
+
+class StockHistoryRepository(BaseRepository):
+    async def append(self, rows: list[dict], commit: bool = True):
+        """rows: {gift_type_id, ts, remaining, price_stars}; one multi-row INSERT."""
+        if not rows:
+            return
+        await self.session.exec(insert(StockSample).values(rows))
+        if commit:
+            await self.session.commit()
+
+    async def since(self, ts: int):
+        """(code, ts, remaining, price_stars) newer than ts, oldest first (a range read of ix_stocksample_ts)."""
+        q = (
+            select(GiftType.code, StockSample.ts, StockSample.remaining, StockSample.price_stars)
+            .join(GiftType, GiftType.id == StockSample.gift_type_id)
+            .where(StockSample.ts > ts)
+            .order_by(StockSample.ts, StockSample.id)
+        )
+        return (await self.session.exec(q)).all()
+
+    async def downsample(self, older_than: int, bucket_sec: int) -> int:
+        """Keep only the last sample per gift and bucket_sec bucket among rows older than older_than."""
+        keep = (
+            select(func.max(StockSample.id))
+            .where(StockSample.ts < older_than)
+            # Bucket first: the planner then reads the ts range instead of all of ix_stocksample_gift_ts
+            .group_by(StockSample.ts // bucket_sec, StockSample.gift_type_id)
+        )
+        result = await self.session.exec(
+            delete(StockSample).where(StockSample.ts < older_than, StockSample.id.not_in(keep))
+        )
+        await self.session.commit()
+        return result.rowcount
+
+    async def purge(self, older_than: int) -> int:
+        result = await self.session.exec(delete(StockSample).where(StockSample.ts < older_than))
+        await self.session.commit()
+        return result.rowcount
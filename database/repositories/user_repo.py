@@ -1,27 +1,58 @@
-from sqlmodel import select, Session
-from sqlalchemy.exc import IntegrityError
-from models.user import User
-from database.repositories.base_repo import BaseRepository
-
-class UserRepository(BaseRepository):
-    def get_by_tg_id(self, tg_id: int) -> User | None:
-        return self.session.exec(select(User).where(User.tg_id == tg_id)).first()
-
-    def create_or_update(self, tg_id: int) -> User:
-        user = self.get_by_tg_id(tg_id)
-        if not user:
-            user = User(tg_id=tg_id)
-            self.session.add(user)
-            try:
-                self.session.commit()
-            except IntegrityError:
-                self.session.rollback()
-                user = self.get_by_tg_id(tg_id)
-        return user
-
-    def update(self, user: User):
-        self.session.add(user)
-        self.session.commit()
-
-    def get_all(self):
-        return self.session.exec(select(User)).all()
\ No newline at end of file
+from sqlmodel import select, update
+from sqlalchemy.exc import IntegrityError
+from models.user import User
+from database.repositories.base_repo import BaseRepository
+
+class UserRepository(BaseRepository):
+    async def get_by_tg_id(self, tg_id: int) -> User | None:
+        return (await self.session.exec(select(User).where(User.tg_id == tg_id))).first()
+
+    async def get_by_id(self, user_id: int) -> User | None:
+        return await self.session.get(User, user_id)
+
+    async def create_or_update(self, tg_id: int, commit: bool = True) -> User:
+        user = await self.get_by_tg_id(tg_id)
+        if not user:
+            user = User(tg_id=tg_id)
+            self.session.add(user)
+            if not commit:
+                # Caller's transaction: flush for the id; a concurrent insert fails the whole transaction
+                await self.session.flush()
+                return user
+            try:
+                await self.session.commit()
+            except IntegrityError:
+                await self.session.rollback()
+                user = await self.get_by_tg_id(tg_id)
+        return user
+
+    async def update(self, user: User):
+        self.session.add(user)
+        await self.session.commit()
+
+    async def credit(self, user_id: int, amount: int, contributed: int, commit: bool = True):
+        """Deposit: add amount (net of commission) to the balance and contributed (gross) to the total."""
+        await self.session.exec(
+            update(User).where(User.id == user_id).values(
+                stars_balance=User.stars_balance + amount,
+                total_contributed=User.total_contributed + contributed,
+            )
+        )
+        if commit:
+            await self.session.commit()
+
+    async def debit(self, user_id: int, amount: int, commit: bool = True) -> bool:
+        """
+        Take amount off the balance if it covers it; False leaves the balance untouched.
+        Conditional relative UPDATE: processes planning against the same balance can't overdraw it.
+        """
+        result = await self.session.exec(
+            update(User).where(User.id == user_id, User.stars_balance >= amount)
+            .values(stars_balance=User.stars_balance - amount)
+        )
+        if commit:
+            await self.session.commit()
+        return result.rowcount == 1
+
+    async def get_all(self):
+        return (await self.session.exec(select(User))).all()
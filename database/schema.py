@@ -0,0 +1,63 @@
+"""
+Schema check run once at startup (replaces create_all at import of database.engine).
+
+An empty database gets the current tables and is stamped at the Alembic head. A database
+from before migrations (tables but no alembic_version) is stamped at the baseline revision
+and upgraded. A database behind head is upgraded. One at head costs a single SELECT.
+"""
+from database.engine import get_async_engine
+from pathlib import Path
+import time
+
+MIGRATIONS_DIR = Path(__file__).resolve().parent.parent / "migrations"
+# The schema create_all produced before migrations existed
+BASELINE_REVISION = "0001"
+
+
+def load_models():
+    """Import every table module so SQLModel.metadata is complete."""
+    from models import (  # noqa: F401
+        account, catalog_snapshot, deposit, gift_type, lease, purchase, reservation, stock_sample, user,
+    )
+
+
+def _alembic_config(connection):
+    from alembic.config import Config
+    cfg = Config(str(MIGRATIONS_DIR / "alembic.ini"))
+    cfg.set_main_option("script_location", str(MIGRATIONS_DIR))
+    cfg.attributes["connection"] = connection
+    return cfg
+
+
+def _sync_check(connection):
+    from alembic import command
+    from alembic.runtime.migration import MigrationContext
+    from alembic.script import ScriptDirectory
+    from sqlalchemy import inspect
+
+    cfg = _alembic_config(connection)
+    head = ScriptDirectory.from_config(cfg).get_current_head()
+    current = MigrationContext.configure(connection).get_current_revision()
+    if current == head:
+        return
+    if current is None and not inspect(connection).get_table_names():
+        from sqlmodel import SQLModel
+        load_models()
+        SQLModel.metadata.create_all(connection)
+        command.stamp(cfg, "head")
+        print(f"[DB] schema created at {head}")
+        return
+    if current is None:
+        command.stamp(cfg, BASELINE_REVISION)
+        print(f"[DB] existing schema stamped at {BASELINE_REVISION}")
+        current = BASELINE_REVISION
+        if current == head:
+            return
+    started = time.perf_counter()
+    command.upgrade(cfg, "head")
+    print(f"[DB] migrated {current} -> {head} in {time.perf_counter() - started:.2f}s")
+
+
+async def init_db():
+    async with get_async_engine().begin() as conn:
+        await conn.run_sync(_sync_check)
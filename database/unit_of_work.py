@@ -0,0 +1,109 @@
+import json
+from math import floor
+from typing import List, Optional, Sequence, Tuple
+from sqlmodel.ext.asyncio.session import AsyncSession
+from models.purchase import Purchase
+from models.user import User
+from database.repositories.account_repo import AccountRepository
+from database.repositories.deposit_repo import DepositRepository
+from database.repositories.gift_type_repo import GiftTypeRepository
+from database.repositories.purchase_repo import PurchaseRepository
+from database.repositories.reservation_repo import ReservationRepository
+from database.repositories.user_repo import UserRepository
+
+
+class PurchaseUnitOfWork:
+    """
+    Stages ledger writes (purchases, deposits, new users, deliveries) in a single transaction.
+
+    record_purchase() only queues the writes (purchase row, stock decrement, account
+    wallet, FIFO realization); commit() makes all of them durable at once, so a whole
+    group of LedgerService commands shares one commit. The user's stars were already
+    taken by reserve_funds() before the payment; booking consumes that Reservation.
+    Balances change through relative UPDATEs, so the order of deposits and reservations
+    within a group doesn't matter.
+    """
+
+    def __init__(self, session: AsyncSession):
+        self.session = session
+        self.accounts = AccountRepository(session)
+        self.deposits = DepositRepository(session)
+        self.gift_types = GiftTypeRepository(session)
+        self.purchases = PurchaseRepository(session)
+        self.reservations = ReservationRepository(session)
+        self.users = UserRepository(session)
+
+    async def record_purchase(self, account_id: int, user_id: int, gift_type_id: int, price: int, meta: dict,
+                              reservation_id: int, parked: bool = False) -> Optional[Purchase]:
+        if not await self.reservations.take([reservation_id], commit=False):
+            # Reclaimed meanwhile (this process' lease lapsed). A parked reservation was booked by
+            # the reclaim (or refunded, if its gift type was unknown); any other one was refunded
+            if parked:
+                return None
+            await self.users.credit(user_id, -price, 0, commit=False)
+        return await self._book(account_id, user_id, gift_type_id, price, meta)
+
+    async def _book(self, account_id: int, user_id: int, gift_type_id: int, price: int, meta: dict) -> Purchase:
+        purchase = await self.purchases.create_purchase(gift_type_id, account_id, price, user_id, meta, commit=False)
+        await self.gift_types.decrement_remaining_by_id(gift_type_id, commit=False)
+        await self.accounts.add_to_wallet(account_id, price, commit=False)
+        await self.deposits.apply_realization_fifo(user_id, price, commit=False)
+        return purchase
+
+    async def reserve_funds(self, owner: str, units: Sequence[Tuple[int, int]]) -> List[Optional[int]]:
+        """
+        Debit each (user id, price) unit in order if the balance still covers it and record a
+        Reservation of owner for it. Reservation id per unit; None where the balance fell short.
+        """
+        funded = [await self.users.debit(user_id, price, commit=False) for user_id, price in units]
+        ids = iter(await self.reservations.add(owner, [u for u, ok in zip(units, funded) if ok], commit=False))
+        return [next(ids) if ok else None for ok in funded]
+
+    async def release_funds(self, reservation_ids: Sequence[int]):
+        """Give back reservations no purchase spent; ones already reclaimed are skipped."""
+        await self._refund(await self.reservations.take(list(reservation_ids), commit=False))
+
+    async def reclaim_funds(self, owner: str, include_own: bool, live_prefix: Optional[str],
+                            now: float) -> Tuple[int, List[int]]:
+        """
+        Settle reservations left by dead processes (ReservationRepository.take_orphaned): paid
+        ones (parked) are booked, the rest refunded. Returns (refunded count, booked purchase ids).
+        """
+        taken = await self.reservations.take_orphaned(owner, live_prefix, now, commit=False)
+        if include_own:
+            # Left by an earlier run under the same owner name: nothing of this run is reserved yet
+            taken += await self.reservations.take_by_owner(owner, commit=False)
+        unpaid, booked = [], []
+        for row in taken:
+            gift_type = await self.gift_types.get_by_code(row.gift_code) if row.account_id is not None else None
+            if gift_type is None:
+                unpaid.append(row)
+                continue
+            booked.append(await self._book(row.account_id, row.user_id, gift_type.id, row.amount, json.loads(row.meta)))
+        await self._refund(unpaid)
+        if booked:
+            await self.session.flush()
+        return len(unpaid), [p.id for p in booked]
+
+    async def _refund(self, taken: list):
+        for row in taken:
+            await self.users.credit(row.user_id, row.amount, 0, commit=False)
+
+    async def ensure_user(self, tg_id: int) -> User:
+        return await self.users.create_or_update(tg_id, commit=False)
+
+    async def apply_deposit(self, tg_id: int, amount: int, commission_rate: float) -> User:
+        user = await self.ensure_user(tg_id)
+        provisional = floor(amount * commission_rate + 0.5)
+        await self.users.credit(user.id, amount - provisional, amount, commit=False)
+        await self.deposits.create_deposit(user.id, amount, commission_rate, commit=False)
+        return user
+
+    async def mark_delivered(self, purchase_id: int):
+        await self.purchases.mark_delivered_by_id(purchase_id, commit=False)
+
+    async def commit(self):
+        await self.session.commit()
+
+    async def rollback(self):
+        await self.session.rollback()
@@ -1,44 +1,118 @@
-import asyncio
-import contextlib
-import signal
-from config.settings import CFG
-from services.market_service import MarketService
-from services.account_service import AccountService
-from services.purchase_service import PurchaseService
-from bot.dispatcher import bot, dp
-from bot.handlers.user_handlers import *
-from bot.handlers import user_handlers  # avoid shadowing top-level 'bot' name
-from bot.handlers import admin_handlers  # ensure admin routes are registered
-
-market_service = MarketService()
-account_service = AccountService()
-purchase_service = PurchaseService(market_service, account_service)
-user_handlers.purchase_service = purchase_service  # wire service into handlers
-
-async def main():
-    worker = asyncio.create_task(purchase_service.purchase_loop())
-    delivery = asyncio.create_task(purchase_service.delivery_loop())
-
-    loop = asyncio.get_running_loop()
-    stop_event = asyncio.Event()
-
-    def _stop():
-        stop_event.set()
-
-    for sig in (signal.SIGINT, signal.SIGTERM):
-        with contextlib.suppress(NotImplementedError):
-            loop.add_signal_handler(sig, _stop)
-
-    try:
-        await dp.start_polling(bot, allowed_updates=["message", "callback_query"])
-        await stop_event.wait()
-    finally:
-        worker.cancel()
-        delivery.cancel()
-        with contextlib.suppress(asyncio.CancelledError):
-            await worker
-            await delivery
-
-
-if __name__ == "__main__":
-    asyncio.run(main())
\ No newline at end of file
+import argparse
+import asyncio
+import contextlib
+import signal
+import time
+from config.settings import CFG, ensure_dirs
+
+# Services, the database and the bot stack are imported inside main(): every phase is
+# timed by --profile-startup, and a worker never loads aiogram at all
+_STARTED = time.perf_counter()
+
+
+@contextlib.contextmanager
+def _phase(name: str, profile: bool):
+    started = time.perf_counter()
+    yield
+    if profile:
+        print(f"[startup] {name}: {(time.perf_counter() - started) * 1000:.0f} ms")
+
+
+async def main(profile: bool = False):
+    with _phase("settings", profile):
+        role = CFG.ROLE
+        if role not in ("all", "coordinator", "worker"):
+            raise SystemExit(f"Unknown TG_ROLE {role!r}: expected all, coordinator or worker")
+        ensure_dirs(CFG)
+
+    with _phase("import services", profile):
+        from services.market_service import MarketService
+        from services.account_service import AccountService
+        from services.purchase_service import PurchaseService
+        from services.lease_service import LeaseService
+        from utils.metrics import serve_metrics
+
+    with _phase("init db", profile):
+        from database.schema import init_db
+        await init_db()
+
+    bot = dp = None
+    if role != "worker":
+        with _phase("import bot", profile):
+            from bot.dispatcher import dp, get_bot
+            from bot.handlers import user_handlers, admin_handlers  # registers the routes on dp
+            if CFG.BOT_MODE == "webhook":
+                from bot.webhook import WebhookServer
+            bot = get_bot()
+
+    with _phase("wire services", profile):
+        market_service = MarketService()
+        account_service = AccountService()
+        purchase_service = PurchaseService(market_service, account_service)
+        if role != "worker":
+            user_handlers.purchase_service = purchase_service  # wire service into handlers
+            admin_handlers.purchase_service = purchase_service
+    if profile:
+        print(f"[startup] ready after {(time.perf_counter() - _STARTED) * 1000:.0f} ms")
+
+    # Before any task starts: from here on the process only uses accounts it holds a lease on
+    leases = None
+    if role != "all":
+        leases = LeaseService(account_service, role, on_gained=purchase_service.backfill_deliveries)
+    # Stopped after everything that writes through it, so their last commands are committed
+    ledger = asyncio.create_task(purchase_service.ledger.run())
+    client_pool = asyncio.create_task(account_service.client_pool_loop())
+    # purchase_loop scans (all, coordinator) or follows the coordinator's snapshot (worker)
+    worker = asyncio.create_task(purchase_service.purchase_loop())
+    background = [client_pool, worker]
+    if role != "worker":
+        background += [
+            asyncio.create_task(account_service.session_watch_loop()),
+            asyncio.create_task(purchase_service.admin_notify.run()),
+            asyncio.create_task(purchase_service.stock_history.run()),
+        ]
+    if role != "coordinator":
+        background += [
+            asyncio.create_task(purchase_service.snipe.run()),
+            asyncio.create_task(purchase_service.delivery_loop()),
+        ]
+    if leases is not None:
+        background.append(asyncio.create_task(leases.run()))
+    if CFG.METRICS_ENABLED:
+        background.append(asyncio.create_task(serve_metrics(CFG.METRICS_HOST, CFG.METRICS_PORT)))
+
+    loop = asyncio.get_running_loop()
+    stop_event = asyncio.Event()
+
+    def _stop():
+        stop_event.set()
+
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        with contextlib.suppress(NotImplementedError):
+            loop.add_signal_handler(sig, _stop)
+
+    allowed_updates = ["message", "callback_query"]
+    try:
+        if role == "worker":
+            print("[worker] buying and delivering on leased accounts; stop with Ctrl+C")
+        elif CFG.BOT_MODE == "webhook":
+            await WebhookServer(bot, dp).serve(stop_event, allowed_updates)
+        else:
+            # A webhook left behind by webhook mode makes getUpdates fail
+            await bot.delete_webhook()
+            await dp.start_polling(bot, allowed_updates=allowed_updates)
+        await stop_event.wait()
+    finally:
+        for task in background:
+            task.cancel()
+        await asyncio.gather(*background, return_exceptions=True)
+        ledger.cancel()
+        await asyncio.gather(ledger, return_exceptions=True)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Gift autobuyer: bot, scanners and purchase workers")
+    parser.add_argument("--profile-startup", action="store_true",
+                        help="Print how long each startup phase (imports, settings, DB check) takes")
+    args = parser.parse_args()
+    asyncio.run(main(profile=args.profile_startup))
@@ -0,0 +1,78 @@
+"""runtime tables
+
+Revision ID: 0003
+Revises: 0002
+Create Date: 2026-10-18 09:41:07.215364
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+import sqlmodel
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0003'
+down_revision: Union[str, None] = '0002'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # Tables and indexes added after the baseline schema. A database that init_db created
+    # at 0002 already has them (create_all), so each one is only created when missing.
+    inspector = sa.inspect(op.get_bind())
+    tables = set(inspector.get_table_names())
+
+    if 'catalogsnapshot' not in tables:
+        op.create_table('catalogsnapshot',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('version', sa.Integer(), nullable=False),
+        sa.Column('gifts', sqlmodel.sql.sqltypes.AutoString(), nullable=False),
+        sa.Column('updated_at', sa.DateTime(timezone=True), nullable=True),
+        sa.PrimaryKeyConstraint('id')
+        )
+    if 'lease' not in tables:
+        op.create_table('lease',
+        sa.Column('key', sqlmodel.sql.sqltypes.AutoString(), nullable=False),
+        sa.Column('owner', sqlmodel.sql.sqltypes.AutoString(), nullable=False),
+        sa.Column('expires_at', sa.Float(), nullable=False),
+        sa.PrimaryKeyConstraint('key')
+        )
+        with op.batch_alter_table('lease', schema=None) as batch_op:
+            batch_op.create_index(batch_op.f('ix_lease_owner'), ['owner'], unique=False)
+
+    if 'stocksample' not in tables:
+        op.create_table('stocksample',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('gift_type_id', sa.Integer(), nullable=False),
+        sa.Column('ts', sa.Integer(), nullable=False),
+        sa.Column('remaining', sa.Integer(), nullable=False),
+        sa.Column('price_stars', sa.Integer(), nullable=False),
+        sa.ForeignKeyConstraint(['gift_type_id'], ['gifttype.id'], ),
+        sa.PrimaryKeyConstraint('id')
+        )
+        with op.batch_alter_table('stocksample', schema=None) as batch_op:
+            batch_op.create_index('ix_stocksample_gift_ts', ['gift_type_id', 'ts'], unique=False)
+            batch_op.create_index(batch_op.f('ix_stocksample_ts'), ['ts'], unique=False)
+
+    if 'ix_deposit_open' not in {ix['name'] for ix in inspector.get_indexes('deposit')}:
+        with op.batch_alter_table('deposit', schema=None) as batch_op:
+            batch_op.create_index('ix_deposit_open', ['user_id', 'id'], unique=False, sqlite_where=sa.text('realized_spend < amount_stars_gross'), postgresql_where=sa.text('realized_spend < amount_stars_gross'))
+
+
+def downgrade() -> None:
+    with op.batch_alter_table('deposit', schema=None) as batch_op:
+        batch_op.drop_index('ix_deposit_open', sqlite_where=sa.text('realized_spend < amount_stars_gross'), postgresql_where=sa.text('realized_spend < amount_stars_gross'))
+
+    with op.batch_alter_table('stocksample', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_stocksample_ts'))
+        batch_op.drop_index('ix_stocksample_gift_ts')
+
+    op.drop_table('stocksample')
+    with op.batch_alter_table('lease', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_lease_owner'))
+
+    op.drop_table('lease')
+    op.drop_table('catalogsnapshot')
@@ -1,3 +1,3 @@
-from sqlmodel import SQLModel, Field
-from sqlalchemy import Column, DateTime
+from sqlmodel import SQLModel, Field
+from sqlalchemy import Column, DateTime
 from datetime import datetime, timezone
\ No newline at end of file
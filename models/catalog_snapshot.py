@@ -0,0 +1,11 @@
+from models.base import SQLModel, Field, Column, DateTime, datetime, timezone
+from typing import Optional
+
+class CatalogSnapshot(SQLModel, table=True):
+    """The coordinator's current market catalog (a single row), read by worker processes."""
+    id: Optional[int] = Field(default=None, primary_key=True)
+    version: int = 0  # bumped by every publish, survives coordinator restarts
+    gifts: str = "[]"  # JSON list of MarketGift
+    updated_at: datetime = Field(
+        sa_column=Column(DateTime(timezone=True), default=lambda: datetime.now(timezone.utc))
+    )
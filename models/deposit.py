@@ -1,15 +1,26 @@
-from models.base import SQLModel, Field, Column, DateTime, datetime, timezone
-from typing import Optional
-
-class Deposit(SQLModel, table=True):
-    id: Optional[int] = Field(default=None, primary_key=True)
-    user_id: int = Field(index=True, foreign_key="user.id")
-    amount_stars_gross: int
-    commission_rate: float
-    commission_provisional: int
-    realized_spend: int = 0
-    commission_final: int = 0
-    refunded_commission: int = 0
-    created_at: datetime = Field(
-        sa_column=Column(DateTime(timezone=True), default=lambda: datetime.now(timezone.utc))
+from models.base import SQLModel, Field, Column, DateTime, datetime, timezone
+from typing import Optional
+from sqlalchemy import Index, text
+
+# A deposit is open while part of it is still unrealized
+OPEN_DEPOSIT = "realized_spend < amount_stars_gross"
+
+class Deposit(SQLModel, table=True):
+    __table_args__ = (
+        # Open deposits in FIFO order per user: the only rows realization has to visit
+        Index("ix_deposit_open", "user_id", "id",
+              sqlite_where=text(OPEN_DEPOSIT), postgresql_where=text(OPEN_DEPOSIT)),
+        # All deposits of a user in id order (balance view)
+        Index("ix_deposit_user_id_id", "user_id", "id"),
+    )
+    id: Optional[int] = Field(default=None, primary_key=True)
+    user_id: int = Field(foreign_key="user.id")
+    amount_stars_gross: int
+    commission_rate: float
+    commission_provisional: int
+    realized_spend: int = 0
+    commission_final: int = 0
+    refunded_commission: int = 0
+    created_at: datetime = Field(
+        sa_column=Column(DateTime(timezone=True), default=lambda: datetime.now(timezone.utc))
     )
\ No newline at end of file
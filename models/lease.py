@@ -0,0 +1,7 @@
+from models.base import SQLModel, Field
+
+class Lease(SQLModel, table=True):
+    """Time-limited claim of a named resource ("account:<id>", "worker:<owner>") by one process."""
+    key: str = Field(primary_key=True)
+    owner: str = Field(index=True)
+    expires_at: float  # unix seconds
@@ -1,7 +1,7 @@
-from pydantic import BaseModel
-
-class MarketGift(BaseModel):
-    code: str
-    title: str
-    price_stars: int
+from pydantic import BaseModel
+
+class MarketGift(BaseModel):
+    code: str
+    title: str
+    price_stars: int
     remaining: int
\ No newline at end of file
@@ -1,14 +1,25 @@
-from models.base import SQLModel, Field, Column, DateTime, datetime, timezone
-from typing import Optional
-
-class Purchase(SQLModel, table=True):
-    id: Optional[int] = Field(default=None, primary_key=True)
-    gift_type_id: int = Field(index=True, foreign_key="gifttype.id")
-    account_id: int = Field(index=True, foreign_key="account.id")
-    price_stars: int
-    status: str = "purchased"
-    owner_user_id: Optional[int] = Field(default=None, index=True)
-    ext_payload: Optional[str] = None
-    created_at: datetime = Field(
-        sa_column=Column(DateTime(timezone=True), default=lambda: datetime.now(timezone.utc))
+from models.base import SQLModel, Field, Column, DateTime, datetime, timezone
+from typing import Optional
+from sqlalchemy import Index, text
+
+# A purchase waits for delivery while it is in this status
+PENDING_PURCHASE = "status = 'purchased'"
+
+class Purchase(SQLModel, table=True):
+    __table_args__ = (
+        # Undelivered purchases in id order: delivery dispatch and backfill only visit these rows
+        Index("ix_purchase_pending", "status", "id",
+              sqlite_where=text(PENDING_PURCHASE), postgresql_where=text(PENDING_PURCHASE)),
+        # Covers stats_by_status: the admin panel totals are read from the index alone
+        Index("ix_purchase_status", "status", "price_stars"),
+    )
+    id: Optional[int] = Field(default=None, primary_key=True)
+    gift_type_id: int = Field(index=True, foreign_key="gifttype.id")
+    account_id: int = Field(index=True, foreign_key="account.id")
+    price_stars: int
+    status: str = "purchased"
+    owner_user_id: Optional[int] = Field(default=None, index=True)
+    ext_payload: Optional[str] = None
+    created_at: datetime = Field(
+        sa_column=Column(DateTime(timezone=True), default=lambda: datetime.now(timezone.utc))
     )
\ No newline at end of file
@@ -0,0 +1,13 @@
+from models.base import SQLModel, Field
+from typing import Optional
+
+class Reservation(SQLModel, table=True):
+    """Stars taken off a user's balance for one planned purchase, until it is booked or released."""
+    id: Optional[int] = Field(default=None, primary_key=True)
+    owner: str = Field(index=True)  # process that reserved it (lease owner name)
+    user_id: int = Field(foreign_key="user.id")
+    amount: int
+    # Set once the stars were paid but booking failed: a reclaim books the purchase instead of refunding
+    account_id: Optional[int] = None
+    gift_code: Optional[str] = None
+    meta: Optional[str] = None  # JSON payment result, as Purchase.ext_payload
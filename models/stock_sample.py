@@ -0,0 +1,14 @@
+from models.base import SQLModel, Field
+from typing import Optional
+from sqlalchemy import Index
+
+class StockSample(SQLModel, table=True):
+    """One observed change of a gift's stock or price; append-only, downsampled with age."""
+    __table_args__ = (
+        Index("ix_stocksample_gift_ts", "gift_type_id", "ts"),
+    )
+    id: Optional[int] = Field(default=None, primary_key=True)
+    gift_type_id: int = Field(foreign_key="gifttype.id")
+    ts: int = Field(index=True)  # unix seconds
+    remaining: int
+    price_stars: int
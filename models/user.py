@@ -1,11 +1,11 @@
-from models.base import SQLModel, Field, Column, DateTime, datetime, timezone
-from typing import Optional
-
-class User(SQLModel, table=True):
-    id: Optional[int] = Field(default=None, primary_key=True)
-    tg_id: int = Field(index=True, unique=True)
-    stars_balance: int = 0
-    total_contributed: int = 0
-    created_at: datetime = Field(
-        sa_column=Column(DateTime(timezone=True), default=lambda: datetime.now(timezone.utc))
+from models.base import SQLModel, Field, Column, DateTime, datetime, timezone
+from typing import Optional
+
+class User(SQLModel, table=True):
+    id: Optional[int] = Field(default=None, primary_key=True)
+    tg_id: int = Field(index=True, unique=True)
+    stars_balance: int = 0
+    total_contributed: int = 0
+    created_at: datetime = Field(
+        sa_column=Column(DateTime(timezone=True), default=lambda: datetime.now(timezone.utc))
     )
\ No newline at end of file
@@ -1,147 +1,335 @@
-from config.settings import CFG
-from database.engine import engine
-from database.repositories.account_repo import AccountRepository
-from sqlmodel import Session
-from telethon import TelegramClient
-from pathlib import Path
-from typing import Dict
-import json
-import urllib.parse as up
-from telethon.errors import SessionPasswordNeededError, FloodWaitError, CodeInvalidError
-import asyncio
-import secrets
-
-from models.account import Account
-
-try:
-    import qrcode
-except ImportError:
-    qrcode = None
-
-from utils.helpers import generate_session_name
-
-class AccountService:
-    def __init__(self):
-        self.cfg = CFG
-        self.clients: Dict[int, TelegramClient] = {}
-        self.blacklist = self._load_blacklist()
-        self.proxy_map = self._load_proxies()
-
-    def _load_blacklist(self) -> set[str]:
-        try:
-            return set(json.loads(Path(self.cfg.BLACKLIST_FILE).read_text("utf-8")))
-        except Exception:
-            return set()
-
-    def _save_blacklist(self):
-        Path(self.cfg.BLACKLIST_FILE).write_text(json.dumps(sorted(self.blacklist), ensure_ascii=False, indent=2), "utf-8")
-
-    def _load_proxies(self) -> dict[str, str]:
-        try:
-            return json.loads(Path(self.cfg.PROXIES_FILE).read_text("utf-8"))
-        except Exception:
-            return {}
-
-    async def scan_sessions(self):
-        with Session(engine) as s:
-            repo = AccountRepository(s)
-            files = list(Path(self.cfg.SESSIONS_DIR).glob("*.session"))
-            for p in files:
-                name = p.stem
-                acc = repo.get_or_create_account(name)
-                # Respect blacklist but still ensure DB entry exists
-                if name in self.blacklist:
-                    acc.blacklisted = True
-                    if not acc.last_error:
-                        acc.last_error = "blacklisted"
-                if acc.proxy is None:
-                    acc.proxy = self.proxy_map.get(name)
-                repo.update(acc)
-            # Create a default account if none found, using phone or fallback to configured session name
-            if not files:
-                session_name = generate_session_name(phone=self.cfg.PHONE_NUMBER, username=self.cfg.SESSION_NAME)
-                acc = repo.get_or_create_account(session_name)
-                if acc.proxy is None:
-                    acc.proxy = self.proxy_map.get(session_name)
-                    repo.update(acc)
-
-    async def get_client(self, acc: Account) -> TelegramClient:
-        if acc.id in self.clients:
-            return self.clients[acc.id]
-
-        session_base_path = Path(self.cfg.SESSIONS_DIR) / acc.session_name
-        kwargs = {}
-        if acc.proxy:
-            u = up.urlparse(acc.proxy)
-            if u.scheme.startswith("socks"):
-                kwargs["proxy"] = ("socks5", u.hostname, u.port, True, u.username, u.password)
-
-        client = TelegramClient(
-            session=str(session_base_path),
-            api_id=self.cfg.API_ID,
-            api_hash=self.cfg.API_HASH,
-            **kwargs
-        )
-
-        await client.connect()
-
-        if not await client.is_user_authorized():
-            use_qr = (self.cfg.LOGIN_METHOD.lower() == "qr") or not self.cfg.PHONE_NUMBER
-            if use_qr:
-                print("Включена авторизация по QR-коду. Отсканируйте QR в приложении Telegram (Настройки → Устройства).")
-                try:
-                    qr_login = await client.qr_login()
-                    try:
-                        if qrcode:
-                            qr = qrcode.QRCode(border=1)
-                            qr.add_data(qr_login.url)
-                            qr.make(fit=True)
-                            qr.print_ascii(invert=True)
-                        else:
-                            print(f"QR URL: {qr_login.url}")
-                        print("Ожидаю сканирования...")
-                        await qr_login.wait()
-                        print("Авторизация завершена через QR.")
-                    except SessionPasswordNeededError:
-                        pwd = input("Введите пароль 2FA: ")
-                        await client.sign_in(password=pwd)
-                    except FloodWaitError as e:
-                        print(f"Флуд-ограничение: подождите {e.seconds} секунд.")
-                        await asyncio.sleep(e.seconds)
-                except Exception as e:
-                    raise RuntimeError(f"QR-авторизация не удалась: {e}")
-            else:
-                if not self.cfg.PHONE_NUMBER:
-                    raise RuntimeError("Нужен TG_PHONE_NUMBER в .env или установите TG_LOGIN_METHOD=qr для авторизации по QR.")
-
-                authorized = False
-                while not authorized:
-                    try:
-                        await client.send_code_request(self.cfg.PHONE_NUMBER, force_sms=self.cfg.FORCE_SMS)
-                        code = input(f"Введите код из Telegram для {self.cfg.PHONE_NUMBER}: ")
-
-                        try:
-                            await client.sign_in(self.cfg.PHONE_NUMBER, code)
-                            authorized = True
-                        except SessionPasswordNeededError:
-                            pwd = input("Введите пароль 2FA: ")
-                            await client.sign_in(password=pwd)
-                            authorized = True
-                        except CodeInvalidError:
-                            print("Неверный код. Повторите попытку.")
-                        except FloodWaitError as e:
-                            print(f"Флуд-ограничение: подождите {e.seconds} секунд.")
-                            await asyncio.sleep(e.seconds)
-                        except Exception as e:
-                            print(f"Ошибка авторизации: {e}. Повторите попытку.")
-                    except Exception as e:
-                        print(f"Ошибка при запросе кода: {e}. Повторите попытку позже.")
-                        await asyncio.sleep(10)
-
-        self.clients[acc.id] = client
-        return client
-
-    async def blacklist_account(self, acc: Account, reason: str, repo: AccountRepository):
-        repo.blacklist(acc, reason)
-        self.blacklist.add(acc.session_name)
-        self._save_blacklist()
\ No newline at end of file
+from config.settings import CFG
+from database.engine import async_session
+from database.repositories.account_repo import AccountRepository
+from telethon import TelegramClient
+from telethon.tl import functions as tl_functions
+from pathlib import Path
+from typing import AsyncIterator, Dict, Optional, Set
+import contextlib
+import json
+import urllib.parse as up
+from telethon.errors import SessionPasswordNeededError, FloodWaitError, CodeInvalidError
+import asyncio
+import secrets
+import time
+
+from models.account import Account
+
+try:
+    import qrcode
+except ImportError:
+    qrcode = None
+
+from utils.helpers import generate_session_name
+from utils.metrics import GET_CLIENT_SECONDS
+
+
+class ClientNotOwned(RuntimeError):
+    """get_client for an account whose lease belongs to another process."""
+
+
+class AccountService:
+    def __init__(self):
+        self.cfg = CFG
+        self.clients: Dict[int, TelegramClient] = {}
+        self._client_locks: Dict[int, asyncio.Lock] = {}
+        self._last_used: Dict[int, float] = {}  # monotonic time of the last get_client per account
+        # Running using() blocks per account; evicting a client in use waits for the last one
+        self._in_use: Dict[int, int] = {}
+        self._evict_pending: Set[int] = set()
+        # Session discovery state; accounts_version changes whenever the account set may have changed
+        self._scan_lock = asyncio.Lock()
+        self._session_names: set[str] | None = None
+        self._sessions_dir_mtime: int | None = None
+        self.accounts_version = 0
+        # Account ids this process may use; None = all (set by LeaseService in coordinator/worker roles)
+        self.owned: Optional[Set[int]] = None
+        self.blacklist = self._load_blacklist()
+        self.proxy_map = self._load_proxies()
+
+    def _load_blacklist(self) -> set[str]:
+        try:
+            return set(json.loads(Path(self.cfg.BLACKLIST_FILE).read_text("utf-8")))
+        except Exception:
+            return set()
+
+    def _save_blacklist(self):
+        Path(self.cfg.BLACKLIST_FILE).write_text(json.dumps(sorted(self.blacklist), ensure_ascii=False, indent=2), "utf-8")
+
+    def _load_proxies(self) -> dict[str, str]:
+        try:
+            return json.loads(Path(self.cfg.PROXIES_FILE).read_text("utf-8"))
+        except Exception:
+            return {}
+
+    async def scan_sessions(self) -> bool:
+        """
+        Incremental scan of SESSIONS_DIR: nothing is read while the directory mtime is unchanged,
+        and only added/removed .session files reach the DB (one transaction). An account whose file
+        is gone is blacklisted with last_error SESSION_REMOVED, so no scanner or worker picks it up
+        and opens an empty session; it comes back if the file does. The first scan compares with
+        the accounts in the DB, which catches files removed while the process was down.
+        Returns True when the account set changed (accounts_version is bumped). Not called in the
+        worker role, whose SESSIONS_DIR may not hold every account of the shared database.
+        """
+        async with self._scan_lock:
+            sessions_dir = Path(self.cfg.SESSIONS_DIR)
+            try:
+                dir_mtime = sessions_dir.stat().st_mtime_ns
+            except FileNotFoundError:
+                dir_mtime = None
+            first_scan = self._session_names is None
+            if not first_scan and dir_mtime == self._sessions_dir_mtime:
+                return False
+            self._sessions_dir_mtime = dir_mtime
+
+            names = {p.stem for p in sessions_dir.glob("*.session")}
+            known = self._session_names or set()
+            added, removed = names - known, known - names
+            self._session_names = names
+            if not first_scan and not added and not removed:
+                return False
+
+            # Without any session file the default account is created below and logs in interactively
+            default_name = generate_session_name(phone=self.cfg.PHONE_NUMBER, username=self.cfg.SESSION_NAME)
+            async with async_session() as s:
+                repo = AccountRepository(s)
+                if first_scan:
+                    removed = {a.session_name for a in await repo.get_all_non_blacklisted()} - names
+                if not names:
+                    removed.discard(default_name)
+                # Committed together with the upsert of added files, if there are any
+                gone = await repo.mark_removed(sorted(removed), commit=not added)
+                # Respect blacklist but still ensure DB entry exists
+                await repo.bulk_upsert([
+                    {
+                        "session_name": name,
+                        "proxy": self.proxy_map.get(name),
+                        "blacklisted": name in self.blacklist,
+                        "last_error": "blacklisted" if name in self.blacklist else None,
+                    }
+                    for name in sorted(added)
+                ])
+                # Create a default account if none found, using phone or fallback to configured session name
+                if not names:
+                    acc = await repo.get_or_create_account(default_name)
+                    if acc.proxy is None:
+                        acc.proxy = self.proxy_map.get(default_name)
+                        await repo.update(acc)
+            for acc_id in gone:
+                await self.evict_client(acc_id)
+
+            self.accounts_version += 1
+            return True
+
+    def owns(self, acc_id: int) -> bool:
+        return self.owned is None or acc_id in self.owned
+
+    async def session_watch_loop(self):
+        while True:
+            await self.scan_sessions()
+            await asyncio.sleep(self.cfg.SESSIONS_POLL_SEC)
+
+    async def get_client(self, acc: Account) -> TelegramClient:
+        # The lease holder may already have this session file open
+        if not self.owns(acc.id):
+            raise ClientNotOwned(f"account {acc.id} is leased to another process")
+        # One lock per account: concurrent workers must not open the same session file twice
+        with GET_CLIENT_SECONDS.time():
+            async with self._client_locks.setdefault(acc.id, asyncio.Lock()):
+                if not self.owns(acc.id):
+                    raise ClientNotOwned(f"account {acc.id} is leased to another process")
+                client = self.clients.get(acc.id)
+                if client is None:
+                    client = await self._open_client(acc, interactive=True)
+                    self.clients[acc.id] = client
+                elif not client.is_connected():
+                    # Dropped connection: reconnect transparently, the session is still authorized
+                    await client.connect()
+                self._last_used[acc.id] = time.monotonic()
+                return client
+
+    @contextlib.asynccontextmanager
+    async def using(self, acc: Account) -> AsyncIterator[TelegramClient]:
+        """get_client for a run of RPCs: an eviction requested meanwhile happens once the block exits."""
+        client = await self.get_client(acc)
+        self._in_use[acc.id] = self._in_use.get(acc.id, 0) + 1
+        try:
+            yield client
+        finally:
+            self._in_use[acc.id] -= 1
+            if not self._in_use[acc.id]:
+                del self._in_use[acc.id]
+                if acc.id in self._evict_pending:
+                    await self.evict_client(acc.id)
+
+    async def _open_client(self, acc: Account, interactive: bool) -> TelegramClient:
+        session_base_path = Path(self.cfg.SESSIONS_DIR) / acc.session_name
+        kwargs = {}
+        if acc.proxy:
+            u = up.urlparse(acc.proxy)
+            if u.scheme.startswith("socks"):
+                kwargs["proxy"] = ("socks5", u.hostname, u.port, True, u.username, u.password)
+
+        client = TelegramClient(
+            session=str(session_base_path),
+            api_id=self.cfg.API_ID,
+            api_hash=self.cfg.API_HASH,
+            **kwargs
+        )
+
+        await client.connect()
+
+        if not await client.is_user_authorized():
+            if not interactive:
+                await client.disconnect()
+                raise RuntimeError(f"session {acc.session_name} is not authorized")
+            use_qr = (self.cfg.LOGIN_METHOD.lower() == "qr") or not self.cfg.PHONE_NUMBER
+            if use_qr:
+                print("Включена авторизация по QR-коду. Отсканируйте QR в приложении Telegram (Настройки → Устройства).")
+                try:
+                    qr_login = await client.qr_login()
+                    try:
+                        if qrcode:
+                            qr = qrcode.QRCode(border=1)
+                            qr.add_data(qr_login.url)
+                            qr.make(fit=True)
+                            qr.print_ascii(invert=True)
+                        else:
+                            print(f"QR URL: {qr_login.url}")
+                        print("Ожидаю сканирования...")
+                        await qr_login.wait()
+                        print("Авторизация завершена через QR.")
+                    except SessionPasswordNeededError:
+                        pwd = input("Введите пароль 2FA: ")
+                        await client.sign_in(password=pwd)
+                    except FloodWaitError as e:
+                        print(f"Флуд-ограничение: подождите {e.seconds} секунд.")
+                        await asyncio.sleep(e.seconds)
+                except Exception as e:
+                    raise RuntimeError(f"QR-авторизация не удалась: {e}")
+            else:
+                if not self.cfg.PHONE_NUMBER:
+                    raise RuntimeError("Нужен TG_PHONE_NUMBER в .env или установите TG_LOGIN_METHOD=qr для авторизации по QR.")
+
+                authorized = False
+                while not authorized:
+                    try:
+                        await client.send_code_request(self.cfg.PHONE_NUMBER, force_sms=self.cfg.FORCE_SMS)
+                        code = input(f"Введите код из Telegram для {self.cfg.PHONE_NUMBER}: ")
+
+                        try:
+                            await client.sign_in(self.cfg.PHONE_NUMBER, code)
+                            authorized = True
+                        except SessionPasswordNeededError:
+                            pwd = input("Введите пароль 2FA: ")
+                            await client.sign_in(password=pwd)
+                            authorized = True
+                        except CodeInvalidError:
+                            print("Неверный код. Повторите попытку.")
+                        except FloodWaitError as e:
+                            print(f"Флуд-ограничение: подождите {e.seconds} секунд.")
+                            await asyncio.sleep(e.seconds)
+                        except Exception as e:
+                            print(f"Ошибка авторизации: {e}. Повторите попытку.")
+                    except Exception as e:
+                        print(f"Ошибка при запросе кода: {e}. Повторите попытку позже.")
+                        await asyncio.sleep(10)
+
+        return client
+
+    async def warm_up(self):
+        """Connect every eligible (non-blacklisted, authorized) account up front, in parallel."""
+        async with async_session() as s:
+            accounts = [a for a in await AccountRepository(s).get_all_non_blacklisted() if self.owns(a.id)]
+        slots = asyncio.Semaphore(max(1, self.cfg.CLIENT_CONNECT_CONCURRENCY))
+
+        async def connect(acc: Account):
+            if acc.id in self.clients or acc.session_name in self.blacklist:
+                return
+            async with slots, self._client_locks.setdefault(acc.id, asyncio.Lock()):
+                if acc.id in self.clients:
+                    return
+                try:
+                    # Never prompt here: unauthorized sessions are left for the interactive get_client path
+                    client = await self._open_client(acc, interactive=False)
+                except Exception as e:
+                    print(f"[ClientPool] warm-up skipped {acc.session_name}: {e}")
+                    return
+                self.clients[acc.id] = client
+                self._last_used[acc.id] = time.monotonic()
+
+        await asyncio.gather(*(connect(a) for a in accounts))
+        print(f"[ClientPool] warm-up done: {len(self.clients)}/{len(accounts)} clients connected")
+
+    async def client_pool_loop(self):
+        """Warm the pool, then periodically ping idle clients and evict stale ones."""
+        # Session discovery (and marking removed files) belongs to the all/coordinator process
+        if self.cfg.ROLE != "worker":
+            await self.scan_sessions()
+        await self.warm_up()
+        while True:
+            await asyncio.sleep(self.cfg.CLIENT_PING_INTERVAL_SEC)
+            await self._maintain_clients()
+
+    async def _maintain_clients(self):
+        async with async_session() as s:
+            accounts = {a.id: a for a in await AccountRepository(s).get_all()}
+        now = time.monotonic()
+        idle_evict = self.cfg.CLIENT_IDLE_EVICT_SEC
+        slots = asyncio.Semaphore(max(1, self.cfg.CLIENT_CONNECT_CONCURRENCY))
+
+        async def check(acc_id: int):
+            acc = accounts.get(acc_id)
+            if acc is None or acc.blacklisted or acc.session_name in self.blacklist or not self.owns(acc_id):
+                await self.evict_client(acc_id)
+                return
+            idle = now - self._last_used.get(acc_id, now)
+            if idle_evict > 0 and idle >= idle_evict:
+                await self.evict_client(acc_id)
+                return
+            if idle < self.cfg.CLIENT_PING_INTERVAL_SEC:
+                return  # recently used, known to be alive
+            async with slots:
+                client = self.clients.get(acc_id)
+                if client is None:
+                    return
+                try:
+                    if not client.is_connected():
+                        await client.connect()
+                    await asyncio.wait_for(client(tl_functions.PingRequest(ping_id=secrets.randbits(63))),
+                                           timeout=self.cfg.CLIENT_PING_TIMEOUT_SEC)
+                except Exception as e:
+                    print(f"[ClientPool] {acc.session_name} ping failed, reconnecting: {e}")
+                    try:
+                        await client.disconnect()
+                        await client.connect()
+                    except Exception as e:
+                        print(f"[ClientPool] {acc.session_name} reconnect failed, evicting: {e}")
+                        await self.evict_client(acc_id)
+
+        await asyncio.gather(*(check(acc_id) for acc_id in list(self.clients)))
+
+    async def evict_client(self, acc_id: int):
+        """
+        Disconnect and forget a pooled client (blacklisted, removed, released or idle account).
+        A client inside a using() block is evicted when the last block exits.
+        """
+        if acc_id in self._in_use:
+            self._evict_pending.add(acc_id)
+            return
+        self._evict_pending.discard(acc_id)
+        client = self.clients.pop(acc_id, None)
+        self._last_used.pop(acc_id, None)
+        if client is not None:
+            try:
+                await client.disconnect()
+            except Exception as e:
+                print(f"[ClientPool] disconnect error for account {acc_id}: {e}")
+
+    async def blacklist_account(self, acc: Account, reason: str, repo: AccountRepository):
+        await repo.blacklist(acc, reason)
+        self.blacklist.add(acc.session_name)
+        self._save_blacklist()
+        self.accounts_version += 1
+        await self.evict_client(acc.id)
\ No newline at end of file
@@ -0,0 +1,72 @@
+from typing import Dict, List, Sequence, Tuple
+from models.account import Account
+from models.market_gift import MarketGift
+from models.user import User
+import numpy as np
+
+
+def gift_scores(gifts: Sequence[MarketGift], price_exp: float, rarity_exp: float) -> np.ndarray:
+    """Objective value of one unit: price^price_exp / remaining^rarity_exp (rare, expensive gifts first)."""
+    price = np.fromiter((g.price_stars for g in gifts), dtype=np.float64, count=len(gifts))
+    remaining = np.fromiter((g.remaining for g in gifts), dtype=np.float64, count=len(gifts))
+    return np.power(price, price_exp) / np.power(np.maximum(remaining, 1.0), rarity_exp)
+
+
+def rank_gifts(gifts: Sequence[MarketGift], price_exp: float, rarity_exp: float) -> List[MarketGift]:
+    """Gifts in the order plan_purchases takes them: descending score, ties keep the input order."""
+    order = np.argsort(-gift_scores(gifts, price_exp, rarity_exp), kind="stable")
+    return [gifts[i] for i in order]
+
+
+def plan_purchases(accounts: Sequence[Account], gifts: Sequence[MarketGift], users: Sequence[User],
+                   account_cap: int, price_exp: float = 1.0,
+                   rarity_exp: float = 1.0) -> Dict[int, List[Tuple[MarketGift, int]]]:
+    """
+    Plan one purchase cycle as a batch: account id -> [(gift, funding user id)] in buy order.
+
+    Gifts are taken in descending objective score. A gift gets at most one unit per
+    account and never more units than it has left. Its units go to the accounts with
+    the least wallet headroom that still fits the price (best fit keeps large headroom
+    free for expensive gifts further down). Each unit is funded by one user, in priority
+    order (-total_contributed, id). Headroom and balances are tracked in NumPy arrays,
+    so every gift costs a few vector operations rather than a pass over all accounts.
+    """
+    gifts = [g for g in gifts if g.remaining > 0 and g.price_stars > 0]
+    plan: Dict[int, List[Tuple[MarketGift, int]]] = {a.id: [] for a in accounts}
+    if not accounts or not gifts or not users:
+        return plan
+
+    headroom = np.fromiter((account_cap - a.stars_wallet for a in accounts), dtype=np.int64, count=len(accounts))
+    users = sorted(users, key=lambda u: (-u.total_contributed, u.id))
+    balance = np.fromiter((u.stars_balance for u in users), dtype=np.int64, count=len(users))
+    np.maximum(balance, 0, out=balance)
+
+    scores = gift_scores(gifts, price_exp, rarity_exp)
+    for gi in np.argsort(-scores, kind="stable"):
+        g = gifts[gi]
+        price = g.price_stars
+        fits = np.flatnonzero(headroom >= price)
+        if not fits.size:
+            continue
+        fundable = balance // price  # units each user can still pay for
+        funded = np.cumsum(fundable)
+        units = int(min(g.remaining, fits.size, funded[-1]))
+        if units <= 0:
+            continue
+
+        if units < fits.size:
+            chosen = fits[np.argpartition(headroom[fits], units - 1)[:units]]
+        else:
+            chosen = fits
+        headroom[chosen] -= price
+
+        # Highest-priority users first: the smallest prefix whose fundable units cover the gift
+        last = int(np.searchsorted(funded, units))
+        take = fundable[:last + 1].copy()
+        take[last] -= funded[last] - units
+        balance[:last + 1] -= take * price
+        funders = np.repeat(np.arange(last + 1), take)
+
+        for acc_i, user_i in zip(chosen.tolist(), funders.tolist()):
+            plan[accounts[acc_i].id].append((g, users[user_i].id))
+    return plan
@@ -0,0 +1,72 @@
+from database.engine import async_session
+from database.repositories.gift_type_repo import GiftTypeRepository
+from models.market_gift import MarketGift
+from typing import Dict, Iterable, List, NamedTuple, Optional
+
+
+class GiftRef(NamedTuple):
+    id: int
+    price_stars: int
+    remaining: int
+
+
+class GiftCatalog:
+    """
+    Process-local view of the gifttype table: code -> GiftRef.
+
+    sync() writes a scanned catalog (ROLE all / coordinator): only gifts whose price or
+    stock differs from the map go into one INSERT ... ON CONFLICT DO UPDATE, which also
+    refreshes updated_at. ensure() only looks up gifts this process hasn't seen yet (a
+    worker buying from the coordinator's snapshot). Purchases and stock samples resolve
+    codes here instead of querying gifttype. Entries are never dropped: the map is as
+    large as the gifttype table at most.
+    """
+
+    def __init__(self):
+        self._refs: Dict[str, GiftRef] = {}
+
+    def id_of(self, code: str) -> Optional[int]:
+        ref = self._refs.get(code)
+        return ref.id if ref is not None else None
+
+    async def sync(self, gifts: List[MarketGift]):
+        changed = []
+        for g in gifts:
+            ref = self._refs.get(g.code)
+            if ref is None or (ref.price_stars, ref.remaining) != (g.price_stars, g.remaining):
+                changed.append(g)
+        if not changed:
+            return
+        async with async_session() as s:
+            repo = GiftTypeRepository(s)
+            ids = await repo.upsert_many([
+                {"code": g.code, "title": g.title, "price_stars": g.price_stars, "remaining_global": g.remaining}
+                for g in changed
+            ])
+            # Rows that were already up to date aren't returned: after a restart their ids are read once
+            unknown = [g.code for g in changed if g.code not in ids and g.code not in self._refs]
+            if unknown:
+                ids.update((code, gift_id) for code, gift_id, _, _ in await repo.get_refs_by_codes(unknown))
+        for g in changed:
+            gift_id = ids.get(g.code) or self.id_of(g.code)
+            if gift_id is not None:
+                self._refs[g.code] = GiftRef(gift_id, g.price_stars, g.remaining)
+
+    async def ensure(self, codes: Iterable[str]):
+        missing = [code for code in codes if code not in self._refs]
+        if not missing:
+            return
+        async with async_session() as s:
+            rows = await GiftTypeRepository(s).get_refs_by_codes(missing)
+        for code, gift_id, price, remaining in rows:
+            self._refs[code] = GiftRef(gift_id, price, remaining)
+
+    async def resolve(self, code: str) -> int:
+        """gifttype id of code; a SELECT only for a gift this process hasn't seen."""
+        gift_id = self.id_of(code)
+        if gift_id is None:
+            await self.ensure([code])
+            gift_id = self.id_of(code)
+            if gift_id is None:
+                raise LookupError(f"unknown gift type {code}")
+        return gift_id
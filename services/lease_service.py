@@ -0,0 +1,115 @@
+from config.settings import CFG
+from database.engine import async_session
+from database.repositories.account_repo import AccountRepository
+from database.repositories.lease_repo import LeaseRepository
+from services.account_service import AccountService
+from typing import Callable, Optional, Set
+from utils.helpers import process_owner
+import asyncio
+import math
+import time
+
+ACCOUNT_KEY = "account:"
+WORKER_KEY = "worker:"
+
+
+class LeaseService:
+    """
+    Splits accounts between processes sharing one database through Lease rows.
+
+    Every LEASE_HEARTBEAT_SEC the process renews what it holds and rebalances. A worker
+    registers itself (worker:<owner>) and aims for ceil(free / live workers) accounts,
+    where free excludes the coordinator's SCANNER_COUNT scanner accounts (or whatever
+    non-workers hold, if more). The coordinator aims for SCANNER_COUNT accounts. Leases of a process that stopped
+    heartbeating expire after LEASE_TTL_SEC and are claimed like free ones.
+
+    The held account ids go to AccountService.owned; a change bumps accounts_version, so
+    scanners and purchase workers reload. Released accounts stop being handed out at once
+    (get_client refuses them) and lose their pooled client as soon as the RPCs already
+    running on it finish.
+    """
+
+    def __init__(self, account_service: AccountService, role: str,
+                 on_gained: Optional[Callable[[Set[int]], None]] = None):
+        self.account_service = account_service
+        self.role = role
+        self.on_gained = on_gained
+        self.cfg = CFG
+        self.owner = process_owner()
+        self.held: Set[int] = set()
+        self._renewed_at = time.time()
+        self._warm_up: Optional[asyncio.Task] = None
+        account_service.owned = set()
+
+    def _target(self, accounts: int, leases: dict, workers: Set[str]) -> int:
+        if self.role != "worker":
+            return min(accounts, max(1, self.cfg.SCANNER_COUNT))
+        pinned = sum(1 for owner in leases.values() if owner not in workers)
+        # Leave the coordinator's scanner slots free even before it has claimed them
+        pinned = max(pinned, self.cfg.SCANNER_COUNT)
+        return math.ceil(max(0, accounts - pinned) / len(workers))
+
+    async def heartbeat(self):
+        now = time.time()
+        ttl = self.cfg.LEASE_TTL_SEC
+        async with async_session() as s:
+            repo = LeaseRepository(s)
+            await repo.renew(self.owner, ttl, now)
+            if self.role == "worker":
+                await repo.acquire([WORKER_KEY + self.owner], self.owner, ttl, now)
+            accounts = sorted(a.id for a in await AccountRepository(s).get_all_non_blacklisted())
+            leases = await repo.live(ACCOUNT_KEY, now)
+            workers = set((await repo.live(WORKER_KEY, now)).values()) | {self.owner}
+
+            live_ids = set(accounts)
+            held = {int(k[len(ACCOUNT_KEY):]) for k, owner in leases.items() if owner == self.owner}
+            # Blacklisted or removed accounts are not worth holding
+            drop = sorted(held - live_ids)
+            held &= live_ids
+            target = self._target(len(accounts), leases, workers)
+            if len(held) > target:
+                drop += sorted(held)[target:]
+                held = set(sorted(held)[:target])
+            if drop:
+                await repo.release(self.owner, [f"{ACCOUNT_KEY}{i}" for i in drop])
+            if len(held) < target:
+                free = [i for i in accounts if f"{ACCOUNT_KEY}{i}" not in leases]
+                claimed = await repo.acquire([f"{ACCOUNT_KEY}{i}" for i in free[:target - len(held)]],
+                                             self.owner, ttl, now)
+                held |= {int(k[len(ACCOUNT_KEY):]) for k in claimed}
+        self._renewed_at = now
+        await self._apply(held)
+
+    async def _apply(self, held: Set[int]):
+        gained, lost = held - self.held, self.held - held
+        if not gained and not lost:
+            return
+        self.held = held
+        self.account_service.owned = set(held)
+        self.account_service.accounts_version += 1
+        print(f"[Lease] {self.owner}: {len(held)} accounts (+{len(gained)} -{len(lost)})")
+        for acc_id in lost:
+            await self.account_service.evict_client(acc_id)
+        if gained:
+            if self._warm_up is None or self._warm_up.done():
+                self._warm_up = asyncio.create_task(self.account_service.warm_up())
+            if self.on_gained is not None:
+                self.on_gained(gained)
+
+    async def run(self):
+        try:
+            while True:
+                try:
+                    await self.heartbeat()
+                except Exception as e:
+                    print(f"[Lease] heartbeat failed: {e}")
+                    # Unrenewed leases may already belong to someone else: stop using them
+                    if time.time() - self._renewed_at > self.cfg.LEASE_TTL_SEC:
+                        await self._apply(set())
+                await asyncio.sleep(self.cfg.LEASE_HEARTBEAT_SEC)
+        finally:
+            if self._warm_up is not None:
+                self._warm_up.cancel()
+            # Hand everything back at once instead of making the others wait for the TTL
+            async with async_session() as s:
+                await LeaseRepository(s).release(self.owner)
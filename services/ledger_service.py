@@ -0,0 +1,168 @@
+from config.settings import CFG
+from database.engine import async_session
+from database.unit_of_work import PurchaseUnitOfWork
+from typing import List, NamedTuple, Optional, Tuple
+from utils.metrics import DB_COMMIT_SECONDS, QUEUE_DEPTH
+import asyncio
+import time
+
+
+class RecordPurchase(NamedTuple):
+    account_id: int
+    user_id: int
+    gift_type_id: int  # resolved through GiftCatalog: no gifttype lookup in the transaction
+    price: int
+    meta: dict
+    reservation_id: int  # the ReserveFunds unit that paid for it
+    parked: bool = False  # a retry of a booking whose reservation was parked
+
+    async def apply(self, uow: PurchaseUnitOfWork):
+        return await uow.record_purchase(*self)
+
+
+class ReserveFunds(NamedTuple):
+    owner: str
+    units: Tuple[Tuple[int, int], ...]  # (user id, price) per planned purchase
+
+    async def apply(self, uow: PurchaseUnitOfWork):
+        return await uow.reserve_funds(*self)
+
+
+class ReleaseFunds(NamedTuple):
+    reservation_ids: Tuple[int, ...]  # reserved units no purchase spent
+
+    async def apply(self, uow: PurchaseUnitOfWork):
+        return await uow.release_funds(self.reservation_ids)
+
+
+class ReclaimFunds(NamedTuple):
+    owner: str
+    include_own: bool
+    live_prefix: Optional[str]
+    now: float
+
+    async def apply(self, uow: PurchaseUnitOfWork):
+        return await uow.reclaim_funds(*self)
+
+
+class ApplyDeposit(NamedTuple):
+    tg_id: int
+    amount: int
+    commission_rate: float
+
+    async def apply(self, uow: PurchaseUnitOfWork):
+        return await uow.apply_deposit(*self)
+
+
+class EnsureUser(NamedTuple):
+    tg_id: int
+
+    async def apply(self, uow: PurchaseUnitOfWork):
+        return await uow.ensure_user(self.tg_id)
+
+
+class MarkDelivered(NamedTuple):
+    purchase_id: int
+
+    async def apply(self, uow: PurchaseUnitOfWork):
+        return await uow.mark_delivered(self.purchase_id)
+
+
+class LedgerService:
+    """
+    The single writer of balances, purchases and deliveries (main starts run()).
+
+    Callers submit a command and await its future, which resolves with the command's
+    result once the transaction holding it has committed. The writer takes the first
+    queued command, waits up to LEDGER_BATCH_MS for more (at most LEDGER_BATCH_MAX) and
+    applies the group in one PurchaseUnitOfWork: one write lock and one fsync for the
+    group instead of one per caller. If the group fails, its commands are retried one
+    by one, so a bad command only fails its own future.
+
+    A caller that is cancelled while waiting doesn't withdraw its command: a purchase
+    that went through on Telegram is still booked. On shutdown the group in flight and
+    everything still queued are committed before the writer exits.
+    """
+
+    def __init__(self):
+        self.cfg = CFG
+        self._queue: asyncio.Queue = asyncio.Queue()
+        self._stopped = False
+        QUEUE_DEPTH.labels("ledger").set_function(self._queue.qsize)
+
+    def submit(self, command) -> asyncio.Future:
+        if self._stopped:
+            raise RuntimeError("ledger writer stopped")
+        done = asyncio.get_running_loop().create_future()
+        self._queue.put_nowait((command, done))
+        return done
+
+    def _drain(self, limit: int) -> List[Tuple[object, asyncio.Future]]:
+        items = []
+        while len(items) < limit and not self._queue.empty():
+            items.append(self._queue.get_nowait())
+        return items
+
+    async def _collect(self, group: List[Tuple[object, asyncio.Future]]):
+        """Fill group in place, so commands taken off the queue survive a cancellation."""
+        limit = max(1, self.cfg.LEDGER_BATCH_MAX)
+        group.append(await self._queue.get())
+        deadline = time.monotonic() + self.cfg.LEDGER_BATCH_MS / 1000
+        while len(group) < limit:
+            group += self._drain(limit - len(group))
+            wait = deadline - time.monotonic()
+            if len(group) >= limit or wait <= 0:
+                break
+            try:
+                group.append(await asyncio.wait_for(self._queue.get(), wait))
+            except asyncio.TimeoutError:
+                break
+
+    async def _apply(self, group):
+        with DB_COMMIT_SECONDS.time():
+            async with async_session() as s:
+                uow = PurchaseUnitOfWork(s)
+                results = [await command.apply(uow) for command, _ in group]
+                await uow.commit()
+        return results
+
+    async def _commit(self, group):
+        try:
+            results = await self._apply(group)
+        except Exception as e:
+            if len(group) > 1:
+                print(f"[Ledger] group of {len(group)} failed ({e}), retrying one by one")
+                for item in group:
+                    await self._commit([item])
+                return
+            command, done = group[0]
+            print(f"[Ledger] {type(command).__name__} failed: {e}")
+            if not done.done():
+                done.set_exception(e)
+            return
+        for (_, done), result in zip(group, results):
+            if not done.done():
+                done.set_result(result)
+
+    async def run(self):
+        group, commit = [], None
+        try:
+            while True:
+                await self._collect(group)
+                # Shielded: cancellation never lands between a group's commit and its futures
+                commit = asyncio.ensure_future(self._commit(group))
+                group = []
+                await asyncio.shield(commit)
+                commit = None
+        except asyncio.CancelledError:
+            self._stopped = True
+            if commit is not None:
+                await commit
+            rest = group + self._drain(self._queue.qsize())
+            if rest:
+                await self._commit(rest)
+            raise
+        finally:
+            self._stopped = True
+            for _, done in self._drain(self._queue.qsize()):
+                done.cancel()
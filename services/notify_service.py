@@ -0,0 +1,127 @@
+from config.settings import CFG, admin_ids
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+from models.market_gift import MarketGift
+import asyncio
+
+# Telegram rejects messages longer than 4096 characters
+MAX_MESSAGE_LEN = 4096
+
+
+class AdminNotifyService:
+    """
+    Market broadcasts to admins, off the purchase path.
+
+    publish() only stores the latest catalog; run() coalesces bursts over
+    NOTIFY_COALESCE_SEC, diffs against the last broadcast (new gifts, price
+    changes, large remaining drops), sends the diff to all admins concurrently
+    and keeps one pinned status message per admin up to date by editing it.
+    """
+
+    def __init__(self):
+        self.cfg = CFG
+        self._latest: List[MarketGift] = []
+        self._pending = asyncio.Event()
+        self._last_broadcast: Dict[str, MarketGift] = {}
+        self._status_msgs: Dict[int, int] = {}  # admin id -> pinned status message id
+
+    def publish(self, gifts: List[MarketGift]):
+        if not admin_ids():
+            return
+        self._latest = gifts
+        self._pending.set()
+
+    async def run(self):
+        while True:
+            await self._pending.wait()
+            # Let the burst settle; later publish() calls just replace the snapshot
+            await asyncio.sleep(self.cfg.NOTIFY_COALESCE_SEC)
+            self._pending.clear()
+            await self._broadcast(self._latest)
+
+    def _diff(self, gifts: List[MarketGift]) -> List[Tuple[MarketGift, str]]:
+        """(gift, line) for every gift worth reporting against the last broadcast."""
+        lines = []
+        for g in gifts:
+            old = self._last_broadcast.get(g.code)
+            if old is None:
+                lines.append((g, f"🆕 {g.code} | {g.title} — {g.price_stars}⭐ | остаток≈{g.remaining}"))
+            elif old.price_stars != g.price_stars:
+                lines.append((g, f"💱 {g.code} | {g.title} — цена {old.price_stars}⭐ → {g.price_stars}⭐"))
+            elif old.remaining - g.remaining >= max(1, old.remaining * self.cfg.NOTIFY_REMAINING_DROP_RATIO):
+                lines.append((g, f"📉 {g.code} | {g.title} — остаток {old.remaining} → {g.remaining}"))
+        return lines
+
+    @staticmethod
+    def _status_text(gifts: List[MarketGift]) -> str:
+        lines = ["📢 Рынок (актуально):"]
+        for g in gifts:
+            lines.append(f"• {g.code} | {g.title} — {g.price_stars}⭐ | остаток≈{g.remaining}")
+        return _truncate("\n".join(lines))
+
+    async def _broadcast(self, gifts: List[MarketGift]):
+        changes = self._diff(gifts)
+        if not changes:
+            return
+        # Only what was actually broadcast becomes the new baseline, so small drops add up;
+        # gifts gone from the catalog are forgotten and reported as new if they come back
+        current = {g.code for g in gifts}
+        baseline = {code: g for code, g in self._last_broadcast.items() if code in current}
+        baseline.update((g.code, g) for g, _ in changes)
+        alert = _truncate("📢 Обновление рынка:\n" + "\n".join(line for _, line in changes))
+        status = self._status_text(gifts)
+        sent = await asyncio.gather(*(self._notify_admin(admin_id, alert, status) for admin_id in admin_ids()))
+        # Nobody got the alert: keep the old baseline, so the next broadcast reports these changes again
+        if any(sent):
+            self._last_broadcast = baseline
+
+    async def _notify_admin(self, admin_id: int, alert: str, status: str) -> bool:
+        """Send the alert and refresh the status message; True when the alert was delivered."""
+        # The bot stack is imported on first broadcast: workers and CLI paths never load it
+        from bot.dispatcher import get_bot
+        bot = get_bot()
+        try:
+            await self._call(lambda: bot.send_message(admin_id, alert))
+        except Exception as e:
+            print(f"[AdminNotify] admin {admin_id}: {e}")
+            return False
+        try:
+            await self._update_status(admin_id, status)
+        except Exception as e:
+            print(f"[AdminNotify] admin {admin_id}: status update failed: {e}")
+        return True
+
+    async def _update_status(self, admin_id: int, status: str):
+        from aiogram.exceptions import TelegramBadRequest
+        from bot.dispatcher import get_bot
+        bot = get_bot()
+        msg_id = self._status_msgs.get(admin_id)
+        if msg_id is not None:
+            try:
+                await self._call(lambda: bot.edit_message_text(status, chat_id=admin_id, message_id=msg_id))
+                return
+            except TelegramBadRequest as e:
+                if "not modified" in str(e):
+                    return
+                # Status message deleted or too old to edit: post a fresh one
+        msg = await self._call(lambda: bot.send_message(admin_id, status, disable_notification=True))
+        self._status_msgs[admin_id] = msg.message_id
+        try:
+            await self._call(lambda: bot.pin_chat_message(admin_id, msg.message_id, disable_notification=True))
+        except TelegramBadRequest as e:
+            print(f"[AdminNotify] admin {admin_id}: cannot pin status message: {e}")
+
+    async def _call(self, request: Callable[[], Awaitable], attempts: Optional[int] = None):
+        """Run a Bot API call, sleeping out flood-control retry_after instead of dropping it."""
+        from aiogram.exceptions import TelegramRetryAfter
+        attempts = attempts or self.cfg.NOTIFY_MAX_ATTEMPTS
+        for attempt in range(attempts):
+            try:
+                return await request()
+            except TelegramRetryAfter as e:
+                if attempt == attempts - 1:
+                    raise
+                await asyncio.sleep(e.retry_after)
+
+
+def _truncate(text: str) -> str:
+    return text if len(text) <= MAX_MESSAGE_LEN else text[:MAX_MESSAGE_LEN - 1] + "…"
@@ -1,183 +1,407 @@
-from config.settings import CFG, ADMIN_IDS
-from database.engine import engine
-from sqlmodel import Session, select
-from services.market_service import MarketService
-from services.account_service import AccountService
-from database.repositories.user_repo import UserRepository
-from database.repositories.deposit_repo import DepositRepository
-from database.repositories.account_repo import AccountRepository
-from database.repositories.gift_type_repo import GiftTypeRepository
-from database.repositories.purchase_repo import PurchaseRepository
-from bot.dispatcher import bot
-from typing import List, Optional
-from models.market_gift import MarketGift
-from models.user import User
-from models.account import Account
-import asyncio
-import math
-import json
-
-class PurchaseService:
-    def __init__(self, market_service: MarketService, account_service: AccountService):
-        self.market_service = market_service
-        self.account_service = account_service
-        self.cfg = CFG
-
-    async def purchase_loop(self):
-        while True:
-            await self.account_service.scan_sessions()
-
-            with Session(engine) as s:
-                account_repo = AccountRepository(s)
-                non_blacklisted_accs = account_repo.get_all_non_blacklisted()
-                all_accs = account_repo.get_all()
-                purchase_ids = [acc.id for acc in non_blacklisted_accs]
-
-                # Choose scanner account: prefer non-blacklisted, otherwise fall back to any
-                if non_blacklisted_accs:
-                    scanner_acc = account_repo.get_by_id(non_blacklisted_accs[0].id)
-                else:
-                    if not all_accs:
-                        print(f"No accounts in DB. Put .session files into {self.cfg.SESSIONS_DIR}")
-                        await asyncio.sleep(self.cfg.SCAN_INTERVAL_SEC)
-                        continue
-                    scanner_acc = account_repo.get_by_id(all_accs[0].id)
-                gifts_sorted = []
-                try:
-                    scanner_client = await self.account_service.get_client(scanner_acc)
-                    gifts = await self.market_service.fetch_market(scanner_client)
-                    print(gifts)
-                    gift_type_repo = GiftTypeRepository(s)
-                    for g in gifts:
-                        gift_type_repo.create_or_update(g.code, g.title, g.price_stars, g.remaining)
-                    if self.cfg.NOTIFY_ADMINS:
-                        await self._notify_admins(gifts)
-
-                    if self.cfg.PURCHASE_MODE == "limited":
-                        gifts_sorted = sorted(gifts, key=lambda x: (x.remaining, -x.price_stars))
-                    else:
-                        gifts_sorted = sorted(gifts, key=lambda x: -x.price_stars)
-
-                except Exception as e:
-                    await self.account_service.blacklist_account(scanner_acc, f"scanner_connect_error: {e}", account_repo)
-                    await asyncio.sleep(self.cfg.SCAN_INTERVAL_SEC)
-                    continue
-
-            # Perform purchases only on non-blacklisted accounts
-            for acc_id in purchase_ids:
-                with Session(engine) as s:
-                    account_repo = AccountRepository(s)
-                    acc = account_repo.get_by_id(acc_id)
-                    if acc.stars_wallet >= self.cfg.MAX_STARS_PER_ACCOUNT:
-                        continue
-
-                    try:
-                        client = await self.account_service.get_client(acc)
-                    except Exception as e:
-                        await self.account_service.blacklist_account(acc, f"connect_error: {e}", account_repo)
-                        continue
-
-                    user_repo = UserRepository(s)
-                    users = user_repo.get_all()
-                    users_sorted = sorted(users, key=lambda u: (-u.total_contributed, u.id))
-
-                    gift_type_repo = GiftTypeRepository(s)
-                    purchase_repo = PurchaseRepository(s)
-                    deposit_repo = DepositRepository(s)
-
-                    for g in gifts_sorted:
-                        if g.remaining <= 0:
-                            continue
-
-                        price = g.price_stars
-                        spendable = self.cfg.MAX_STARS_PER_ACCOUNT - acc.stars_wallet
-                        if spendable < price:
-                            continue
-
-                        chosen_user: Optional[User] = None
-                        for u in users_sorted:
-                            if u.stars_balance >= price:
-                                chosen_user = u
-                                break
-                        if not chosen_user:
-                            continue
-
-                        ok, meta = await self.market_service.purchase_gift(client, g.code)
-                        if not ok:
-                            continue
-
-                        gt = gift_type_repo.get_by_code(g.code)
-                        purchase_repo.create_purchase(gt.id, acc.id, price, chosen_user.id, meta)
-
-                        gift_type_repo.decrement_remaining(gt)
-                        acc.stars_wallet += price
-                        chosen_user.stars_balance -= price
-
-                        account_repo.update(acc)
-                        user_repo.update(chosen_user)
-
-                        deposit_repo.apply_realization_fifo(chosen_user.id, price)
-
-                    await asyncio.sleep(self.cfg.BATCH_PURCHASE_SLEEP_MS / 1000)
-
-            await asyncio.sleep(self.cfg.SCAN_INTERVAL_SEC)
-
-    async def _notify_admins(self, gifts: List[MarketGift]):
-        if not ADMIN_IDS:
-            return
-        lines = ["📢 Обновление рынка:"]
-        for g in gifts:
-            lines.append(f"• {g.code} | {g.title} — {g.price_stars}⭐ | остаток≈{g.remaining}")
-        text = "\n".join(lines)
-        for admin_id in ADMIN_IDS:
-            try:
-                await bot.send_message(admin_id, text)
-            except Exception:
-                pass
-
-    async def delivery_loop(self):
-        while True:
-            with Session(engine) as s:
-                purchase_repo = PurchaseRepository(s)
-                pend = purchase_repo.get_pending()
-                user_repo = UserRepository(s)
-                account_repo = AccountRepository(s)
-                for p in pend:
-                    user = user_repo.get_by_id(p.owner_user_id)  # Assume added get_by_id to user_repo
-                    if not user:
-                        continue
-                    account = account_repo.get_by_id(p.account_id)
-                    if not account:
-                        continue
-                    try:
-                        client = await self.account_service.get_client(account)
-                    except Exception:
-                        continue
-
-                    sticker_id: Optional[int] = None
-                    if p.ext_payload:
-                        try:
-                            payload = json.loads(p.ext_payload)
-                            sticker_id = int(payload.get("sticker_id")) if payload.get("sticker_id") is not None else None
-                        except Exception:
-                            sticker_id = None
-                    if sticker_id is None:
-                        continue
-
-                    ok = await self.market_service.send_gift_to_user(client, user.tg_id, sticker_id)
-                    if ok:
-                        purchase_repo.mark_delivered(p)
-            await asyncio.sleep(2)
-
-    async def apply_deposit(self, tg_id: int, amount: int):
-        with Session(engine) as s:
-            user_repo = UserRepository(s)
-            u = user_repo.get_by_tg_id(tg_id)
-            if not u:
-                u = user_repo.create_or_update(tg_id)
-            provisional = math.floor(amount * self.cfg.COMMISSION_RATE + 0.5)
-            u.total_contributed += amount
-            u.stars_balance += (amount - provisional)
-            user_repo.update(u)
-            deposit_repo = DepositRepository(s)
-            deposit_repo.create_deposit(u.id, amount, self.cfg.COMMISSION_RATE)
\ No newline at end of file
+from config.settings import CFG
+from database.engine import async_session
+from services.market_service import MarketService
+from services.account_service import AccountService, ClientNotOwned
+from services.notify_service import AdminNotifyService
+from services.snipe_service import SnipeService
+from services.stock_history_service import StockHistoryService
+from services.gift_catalog import GiftCatalog
+from services.ledger_service import (
+    ApplyDeposit, EnsureUser, LedgerService, MarkDelivered, ReclaimFunds, RecordPurchase, ReleaseFunds, ReserveFunds,
+)
+from database.repositories.user_repo import UserRepository
+from database.repositories.account_repo import AccountRepository
+from database.repositories.purchase_repo import PurchaseRepository
+from database.repositories.catalog_snapshot_repo import CatalogSnapshotRepository
+from database.repositories.reservation_repo import ReservationRepository
+from typing import Dict, List, Optional, Set, Tuple
+from models.market_gift import MarketGift
+from models.user import User
+from models.account import Account
+from models.purchase import Purchase
+from services.allocation import plan_purchases, rank_gifts
+from services.scan_scheduler import ScanScheduler
+from services.scanner_group import ScannerGroup, SnapshotFeed
+from services.lease_service import WORKER_KEY
+from utils.helpers import process_owner
+from utils.metrics import (
+    DETECT_TO_PURCHASE_SECONDS, LOOP_ERRORS, PLAN_SECONDS, PURCHASES, QUEUE_DEPTH, RPC_SECONDS,
+)
+import asyncio
+import contextlib
+import json
+import logging
+import math
+import time
+
+log = logging.getLogger(__name__)
+
+class PurchaseService:
+    def __init__(self, market_service: MarketService, account_service: AccountService):
+        self.market_service = market_service
+        self.account_service = account_service
+        self.cfg = CFG
+        # Market broadcasts run in their own task (main starts admin_notify.run())
+        self.admin_notify = AdminNotifyService()
+        # Pre-fetched payment forms for SNIPE_MODE (main starts snipe.run())
+        self.snipe = SnipeService(market_service, account_service)
+        # Depletion curves of the catalog (main starts stock_history.run())
+        # code -> gifttype id/price/stock of this process; written by _catalog_changed
+        self.catalog = GiftCatalog()
+        self.stock_history = StockHistoryService(self.catalog)
+        # Single writer for purchases, deposits and deliveries (main starts ledger.run())
+        self.ledger = LedgerService()
+        # Owner of this process' reservations; those of dead processes are refunded by _reclaim_reservations
+        self.owner = process_owner()
+        self._reclaim_at = 0.0  # monotonic time of the next check
+        self._reclaimed_own = False
+        if self.cfg.SCAN_ADAPTIVE:
+            self.scan_schedule = ScanScheduler(
+                self.cfg.SCAN_INTERVAL_MIN_SEC, self.cfg.SCAN_INTERVAL_MAX_SEC, self.cfg.SCAN_BACKOFF_FACTOR)
+        else:
+            self.scan_schedule = ScanScheduler(self.cfg.SCAN_INTERVAL_SEC, self.cfg.SCAN_INTERVAL_SEC, 1.0)
+        # Staggered scanners feeding purchase_loop one ordered stream of catalog versions;
+        # a worker process reads the coordinator's published catalog instead
+        if self.cfg.ROLE == "worker":
+            self.scanners = SnapshotFeed(market_service, account_service, self.scan_schedule)
+        else:
+            self.scanners = ScannerGroup(market_service, account_service, self.scan_schedule)
+        # Catalog of the current version in planner order, reused while the catalog is unchanged
+        self._gifts_sorted: List[MarketGift] = []
+        # Ids of committed, undelivered purchases; delivery_loop consumes them
+        self._delivery_queue: asyncio.Queue = asyncio.Queue()
+        self._delivery_lanes: Dict[int, asyncio.Queue] = {}
+        self._delivery_tasks: Set[asyncio.Task] = set()
+        self._background_tasks: Set[asyncio.Task] = set()
+        # Paid purchases whose booking failed (ledger error, unknown gift type): retried every cycle.
+        # Their reservations are parked in the database, so a reclaim books them if this process dies
+        self._unbooked: List[dict] = []
+        # Gift code -> monotonic time it (re)appeared in stock, until its first committed purchase
+        self._detected_at: Dict[str, float] = {}
+        self._in_stock: Set[str] = set()
+        QUEUE_DEPTH.labels("delivery").set_function(self._delivery_queue.qsize)
+        QUEUE_DEPTH.labels("delivery_lanes").set_function(
+            lambda: sum(lane.qsize() for lane in self._delivery_lanes.values()))
+
+    async def purchase_loop(self):
+        # Session files are watched by AccountService; the scanner group reloads accounts when its set changes.
+        # A worker only sees the accounts the coordinator discovered (and its leases on them)
+        if self.cfg.ROLE != "worker":
+            await self.account_service.scan_sessions()
+        scanning = asyncio.create_task(self.scanners.run())
+        try:
+            seq = version = 0
+            unsaved: Optional[List[MarketGift]] = None  # catalog version whose DB writes haven't gone through
+            while True:
+                self.scanners.restocked.clear()
+                scan = await self.scanners.next_scan(seq)
+                seq = scan.seq
+                if scan.version != version:
+                    version = scan.version
+                    gifts = scan.gifts
+                    self._track_detections(gifts)
+                    unsaved = gifts
+
+                    if self.cfg.PURCHASE_MODE == "limited":
+                        gifts_sorted = sorted(gifts, key=lambda x: (x.remaining, -x.price_stars))
+                    else:
+                        gifts_sorted = sorted(gifts, key=lambda x: -x.price_stars)
+                    # Planner order, so snipe forms are fetched for the gifts the next plan buys first
+                    self._gifts_sorted = rank_gifts(gifts_sorted, self.cfg.ALLOCATION_PRICE_EXP,
+                                                    self.cfg.ALLOCATION_RARITY_EXP)
+                if unsaved is not None:
+                    try:
+                        await self._catalog_changed(unsaved)
+                        unsaved = None
+                    except Exception:
+                        # Buying goes on with the scanned catalog; the writes are retried after the next scan
+                        LOOP_ERRORS.labels("catalog").inc()
+                        log.exception("catalog update failed")
+                if self.cfg.ROLE == "coordinator":
+                    continue  # workers buy from the published snapshot
+                accounts = self.scanners.accounts
+                if self.cfg.SNIPE_MODE:
+                    self.snipe.set_targets(accounts, self._gifts_sorted)
+
+                try:
+                    await self._reclaim_reservations()
+                    if self._unbooked:
+                        await self._retry_unbooked()
+                    # Perform purchases only on non-blacklisted accounts, all accounts in parallel
+                    await self._run_purchase_workers(accounts, self._gifts_sorted)
+                except Exception:
+                    # A failed read or ledger command (e.g. a locked database) costs this cycle only
+                    LOOP_ERRORS.labels("cycle").inc()
+                    log.exception("purchase cycle failed")
+        finally:
+            scanning.cancel()
+
+    async def _catalog_changed(self, gifts: List[MarketGift]):
+        if self.cfg.ROLE == "worker":
+            # The coordinator wrote these gift types; only their ids are needed here
+            await self.catalog.ensure(g.code for g in gifts)
+            return
+        await self.catalog.sync(gifts)
+        if self.cfg.ROLE == "coordinator":
+            # After the gift types: a worker may record a purchase of any gift in the snapshot
+            async with async_session() as s:
+                await CatalogSnapshotRepository(s).publish(json.dumps([g.model_dump() for g in gifts]))
+        if self.cfg.NOTIFY_ADMINS:
+            self.admin_notify.publish(gifts)
+        # Off the purchase path: rings update at once, the table insert follows
+        self._spawn(self.stock_history.record(gifts))
+
+    def _spawn(self, coro):
+        task = asyncio.create_task(coro)
+        self._background_tasks.add(task)
+        task.add_done_callback(self._background_tasks.discard)
+
+    def _track_detections(self, gifts: List[MarketGift]):
+        now = time.monotonic()
+        in_stock = {g.code for g in gifts if g.remaining > 0}
+        for code in list(self._detected_at):
+            if code not in in_stock:
+                del self._detected_at[code]
+        for code in in_stock - self._in_stock:
+            self._detected_at[code] = now
+        self._in_stock = in_stock
+
+    async def _run_purchase_workers(self, accounts: List[Account], gifts_sorted: List[MarketGift]):
+        accounts = [a for a in accounts if a.stars_wallet < self.cfg.MAX_STARS_PER_ACCOUNT]
+        if not accounts or not gifts_sorted:
+            return
+        # Deposits committed after this read are funded from the next cycle's plan
+        async with async_session() as s:
+            users = await UserRepository(s).get_all()
+        with PLAN_SECONDS.time():
+            plan = plan_purchases(accounts, gifts_sorted, users, self.cfg.MAX_STARS_PER_ACCOUNT,
+                                  self.cfg.ALLOCATION_PRICE_EXP, self.cfg.ALLOCATION_RARITY_EXP)
+        plan = await self._reserve(plan)
+        # Reservations not paid for yet; whatever is left goes back when the cycle ends
+        unpaid = {reservation_id for buys in plan.values() for _, _, reservation_id in buys}
+        rpc_slots = asyncio.Semaphore(max(1, self.cfg.MAX_INFLIGHT_RPCS))
+        sold_out: Set[str] = set()
+        buying = [acc for acc in accounts if plan[acc.id]]
+        try:
+            # One failing account must not end the cycle (or purchase_loop) for the others
+            results = await asyncio.gather(*(
+                self._purchase_worker(acc, plan[acc.id], sold_out, rpc_slots, unpaid) for acc in buying
+            ), return_exceptions=True)
+            for acc, result in zip(buying, results):
+                if isinstance(result, Exception):
+                    LOOP_ERRORS.labels("worker").inc()
+                    log.error("purchase worker %s failed", acc.session_name, exc_info=result)
+        finally:
+            if unpaid:
+                await self.ledger.submit(ReleaseFunds(tuple(sorted(unpaid))))
+
+    async def _reserve(self, plan: Dict[int, List[Tuple[MarketGift, int]]]) -> Dict[int, List[Tuple[MarketGift, int, int]]]:
+        """
+        Debit the funding users of every planned unit before any payment goes out.
+
+        Every process plans against the same balances: the conditional debit decides which
+        units are really funded, and the ones a balance no longer covers are dropped. Each
+        funded unit is a Reservation row of this process: account id -> [(gift, user id,
+        reservation id)].
+        """
+        units = tuple((user_id, g.price_stars) for buys in plan.values() for g, user_id in buys)
+        if not units:
+            return {acc_id: [] for acc_id in plan}
+        reserved = iter(await self.ledger.submit(ReserveFunds(self.owner, units)))
+        funded: Dict[int, List[Tuple[MarketGift, int, int]]] = {}
+        for acc_id, buys in plan.items():
+            funded[acc_id] = []
+            for g, user_id in buys:
+                reservation_id = next(reserved)
+                if reservation_id is not None:
+                    funded[acc_id].append((g, user_id, reservation_id))
+        return funded
+
+    async def _reclaim_reservations(self):
+        """
+        Refund reservations of processes that died between reserving and booking or releasing.
+        In role all that is whatever an earlier run left (once, at startup); a worker also
+        takes those of workers whose lease expired, every LEASE_HEARTBEAT_SEC.
+        """
+        if time.monotonic() < self._reclaim_at:
+            return
+        live_prefix = WORKER_KEY if self.cfg.ROLE == "worker" else None
+        refunded, booked = await self.ledger.submit(
+            ReclaimFunds(self.owner, not self._reclaimed_own, live_prefix, time.time()))
+        self._reclaimed_own = True
+        self._reclaim_at = time.monotonic() + (self.cfg.LEASE_HEARTBEAT_SEC if live_prefix else math.inf)
+        if refunded or booked:
+            print(f"[purchase] orphaned reservations: {refunded} refunded, {len(booked)} paid ones booked")
+        for purchase_id in booked:
+            self._delivery_queue.put_nowait(purchase_id)
+
+    async def _purchase_worker(self, acc: Account, buys: List[Tuple[MarketGift, int, int]], sold_out: Set[str],
+                               rpc_slots: asyncio.Semaphore, unpaid: Set[int]):
+        async with contextlib.AsyncExitStack() as stack:
+            try:
+                client = await stack.enter_async_context(self.account_service.using(acc))
+            except ClientNotOwned:
+                return  # leased to another process since the plan was made; its reservations are released
+            except Exception as e:
+                async with async_session() as s:
+                    await self.account_service.blacklist_account(acc, f"connect_error: {e}", AccountRepository(s))
+                return
+
+            for g, user_id, reservation_id in buys:
+                # Lease lost mid-cycle, or a gift came (back) into stock: end the cycle here
+                if not self.account_service.owns(acc.id) or self.scanners.restocked.is_set():
+                    return
+                # Another account already hit the end of this gift's stock this cycle
+                if g.code in sold_out:
+                    continue
+                price = g.price_stars
+                acc.stars_wallet += price
+                try:
+                    async with rpc_slots:
+                        with RPC_SECONDS.labels(acc.session_name).time():
+                            if self.cfg.SNIPE_MODE:
+                                ok, meta = await self.snipe.buy(acc, client, g.code, price)
+                            else:
+                                ok, meta = await self.market_service.purchase_gift(client, g.code, price)
+                except Exception as e:
+                    ok, meta = False, {"error": str(e)}
+                PURCHASES.labels("ok" if ok else "failed").inc()
+                if ok:
+                    unpaid.discard(reservation_id)
+                    await self._record_purchase(acc.id, user_id, g.code, price, meta, reservation_id)
+                else:
+                    acc.stars_wallet -= price
+                    if "USAGE_LIMITED" in meta.get("error", ""):
+                        sold_out.add(g.code)
+
+                await asyncio.sleep(self.cfg.BATCH_PURCHASE_SLEEP_MS / 1000)
+
+    async def _record_purchase(self, account_id: int, user_id: int, gift_code: str, price: int, meta: dict,
+                               reservation_id: int, parked: bool = False):
+        """
+        Book the purchase through the ledger (group commit) and queue its delivery once durable.
+        The gift is already paid for: if booking fails, the payment is recorded on its reservation
+        (parked) and the booking retried every cycle.
+        """
+        try:
+            gift_type_id = await self.catalog.resolve(gift_code)
+            p = await self.ledger.submit(
+                RecordPurchase(account_id, user_id, gift_type_id, price, meta, reservation_id, parked))
+        except Exception as e:
+            LOOP_ERRORS.labels("booking").inc()
+            log.error("booking %s on account %s failed, parked for retry: %s", gift_code, account_id, e)
+            if not parked:
+                parked = await self._park(reservation_id, account_id, gift_code, meta)
+            self._unbooked.append({"account_id": account_id, "user_id": user_id, "gift_code": gift_code,
+                                   "price": price, "meta": meta, "reservation_id": reservation_id, "parked": parked})
+            return
+        if p is None:
+            return  # a reclaim already settled the parked reservation
+        self._delivery_queue.put_nowait(p.id)
+        detected_at = self._detected_at.pop(gift_code, None)
+        if detected_at is not None:
+            DETECT_TO_PURCHASE_SECONDS.observe(time.monotonic() - detected_at)
+
+    async def _park(self, reservation_id: int, account_id: int, gift_code: str, meta: dict) -> bool:
+        # Its own session, not the ledger: this runs when a ledger command just failed
+        try:
+            async with async_session() as s:
+                return await ReservationRepository(s).park(reservation_id, account_id, gift_code, meta)
+        except Exception as e:
+            LOOP_ERRORS.labels("booking").inc()
+            log.error("parking reservation %s failed: %s", reservation_id, e)
+            return False
+
+    async def _retry_unbooked(self):
+        parked, self._unbooked = self._unbooked, []
+        for entry in parked:
+            await self._record_purchase(**entry)  # kept for the next cycle if it still fails
+        if len(self._unbooked) < len(parked):
+            print(f"[purchase] booked {len(parked) - len(self._unbooked)} parked purchases")
+
+    async def delivery_loop(self):
+        # Backfill purchases left pending by a previous run, then deliver new ones as they are enqueued
+        await self._dispatch_deliveries(None)
+        while True:
+            ids = [await self._delivery_queue.get()]
+            while not self._delivery_queue.empty():
+                ids.append(self._delivery_queue.get_nowait())
+            await self._dispatch_deliveries(ids)
+
+    def backfill_deliveries(self, account_ids: Set[int]):
+        """Queue pending purchases of accounts this process just took over (LeaseService.on_gained)."""
+        self._spawn(self._dispatch_deliveries(None, account_ids))
+
+    async def _dispatch_deliveries(self, purchase_ids: Optional[List[int]], account_ids: Optional[Set[int]] = None):
+        try:
+            async with async_session() as s:
+                rows = await PurchaseRepository(s).get_pending_with_parties(purchase_ids, account_ids)
+        except Exception as e:
+            # Keeps delivery_loop alive: the same ids (or the whole backfill) come back after DELIVERY_RETRY_SEC
+            LOOP_ERRORS.labels("delivery").inc()
+            log.error("loading pending purchases failed: %s", e)
+            if purchase_ids is None:
+                asyncio.get_running_loop().call_later(
+                    self.cfg.DELIVERY_RETRY_SEC, lambda: self._spawn(self._dispatch_deliveries(None, account_ids))
+                )
+            else:
+                for purchase_id in purchase_ids:
+                    self._retry_delivery(purchase_id)
+            return
+        # One lane per account: deliveries of an account stay in order, accounts run in parallel
+        for p, user, account in rows:
+            # Another process holds this account's lease and delivers for it
+            if not self.account_service.owns(account.id):
+                continue
+            lane = self._delivery_lanes.get(account.id)
+            if lane is None:
+                lane = self._delivery_lanes[account.id] = asyncio.Queue()
+                task = asyncio.create_task(self._delivery_lane(account, lane))
+                self._delivery_tasks.add(task)
+                task.add_done_callback(self._delivery_tasks.discard)
+            lane.put_nowait((p, user))
+
+    async def _delivery_lane(self, account: Account, lane: asyncio.Queue):
+        try:
+            while not lane.empty():
+                p, user = lane.get_nowait()
+                try:
+                    await self._deliver(account, p, user)
+                except ClientNotOwned:
+                    return  # the new lease holder backfills this account's pending purchases
+                except Exception as e:
+                    LOOP_ERRORS.labels("delivery").inc()
+                    log.error("delivery of purchase %s failed: %s", p.id, e)
+                    self._retry_delivery(p.id)
+        finally:
+            self._delivery_lanes.pop(account.id, None)
+
+    async def _deliver(self, account: Account, p: Purchase, user: User):
+        sticker_id: Optional[int] = None
+        if p.ext_payload:
+            try:
+                payload = json.loads(p.ext_payload)
+                sticker_id = int(payload.get("sticker_id")) if payload.get("sticker_id") is not None else None
+            except Exception:
+                sticker_id = None
+        if sticker_id is None:
+            # Nothing to send; stays pending and is picked up again by the next startup backfill
+            return
+
+        async with self.account_service.using(account) as client:
+            ok = await self.market_service.send_gift_to_user(client, user.tg_id, sticker_id)
+        if ok:
+            await self.ledger.submit(MarkDelivered(p.id))
+        else:
+            self._retry_delivery(p.id)
+
+    def _retry_delivery(self, purchase_id: int):
+        asyncio.get_running_loop().call_later(
+            self.cfg.DELIVERY_RETRY_SEC, self._delivery_queue.put_nowait, purchase_id
+        )
+
+    async def ensure_user(self, tg_id: int) -> User:
+        return await self.ledger.submit(EnsureUser(tg_id))
+
+    async def apply_deposit(self, tg_id: int, amount: int):
+        await self.ledger.submit(ApplyDeposit(tg_id, amount, self.cfg.COMMISSION_RATE))
@@ -0,0 +1,37 @@
+from typing import Optional
+
+
+class ScanScheduler:
+    """
+    Delay until the next market scan, driven by how the catalog moves.
+
+    A changed catalog (new gift, remaining or price change) snaps the interval down to
+    min_sec; every unchanged scan multiplies it by backoff up to max_sec. Delays count
+    from the start of the previous scan, so a long purchase cycle doesn't add to them.
+    The interval is per scanner: with K scanners in rotation the next one starts after
+    interval / K.
+    """
+
+    def __init__(self, min_sec: float, max_sec: float, backoff: float):
+        self.min_sec = min_sec
+        self.max_sec = max(max_sec, min_sec)
+        self.backoff = max(backoff, 1.0)
+        self.interval = min_sec
+        self._scan_started: Optional[float] = None
+
+    def scan_started(self, now: float):
+        self._scan_started = now
+
+    def observe(self, changed: bool) -> float:
+        """Record the outcome of the scan that just ran; returns the new interval."""
+        if changed:
+            self.interval = self.min_sec
+        else:
+            self.interval = min(self.max_sec, self.interval * self.backoff)
+        return self.interval
+
+    def delay(self, now: float, scanners: int = 1) -> float:
+        step = self.interval / max(1, scanners)
+        if self._scan_started is None:
+            return step
+        return max(0.0, self._scan_started + step - now)
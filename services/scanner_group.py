@@ -0,0 +1,194 @@
+from config.settings import CFG
+from database.engine import async_session
+from database.repositories.account_repo import AccountRepository
+from database.repositories.catalog_snapshot_repo import CatalogSnapshotRepository
+from services.market_service import MarketService
+from services.account_service import AccountService, ClientNotOwned
+from services.scan_scheduler import ScanScheduler
+from models.account import Account
+from models.market_gift import MarketGift
+from telethon.errors import FloodWaitError
+from typing import Dict, List, NamedTuple, Optional, Set, Tuple
+from utils.metrics import SCAN_SECONDS
+import asyncio
+import json
+import time
+
+
+class CatalogScan(NamedTuple):
+    seq: int  # bumped by every accepted scan
+    version: int  # bumped only when the catalog content changed
+    gifts: List[MarketGift]
+
+
+class ScannerGroup:
+    """
+    Up to SCANNER_COUNT accounts poll the catalog in rotation, one dispatch every
+    interval / K: each account still scans once per interval, the group K times as often.
+
+    Results are merged into one ordered stream. A result whose scan started before the
+    last accepted one is stale and dropped; a result equal to the current catalog only
+    bumps seq. A version that brings a gift (back) into stock sets restocked, which lets
+    purchase_loop cut a running cycle short. A flood-waited, timed-out or failing scanner is benched (the next account
+    takes its slot) and a scanner that cannot connect is blacklisted, so one bad account
+    never stalls scanning.
+    """
+
+    def __init__(self, market_service: MarketService, account_service: AccountService, schedule: ScanScheduler):
+        self.market_service = market_service
+        self.account_service = account_service
+        self.schedule = schedule
+        self.cfg = CFG
+        # Non-blacklisted accounts as of the last reload; purchases run on the same objects
+        self.accounts: List[Account] = []
+        self._pool: List[Account] = []
+        self._accounts_version: Optional[int] = None
+        self._benched: Dict[int, float] = {}  # account id -> monotonic time it may scan again
+        self._busy: Set[int] = set()
+        self._cursor = 0
+        self._tasks: Set[asyncio.Task] = set()
+        self._accepted_started = float("-inf")
+        self._key: Optional[Tuple[Tuple[str, int, int], ...]] = None
+        self._latest: Optional[CatalogScan] = None
+        self._updated = asyncio.Event()
+        self._in_stock: Set[str] = set()
+        # Set by a version with newly in-stock gifts; the consumer clears it before reading
+        self.restocked = asyncio.Event()
+
+    async def _load_accounts(self):
+        if self._accounts_version == self.account_service.accounts_version:
+            return
+        self._accounts_version = self.account_service.accounts_version
+        async with async_session() as s:
+            repo = AccountRepository(s)
+            owns = self.account_service.owns
+            self.accounts = [a for a in await repo.get_all_non_blacklisted() if owns(a.id)]
+            # Prefer non-blacklisted scanners, otherwise fall back to any account
+            self._pool = self.accounts or [a for a in await repo.get_all() if owns(a.id)]
+        ids = {a.id for a in self._pool}
+        self._benched = {acc_id: until for acc_id, until in self._benched.items() if acc_id in ids}
+
+    def _rotation(self, now: float) -> List[Account]:
+        for acc_id, until in list(self._benched.items()):
+            if until <= now:
+                del self._benched[acc_id]
+        return [a for a in self._pool if a.id not in self._benched][:max(1, self.cfg.SCANNER_COUNT)]
+
+    def _bench(self, acc: Account, seconds: float, reason: str):
+        self._benched[acc.id] = time.monotonic() + seconds
+        print(f"[Scanner] {acc.session_name} out of rotation for {seconds:.0f}s: {reason}")
+
+    async def run(self):
+        try:
+            while True:
+                await self._load_accounts()
+                if not self._pool:
+                    if self.account_service.owned is not None:
+                        print("[Scanner] no leased accounts yet")
+                    else:
+                        print(f"No accounts in DB. Put .session files into {self.cfg.SESSIONS_DIR}")
+                    await asyncio.sleep(self.cfg.SCAN_INTERVAL_SEC)
+                    continue
+                now = time.monotonic()
+                rotation = self._rotation(now)
+                idle = [a for a in rotation if a.id not in self._busy]
+                if not idle:
+                    # Everyone is benched or still waiting for a response
+                    await asyncio.sleep(self.schedule.min_sec)
+                    continue
+                acc = idle[self._cursor % len(idle)]
+                self._cursor += 1
+                self.schedule.scan_started(now)
+                task = asyncio.create_task(self._scan(acc, now))
+                self._tasks.add(task)
+                task.add_done_callback(self._tasks.discard)
+                await asyncio.sleep(self.schedule.delay(time.monotonic(), len(rotation)))
+        finally:
+            for task in list(self._tasks):
+                task.cancel()
+
+    async def _scan(self, acc: Account, started: float):
+        self._busy.add(acc.id)
+        try:
+            async with self.account_service.using(acc) as client:
+                with SCAN_SECONDS.time():
+                    gifts, _ = await asyncio.wait_for(self.market_service.fetch_market(client),
+                                                      self.cfg.SCANNER_TIMEOUT_SEC)
+        except ClientNotOwned:
+            return  # lease lost since the rotation was built; the next reload drops the account
+        except FloodWaitError as e:
+            self._bench(acc, e.seconds, "flood wait")
+            return
+        except asyncio.TimeoutError:
+            self._bench(acc, self.cfg.SCANNER_COOLDOWN_SEC, "timeout")
+            return
+        except Exception as e:
+            async with async_session() as s:
+                await self.account_service.blacklist_account(acc, f"scanner_connect_error: {e}", AccountRepository(s))
+            return
+        finally:
+            self._busy.discard(acc.id)
+        if not gifts:
+            # fetch_market already logged the error
+            self._bench(acc, self.cfg.SCANNER_COOLDOWN_SEC, "fetch failed")
+            return
+        self._publish(gifts, started)
+
+    def _publish(self, gifts: List[MarketGift], started: float):
+        # A scan dispatched later has already reported: this snapshot may predate it
+        if started < self._accepted_started:
+            return
+        self._accepted_started = started
+        key = tuple((g.code, g.price_stars, g.remaining) for g in gifts)
+        changed = key != self._key
+        self.schedule.observe(changed)
+        latest = self._latest
+        if changed or latest is None:
+            self._key = key
+            version = (latest.version if latest else 0) + 1
+            in_stock = {g.code for g in gifts if g.remaining > 0}
+            if latest is not None and in_stock - self._in_stock:
+                self.restocked.set()
+            self._in_stock = in_stock
+        else:
+            version, gifts = latest.version, latest.gifts
+        self._latest = CatalogScan((latest.seq if latest else 0) + 1, version, gifts)
+        self._updated.set()
+        self._updated = asyncio.Event()
+
+    async def next_scan(self, after_seq: int) -> CatalogScan:
+        """The newest accepted scan with seq > after_seq; scans accepted meanwhile are coalesced."""
+        while self._latest is None or self._latest.seq <= after_seq:
+            await self._updated.wait()
+        return self._latest
+
+
+class SnapshotFeed(ScannerGroup):
+    """
+    ScannerGroup for ROLE=worker: the same account view and CatalogScan stream, but the
+    catalog is the coordinator's CatalogSnapshot, polled every WORKER_CATALOG_POLL_SEC.
+    Every poll is a scan (seq), so purchase cycles keep running on an unchanged catalog.
+    """
+
+    async def run(self):
+        seen: Optional[int] = None
+        gifts: List[MarketGift] = []
+        while True:
+            await self._load_accounts()
+            try:
+                async with async_session() as s:
+                    repo = CatalogSnapshotRepository(s)
+                    version = await repo.version()
+                    if version is not None and version != seen:
+                        snapshot = await repo.get()
+                        seen = snapshot.version
+                        gifts = [MarketGift(**g) for g in json.loads(snapshot.gifts)]
+            except Exception as e:
+                print(f"[Scanner] catalog snapshot read failed: {e}")
+            if gifts:
+                self._publish(gifts, time.monotonic())
+            elif seen is None:
+                print("[Scanner] waiting for the coordinator's first catalog snapshot")
+                await asyncio.sleep(self.cfg.SCAN_INTERVAL_SEC)
+                continue
+            await asyncio.sleep(self.cfg.WORKER_CATALOG_POLL_SEC)
@@ -0,0 +1,107 @@
+from config.settings import CFG
+from services.market_service import MarketService
+from services.account_service import AccountService
+from models.account import Account
+from models.market_gift import MarketGift
+from telethon import TelegramClient
+from utils.tl_utils import _RawSendStarsForm
+from typing import Dict, List, Tuple
+import asyncio
+import time
+
+
+class _PreparedForm:
+    __slots__ = ("request", "price", "expires_at")
+
+    def __init__(self, request: _RawSendStarsForm, price: int, expires_at: float):
+        self.request = request
+        self.price = price
+        self.expires_at = expires_at
+
+
+class SnipeService:
+    """
+    Keeps a ready payments.sendStarsForm per (account, target gift) so a buy is one RPC.
+
+    set_targets() takes the priority-sorted catalog; the first SNIPE_FORM_GIFTS gifts in
+    stock become targets. run() fetches missing forms and re-fetches those that expire
+    within SNIPE_FORM_REFRESH_SEC. A form is single-use: buy() takes it and wakes run()
+    to prepare a replacement. Without a usable form buy() falls back to the two-RPC path.
+    """
+
+    def __init__(self, market_service: MarketService, account_service: AccountService):
+        self.market_service = market_service
+        self.account_service = account_service
+        self.cfg = CFG
+        self._forms: Dict[Tuple[int, str], _PreparedForm] = {}
+        self._accounts: Dict[int, Account] = {}
+        self._targets: Dict[str, int] = {}  # gift code -> catalog price
+        self._wake = asyncio.Event()
+
+    def set_targets(self, accounts: List[Account], gifts_sorted: List[MarketGift]):
+        in_stock = [g for g in gifts_sorted if g.remaining > 0][:self.cfg.SNIPE_FORM_GIFTS]
+        targets = {g.code: g.price_stars for g in in_stock}
+        account_map = {a.id: a for a in accounts}
+        if targets == self._targets and account_map.keys() == self._accounts.keys():
+            return
+        self._targets = targets
+        self._accounts = account_map
+        # Forms for gifts that left the targets, changed price, or whose account is gone are useless
+        for key, form in list(self._forms.items()):
+            acc_id, code = key
+            if acc_id not in account_map or targets.get(code) != form.price:
+                del self._forms[key]
+        self._wake.set()
+
+    async def run(self):
+        if not self.cfg.SNIPE_MODE:
+            return
+        while True:
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout=self.cfg.SNIPE_FORM_REFRESH_SEC)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+            await self._refresh()
+
+    async def _refresh(self):
+        horizon = time.monotonic() + self.cfg.SNIPE_FORM_REFRESH_SEC
+        stale = []
+        for acc in list(self._accounts.values()):
+            for code, price in list(self._targets.items()):
+                # No point holding a form the account could not pay under its wallet cap
+                if acc.stars_wallet + price > self.cfg.MAX_STARS_PER_ACCOUNT:
+                    continue
+                form = self._forms.get((acc.id, code))
+                if form is None or form.expires_at <= horizon:
+                    stale.append((acc, code))
+        if not stale:
+            return
+        slots = asyncio.Semaphore(max(1, self.cfg.SNIPE_PREFETCH_CONCURRENCY))
+
+        async def prepare(acc: Account, code: str):
+            async with slots:
+                try:
+                    async with self.account_service.using(acc) as client:
+                        request, amount = await self.market_service.prepare_gift_form(client, code)
+                except Exception as e:
+                    print(f"[Snipe] form {acc.session_name}/{code} failed: {e}")
+                    return
+            # Targets may have changed while the form was in flight
+            if acc.id in self._accounts and self._targets.get(code) == amount:
+                expires_at = time.monotonic() + self.cfg.SNIPE_FORM_TTL_SEC
+                self._forms[(acc.id, code)] = _PreparedForm(request, amount, expires_at)
+
+        await asyncio.gather(*(prepare(acc, code) for acc, code in stale))
+
+    async def buy(self, acc: Account, client: TelegramClient, gift_code: str, price: int) -> Tuple[bool, dict]:
+        form = self._forms.pop((acc.id, gift_code), None)
+        if gift_code in self._targets:
+            self._wake.set()
+        if form is None or form.price != price or form.expires_at <= time.monotonic():
+            return await self.market_service.purchase_gift(client, gift_code, price)
+        ok, meta = await self.market_service.send_gift_form(client, form.request)
+        if not ok and "FORM" in meta.get("error", ""):
+            # The server dropped the form before our TTL: buy through a fresh one
+            return await self.market_service.purchase_gift(client, gift_code, price)
+        return ok, meta
@@ -0,0 +1,150 @@
+from config.settings import CFG
+from database.engine import async_session
+from database.repositories.stock_history_repo import StockHistoryRepository
+from models.market_gift import MarketGift
+from services.gift_catalog import GiftCatalog
+from array import array
+from typing import Dict, Iterator, List, Optional, Tuple
+import asyncio
+import time
+
+# MarketGift.remaining of gifts without a supply limit
+UNLIMITED = 999999
+
+
+class _Ring:
+    """Fixed-capacity ring of (ts, remaining) samples in two flat arrays: 16 bytes per sample."""
+    __slots__ = ("ts", "remaining", "start", "size")
+
+    def __init__(self, capacity: int):
+        self.ts = array("d", [0.0]) * capacity
+        self.remaining = array("q", [0]) * capacity
+        self.start = 0
+        self.size = 0
+
+    def append(self, ts: float, remaining: int):
+        capacity = len(self.ts)
+        i = (self.start + self.size) % capacity
+        self.ts[i] = ts
+        self.remaining[i] = remaining
+        if self.size < capacity:
+            self.size += 1
+        else:
+            self.start = (self.start + 1) % capacity
+
+    def newest_first(self) -> Iterator[Tuple[float, int]]:
+        capacity = len(self.ts)
+        for k in range(self.size - 1, -1, -1):
+            i = (self.start + k) % capacity
+            yield self.ts[i], self.remaining[i]
+
+
+class StockHistoryService:
+    """
+    Depletion history of gift stock.
+
+    record() is fed every changed catalog and stores a sample only for gifts whose
+    remaining or price changed: appended to the stocksample table and to a per-gift
+    in-memory ring of the last STOCK_HISTORY_RING_SIZE samples. Rings exist only for
+    gifts in the current catalog, so memory is bounded by catalog size, not uptime.
+    sell_rate()/eta_sell_out() answer from the rings; run() reloads them after a restart
+    and downsamples / purges old table rows.
+    """
+
+    def __init__(self, catalog: GiftCatalog):
+        self.cfg = CFG
+        self.catalog = catalog  # gift type ids; record() runs after the catalog was synced
+        self._rings: Dict[str, _Ring] = {}
+        self._last: Dict[str, Tuple[int, int]] = {}  # code -> (remaining, price) last recorded
+
+    def _ring(self, code: str) -> _Ring:
+        ring = self._rings.get(code)
+        if ring is None:
+            ring = self._rings[code] = _Ring(max(2, self.cfg.STOCK_HISTORY_RING_SIZE))
+        return ring
+
+    async def record(self, gifts: List[MarketGift], now: Optional[float] = None):
+        now = time.time() if now is None else now
+        changed = [g for g in gifts if self._last.get(g.code) != (g.remaining, g.price_stars)]
+        in_catalog = {g.code for g in gifts}
+        for code in [c for c in self._rings if c not in in_catalog]:
+            del self._rings[code]
+            self._last.pop(code, None)
+        if not changed:
+            return
+        for g in changed:
+            self._ring(g.code).append(now, g.remaining)
+            self._last[g.code] = (g.remaining, g.price_stars)
+        try:
+            await self.catalog.ensure(g.code for g in changed)
+            ids = {g.code: self.catalog.id_of(g.code) for g in changed}
+            async with async_session() as s:
+                await StockHistoryRepository(s).append([
+                    {"gift_type_id": ids[g.code], "ts": int(now),
+                     "remaining": g.remaining, "price_stars": g.price_stars}
+                    for g in changed if ids[g.code] is not None
+                ])
+        except Exception as e:
+            # The in-memory rings are already updated; only the persisted curve misses this sample
+            print(f"[StockHistory] append failed: {e}")
+
+    def sell_rate(self, code: str, window_sec: float, now: Optional[float] = None) -> Optional[float]:
+        """Units sold per second over the last window_sec (restocks ignored); None without history."""
+        ring = self._rings.get(code)
+        if ring is None or ring.size == 0:
+            return None
+        now = time.time() if now is None else now
+        cutoff = now - window_sec
+        sold = 0
+        oldest = now
+        newer: Optional[int] = None
+        for ts, remaining in ring.newest_first():
+            if newer is not None and remaining > newer:
+                sold += remaining - newer
+            oldest = ts
+            newer = remaining
+            # The first sample before the window is the baseline of the first change inside it
+            if ts < cutoff:
+                break
+        span = now - max(oldest, cutoff)
+        return sold / max(span, 1.0)
+
+    def eta_sell_out(self, code: str, window_sec: float, now: Optional[float] = None) -> Optional[float]:
+        """Seconds until remaining reaches 0 at the current sell rate; None if not depleting."""
+        last = self._last.get(code)
+        if last is None or last[0] <= 0 or last[0] >= UNLIMITED:
+            return None
+        rate = self.sell_rate(code, window_sec, now)
+        if not rate:
+            return None
+        return last[0] / rate
+
+    async def warm_up(self):
+        """Refill the rings from recent table rows so rates survive a restart."""
+        since = int(time.time() - self.cfg.STOCK_RATE_WINDOW_SEC * 2)
+        async with async_session() as s:
+            rows = await StockHistoryRepository(s).since(since)
+        live = set(self._rings)  # already fed by record(): don't mix older samples into them
+        for code, ts, remaining, price in rows:
+            if code in live:
+                continue
+            self._ring(code).append(float(ts), remaining)
+            self._last[code] = (remaining, price)
+
+    async def run(self):
+        await self.warm_up()
+        while True:
+            await asyncio.sleep(self.cfg.STOCK_HISTORY_MAINTAIN_SEC)
+            try:
+                now = int(time.time())
+                async with async_session() as s:
+                    repo = StockHistoryRepository(s)
+                    merged = await repo.downsample(now - self.cfg.STOCK_HISTORY_RAW_SEC,
+                                                   self.cfg.STOCK_HISTORY_BUCKET_SEC)
+                    purged = 0
+                    if self.cfg.STOCK_HISTORY_RETENTION_DAYS > 0:
+                        purged = await repo.purge(now - self.cfg.STOCK_HISTORY_RETENTION_DAYS * 86400)
+                if merged or purged:
+                    print(f"[StockHistory] downsampled {merged}, purged {purged} samples")
+            except Exception as e:
+                print(f"[StockHistory] maintenance failed: {e}")
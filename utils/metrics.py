@@ -0,0 +1,290 @@
+"""
+In-process metrics: counters, gauges and fixed-bucket histograms, rendered in the
+Prometheus text exposition format and served on a local aiohttp /metrics endpoint.
+
+With METRICS_ENABLED off every metric is the shared _NullMetric, whose methods do
+nothing; instrumented code pays one no-op method call per observation.
+
+Metrics are declared at import but built on first use, when METRICS_ENABLED is read:
+importing this module loads neither the settings nor aiohttp.
+"""
+from config.settings import CFG
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+import asyncio
+import bisect
+import contextlib
+import time
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+# Seconds; tuned for RPCs / commits (ms range) up to a full scan cycle
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _labels(names: Sequence[str], values: Sequence[str]) -> str:
+    if not names:
+        return ""
+    pairs = ",".join(f'{n}="{_escape(v)}"' for n, v in zip(names, values))
+    return "{" + pairs + "}"
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+class _Timer:
+    __slots__ = ("_metric", "_start")
+
+    def __init__(self, metric: "Histogram"):
+        self._metric = metric
+
+    def __enter__(self):
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self._metric.observe(time.perf_counter() - self._start)
+        return False
+
+
+class _Metric:
+    TYPE = ""
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._children: Dict[Tuple[str, ...], "_Metric"] = {}
+
+    def labels(self, *values) -> "_Metric":
+        key = tuple(str(v) for v in values)
+        child = self._children.get(key)
+        if child is None:
+            child = self._children[key] = self._child()
+        return child
+
+    def _child(self) -> "_Metric":
+        raise NotImplementedError
+
+    def _series(self) -> List[Tuple[Tuple[str, ...], "_Metric"]]:
+        return list(self._children.items()) if self.labelnames else [((), self)]
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.TYPE}"]
+        for values, child in self._series():
+            lines.extend(child._samples(self.name, self.labelnames, values))
+        return lines
+
+
+class Counter(_Metric):
+    TYPE = "counter"
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.value = 0.0
+
+    def _child(self):
+        return Counter(self.name, self.help)
+
+    def inc(self, amount: float = 1.0):
+        self.value += amount
+
+    def _samples(self, name, labelnames, values):
+        return [f"{name}_total{_labels(labelnames, values)} {self.value}"]
+
+
+class Gauge(_Metric):
+    TYPE = "gauge"
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.value = 0.0
+        self._fn: Optional[Callable[[], float]] = None
+
+    def _child(self):
+        return Gauge(self.name, self.help)
+
+    def set(self, value: float):
+        self.value = value
+
+    def inc(self, amount: float = 1.0):
+        self.value += amount
+
+    def dec(self, amount: float = 1.0):
+        self.value -= amount
+
+    def set_function(self, fn: Callable[[], float]):
+        """Read the value from fn at scrape time (queue depths): nothing to update on the hot path."""
+        self._fn = fn
+
+    def _samples(self, name, labelnames, values):
+        value = self._fn() if self._fn is not None else self.value
+        return [f"{name}{_labels(labelnames, values)} {value}"]
+
+
+class Histogram(_Metric):
+    TYPE = "histogram"
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self.counts = [0] * (len(self.buckets) + 1)  # last slot is +Inf
+        self.sum = 0.0
+
+    def _child(self):
+        return Histogram(self.name, self.help, buckets=self.buckets)
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+
+    def time(self) -> _Timer:
+        return _Timer(self)
+
+    def _samples(self, name, labelnames, values):
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self.buckets + (float("inf"),), self.counts):
+            cumulative += count
+            le = "+Inf" if bound == float("inf") else repr(bound)
+            lines.append(f"{name}_bucket{_labels(labelnames + ('le',), values + (le,))} {cumulative}")
+        lines.append(f"{name}_sum{_labels(labelnames, values)} {self.sum}")
+        lines.append(f"{name}_count{_labels(labelnames, values)} {cumulative}")
+        return lines
+
+
+class _NullMetric:
+    """Stand-in for every metric type when metrics are disabled."""
+    _timer = contextlib.nullcontext()
+
+    def labels(self, *values):
+        return self
+
+    def inc(self, amount: float = 1.0):
+        pass
+
+    def dec(self, amount: float = 1.0):
+        pass
+
+    def set(self, value: float):
+        pass
+
+    def set_function(self, fn):
+        pass
+
+    def observe(self, value: float):
+        pass
+
+    def time(self):
+        return self._timer
+
+
+_NULL = _NullMetric()
+_METHODS = ("labels", "inc", "dec", "set", "set_function", "observe", "time")
+
+
+class _Deferred:
+    """
+    Module-level handle for a metric that is built on first use. Resolving copies the
+    real (or null) metric's bound methods onto the handle, so later calls cost the same
+    as calling the metric directly.
+    """
+
+    def __init__(self, registry: "Registry", build: Callable[[], object]):
+        self._registry = registry
+        self._build = build
+        self._metric = None
+
+    def _resolve(self):
+        if self._metric is None:
+            self._metric = self._build() if self._registry.enabled else _NULL
+            for name in _METHODS:
+                if hasattr(self._metric, name):
+                    setattr(self, name, getattr(self._metric, name))
+        return self._metric
+
+    def __getattr__(self, name):
+        # Only reached before _resolve has put the metric's methods on the handle
+        if name.startswith("_"):
+            raise AttributeError(name)
+        return getattr(self._resolve(), name)
+
+
+class Registry:
+    def __init__(self, enabled: Optional[bool] = None):
+        self._enabled = enabled  # None: read METRICS_ENABLED when the first metric is used
+        self._metrics: Dict[str, _Metric] = {}
+        self._deferred: List[_Deferred] = []
+
+    @property
+    def enabled(self) -> bool:
+        if self._enabled is None:
+            self._enabled = CFG.METRICS_ENABLED
+        return self._enabled
+
+    def _create(self, cls, name: str, help: str, **kwargs):
+        if name not in self._metrics:
+            self._metrics[name] = cls(name, help, **kwargs)
+        return self._metrics[name]
+
+    def _register(self, cls, name: str, help: str, **kwargs):
+        handle = _Deferred(self, lambda: self._create(cls, name, help, **kwargs))
+        self._deferred.append(handle)
+        return handle
+
+    def counter(self, name: str, help: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self._register(Counter, name, help, labelnames=labelnames)
+
+    def gauge(self, name: str, help: str, labelnames: Sequence[str] = ()) -> Gauge:
+        return self._register(Gauge, name, help, labelnames=labelnames)
+
+    def histogram(self, name: str, help: str, labelnames: Sequence[str] = (),
+                  buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+        return self._register(Histogram, name, help, labelnames=labelnames, buckets=buckets)
+
+    def render(self) -> str:
+        for handle in self._deferred:
+            handle._resolve()
+        lines = []
+        for metric in self._metrics.values():
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+# Buy path stages, from catalog fetch to committed purchase
+SCAN_SECONDS = REGISTRY.histogram("autobuyer_scan_seconds", "Market scan (getStarGifts round trip incl. parsing)")
+PARSE_SECONDS = REGISTRY.histogram("autobuyer_parse_seconds", "payments.StarGifts response parsing",
+                                   buckets=(0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05))
+GET_CLIENT_SECONDS = REGISTRY.histogram("autobuyer_get_client_seconds", "AccountService.get_client incl. reconnects")
+RPC_SECONDS = REGISTRY.histogram("autobuyer_rpc_seconds", "Purchase RPC latency per account", ("account",))
+DB_COMMIT_SECONDS = REGISTRY.histogram("autobuyer_db_commit_seconds", "Ledger group commit (purchases, deposits, deliveries)")
+DETECT_TO_PURCHASE_SECONDS = REGISTRY.histogram(
+    "autobuyer_detect_to_purchase_seconds", "Gift appearing in stock to its first committed purchase",
+    buckets=(0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 300.0))
+PLAN_SECONDS = REGISTRY.histogram("autobuyer_plan_seconds", "Batch allocation planning per purchase cycle",
+                                  buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1))
+PURCHASES = REGISTRY.counter("autobuyer_purchases", "Purchase attempts by result", ("result",))
+LOOP_ERRORS = REGISTRY.counter("autobuyer_loop_errors", "Errors purchase_loop and delivery_loop caught and survived",
+                               ("stage",))
+QUEUE_DEPTH = REGISTRY.gauge("autobuyer_queue_depth", "Items waiting per internal queue", ("queue",))
+
+
+async def serve_metrics(host: str, port: int):
+    """Serve REGISTRY on http://host:port/metrics until cancelled."""
+    from aiohttp import web
+
+    async def handle(request):
+        return web.Response(body=REGISTRY.render().encode("utf-8"), headers={"Content-Type": CONTENT_TYPE})
+
+    app = web.Application()
+    app.router.add_get("/metrics", handle)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    site = web.TCPSite(runner, host, port)
+    await site.start()
+    print(f"[metrics] serving on http://{host}:{port}/metrics")
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await runner.cleanup()
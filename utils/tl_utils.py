@@ -1,108 +1,396 @@
-from telethon.tl.tlobject import TLRequest
-from telethon.extensions import BinaryReader
-from typing import Optional
-
-class _TLWriter:
-    """Minimal TL binary writer for the specific fields we need (int, long, string)."""
-    def __init__(self):
-        self._buf = bytearray()
-
-    def write_int(self, value: int, signed: bool = True):
-        # TL uses little-endian 32-bit integers
-        self._buf += int(value).to_bytes(4, byteorder="little", signed=signed)
-
-    def write_long(self, value: int, signed: bool = True):
-        # TL uses little-endian 64-bit integers
-        self._buf += int(value).to_bytes(8, byteorder="little", signed=signed)
-
-    def write_string(self, s: Optional[str]):
-        if s is None:
-            # Should not be called with None when field not present
-            s = ""
-        data = s.encode("utf-8")
-        l = len(data)
-        if l < 254:
-            self._buf += bytes([l]) + data
-            # pad to 4-byte boundary
-            pad = (4 - ((1 + l) % 4)) % 4
-            self._buf += b"\x00" * pad
-        else:
-            self._buf += bytes([254])
-            self._buf += (l & 0xFF).to_bytes(1, "little")
-            self._buf += ((l >> 8) & 0xFF).to_bytes(1, "little")
-            self._buf += ((l >> 16) & 0xFF).to_bytes(1, "little")
-            self._buf += data
-            pad = (4 - (l % 4)) % 4
-            self._buf += b"\x00" * pad
-
-    def get_bytes(self) -> bytes:
-        return bytes(self._buf)
-
-class _RawGetStarGifts(TLRequest):
-    """
-    Ручная реализация TL-запроса payments.getStarGifts#c4563590
-    Result: payments.StarGifts
-    """
-    CONSTRUCTOR_ID = 0xC4563590  # payments.getStarGifts
-
-    def __init__(self, hash: int = 0):
-        self.hash = hash
-
-    def write(self) -> bytes:
-        w = _TLWriter()
-        # constructor id
-        w.write_int(self.CONSTRUCTOR_ID, signed=False)
-        w.write_int(self.hash)
-        return w.get_bytes()
-
-    # Telethon will call read_result to parse the response payload
-    @staticmethod
-    def read_result(reader: BinaryReader):
-        # Read the constructor ID for payments.StarGifts
-        cid = reader.read_int(signed=False)
-        if cid == 0xA388A368:  # starGiftsNotModified
-            return []
-        if cid != 0x901689EA:  # starGifts
-            raise ValueError(f"Unexpected constructor id for payments.StarGifts: {hex(cid)}")
-        hash_ = reader.read_int()
-        # Vector<StarGift>
-        vector_id = reader.read_int(signed=False)
-        if vector_id != 0x1CB5C415:
-            raise ValueError("Expected Vector constructor for StarGift list")
-        count = reader.read_int()
-        results = []
-        for _ in range(count):
-            # StarGift constructor id
-            item_cid = reader.read_int(signed=False)
-            if item_cid != 0x49C577CD:
-                raise ValueError(f"Unexpected constructor id for StarGift: {hex(item_cid)}")
-            flags = reader.read_int()
-            limited = bool(flags & (1 << 0))
-            sold_out = bool(flags & (1 << 1))
-            birthday = bool(flags & (1 << 2))
-            id_ = reader.read_long()
-            # sticker: Document
-            sticker = reader.read_object()  # Parse Document
-            stars = reader.read_long()
-            if limited:
-                availability_remains = reader.read_int()
-                availability_total = reader.read_int()
-            else:
-                availability_remains = 999999
-                availability_total = 999999
-            convert_stars = reader.read_long()
-            if sold_out:
-                availability_remains = 0
-                first_sale_date = reader.read_int()
-                last_sale_date = reader.read_int()
-            results.append({
-                "id": int(id_),
-                "stars": int(stars),
-                "store_product": None,  # Not present
-                "currency": "XTR",
-                "amount": int(stars),
-                "remaining": availability_remains,
-                "limited": limited,
-                "sold_out": sold_out,
-            })
-        return results
\ No newline at end of file
+from telethon.tl.tlobject import TLObject, TLRequest
+from telethon.extensions import BinaryReader
+from typing import Callable, Dict, List, NamedTuple, Optional, Tuple
+import struct
+from utils.metrics import PARSE_SECONDS
+
+class _TLWriter:
+    """Minimal TL binary writer for the specific fields we need (int, long, string)."""
+    def __init__(self):
+        self._buf = bytearray()
+
+    def write_int(self, value: int, signed: bool = True):
+        # TL uses little-endian 32-bit integers
+        self._buf += int(value).to_bytes(4, byteorder="little", signed=signed)
+
+    def write_long(self, value: int, signed: bool = True):
+        # TL uses little-endian 64-bit integers
+        self._buf += int(value).to_bytes(8, byteorder="little", signed=signed)
+
+    def write_string(self, s: Optional[str]):
+        if s is None:
+            # Should not be called with None when field not present
+            s = ""
+        data = s.encode("utf-8")
+        l = len(data)
+        if l < 254:
+            self._buf += bytes([l]) + data
+            # pad to 4-byte boundary
+            pad = (4 - ((1 + l) % 4)) % 4
+            self._buf += b"\x00" * pad
+        else:
+            self._buf += bytes([254])
+            self._buf += (l & 0xFF).to_bytes(1, "little")
+            self._buf += ((l >> 8) & 0xFF).to_bytes(1, "little")
+            self._buf += ((l >> 16) & 0xFF).to_bytes(1, "little")
+            self._buf += data
+            pad = (4 - (l % 4)) % 4
+            self._buf += b"\x00" * pad
+
+    def get_bytes(self) -> bytes:
+        return bytes(self._buf)
+
+class _RawGetStarGifts(TLRequest):
+    """
+    Ручная реализация TL-запроса payments.getStarGifts#c4563590
+    Result: payments.StarGifts
+    """
+    CONSTRUCTOR_ID = 0xC4563590  # payments.getStarGifts
+
+    def __init__(self, hash: int = 0):
+        self.hash = hash
+
+    def write(self) -> bytes:
+        w = _TLWriter()
+        # constructor id
+        w.write_int(self.CONSTRUCTOR_ID, signed=False)
+        w.write_int(self.hash)
+        return w.get_bytes()
+
+    def _bytes(self) -> bytes:
+        # Telethon serializes requests through _bytes()
+        return self.write()
+
+    # Telethon will call read_result to parse the response payload.
+    # Returns None for starGiftsNotModified, otherwise (hash, [StarGiftRecord]).
+    @staticmethod
+    def read_result(reader: BinaryReader):
+        # Parse straight over the response buffer: no copy, no Document objects
+        buf = reader.stream.getbuffer()
+        try:
+            with PARSE_SECONDS.time():
+                result, end = parse_star_gifts(buf, reader.tell_position())
+        finally:
+            buf.release()
+        reader.set_position(end)
+        return result
+
+
+class _RawInputInvoiceStarGift(TLObject):
+    """
+    inputInvoiceStarGift#e8625e92 flags:# hide_name:flags.0?true peer:InputPeer gift_id:long = InputInvoice
+    Not part of Telethon's layer; only ever serialized into payment requests.
+    """
+    CONSTRUCTOR_ID = 0xE8625E92
+
+    def __init__(self, peer: TLObject, gift_id: int, hide_name: bool = False):
+        self.peer = peer
+        self.gift_id = gift_id
+        self.hide_name = hide_name
+
+    def _bytes(self) -> bytes:
+        flags = 1 if self.hide_name else 0
+        return struct.pack("<II", self.CONSTRUCTOR_ID, flags) + bytes(self.peer) + struct.pack("<q", self.gift_id)
+
+
+class _RawGetPaymentForm(TLRequest):
+    """
+    payments.getPaymentForm#37148dbb flags:# invoice:InputInvoice theme_params:flags.0?DataJSON
+    Result for a star gift invoice: payments.paymentFormStarGift#b425cfe1 form_id:long invoice:Invoice
+    """
+    CONSTRUCTOR_ID = 0x37148DBB
+
+    def __init__(self, invoice: TLObject):
+        self.invoice = invoice
+
+    def _bytes(self) -> bytes:
+        return struct.pack("<II", self.CONSTRUCTOR_ID, 0) + bytes(self.invoice)
+
+    # Returns (form_id, total amount of the invoice prices in Stars)
+    @staticmethod
+    def read_result(reader: BinaryReader):
+        cid = reader.read_int(signed=False)
+        if cid != 0xB425CFE1:  # payments.paymentFormStarGift
+            raise ValueError(f"Unexpected constructor id for payments.PaymentForm: {hex(cid)}")
+        form_id = reader.read_long()
+        # invoice#... flags:# ... currency:string prices:Vector<LabeledPrice> ...; the tail is not needed
+        reader.read_int(signed=False)
+        reader.read_int(signed=False)
+        reader.tgread_string()
+        if reader.read_int(signed=False) != 0x1CB5C415:
+            raise ValueError("Expected Vector constructor for LabeledPrice list")
+        amount = 0
+        for _ in range(reader.read_int()):
+            reader.read_int(signed=False)  # labeledPrice#cb296bf8 label:string amount:long
+            reader.tgread_string()
+            amount += reader.read_long()
+        return form_id, amount
+
+
+class _RawSendStarsForm(TLRequest):
+    """
+    payments.sendStarsForm#7998c914 form_id:long invoice:InputInvoice = payments.PaymentResult
+    Serialized once in __init__: sending a prepared form costs no encoding work on the hot path.
+    """
+    CONSTRUCTOR_ID = 0x7998C914
+
+    def __init__(self, form_id: int, invoice: TLObject):
+        self.form_id = form_id
+        self.invoice = invoice
+        self._payload = struct.pack("<Iq", self.CONSTRUCTOR_ID, form_id) + bytes(invoice)
+
+    def _bytes(self) -> bytes:
+        return self._payload
+
+    # Returns the Updates of payments.paymentResult, or True when this layer cannot decode them;
+    # the purchase already happened, so a decoding problem must not surface as a failure
+    @staticmethod
+    def read_result(reader: BinaryReader):
+        cid = reader.read_int(signed=False)
+        if cid == 0xD8411139:  # payments.paymentVerificationNeeded url:string
+            raise ValueError(f"Payment verification needed: {reader.tgread_string()}")
+        if cid != 0x4E5F810D:  # payments.paymentResult updates:Updates
+            raise ValueError(f"Unexpected constructor id for payments.PaymentResult: {hex(cid)}")
+        try:
+            return reader.tgread_object()
+        except Exception:
+            return True
+
+
+class StarGiftRecord(NamedTuple):
+    id: int
+    stars: int
+    remaining: int  # 999999 for unlimited gifts, 0 when sold out
+    limited: bool
+    sold_out: bool
+
+
+# --- Zero-copy payments.StarGifts parser -------------------------------------------------
+# Works over a memoryview and skips every sticker Document by walking its length-prefixed
+# fields instead of deserializing it. Constructors it does not know inside a Document fall
+# back to Telethon's reader for that one object.
+
+_I32 = struct.Struct("<i").unpack_from
+_U32 = struct.Struct("<I").unpack_from
+_I64 = struct.Struct("<q").unpack_from
+
+VECTOR_ID = 0x1CB5C415
+STAR_GIFTS_NOT_MODIFIED = 0xA388A368
+STAR_GIFTS = 0x901689EA  # payments.starGifts hash:int gifts:Vector<StarGift>
+STAR_GIFTS_WITH_PEERS = 0x2ED82995  # ... chats:Vector<Chat> users:Vector<User> (trailing vectors ignored)
+
+
+def _skip_bytes(buf, pos: int) -> int:
+    # TL bytes/string: 1-byte length (< 254) or 0xFE + 3-byte length, padded to 4 bytes
+    n = buf[pos]
+    if n < 254:
+        return pos + ((n + 4) & ~3)
+    n = buf[pos + 1] | (buf[pos + 2] << 8) | (buf[pos + 3] << 16)
+    return pos + ((n + 7) & ~3)
+
+
+def _skip_vector(buf, pos: int, skip_item: Callable) -> int:
+    if _U32(buf, pos)[0] != VECTOR_ID:
+        raise ValueError("Expected Vector constructor")
+    count = _I32(buf, pos + 4)[0]
+    pos += 8
+    for _ in range(count):
+        pos = skip_item(buf, pos)
+    return pos
+
+
+def _skip_int(buf, pos: int) -> int:
+    return pos + 4
+
+
+def _skip_fallback(buf, pos: int) -> int:
+    # Unknown constructor at pos: let Telethon parse just this object to learn its size
+    reader = BinaryReader(bytes(buf[pos:]))
+    reader.tgread_object()
+    return pos + reader.tell_position()
+
+
+def _skip_boxed(table: Dict[int, Callable]) -> Callable:
+    def skip(buf, pos: int) -> int:
+        body = table.get(_U32(buf, pos)[0])
+        if body is None:
+            return _skip_fallback(buf, pos)
+        return body(buf, pos + 4)
+    return skip
+
+
+_skip_input_sticker_set = _skip_boxed({
+    0xFFB62B95: lambda b, p: p,  # inputStickerSetEmpty
+    0x9DE7A269: lambda b, p: p + 16,  # inputStickerSetID id:long access_hash:long
+    0x861CC8A0: _skip_bytes,  # inputStickerSetShortName short_name:string
+    0x028703C8: lambda b, p: p,  # inputStickerSetAnimatedEmoji
+    0xE67F520E: _skip_bytes,  # inputStickerSetDice emoticon:string
+    0x0CDE3739: lambda b, p: p,  # inputStickerSetAnimatedEmojiAnimations
+    0xC88B3B02: lambda b, p: p,  # inputStickerSetPremiumGifts
+    0x04C4D4CE: lambda b, p: p,  # inputStickerSetEmojiGenericAnimations
+    0x29D0F5EE: lambda b, p: p,  # inputStickerSetEmojiDefaultStatuses
+    0x44C1F8E9: lambda b, p: p,  # inputStickerSetEmojiDefaultTopicIcons
+    0x49748553: lambda b, p: p,  # inputStickerSetEmojiChannelDefaultStatuses
+})
+
+_skip_photo_size = _skip_boxed({
+    0x0E17E23C: _skip_bytes,  # photoSizeEmpty type:string
+    0x75C78E60: lambda b, p: _skip_bytes(b, p) + 12,  # photoSize type w h size
+    0x021E1AD6: lambda b, p: _skip_bytes(b, _skip_bytes(b, p) + 8),  # photoCachedSize type w h bytes
+    0xE0B0BC2E: lambda b, p: _skip_bytes(b, _skip_bytes(b, p)),  # photoStrippedSize type bytes
+    0xFA3EFB95: lambda b, p: _skip_vector(b, _skip_bytes(b, p) + 8, _skip_int),  # photoSizeProgressive
+    0xD8214D41: lambda b, p: _skip_bytes(b, _skip_bytes(b, p)),  # photoPathSize type bytes
+})
+
+
+def _skip_video_size_body(buf, pos: int) -> int:
+    # videoSize flags:# type:string w:int h:int size:int video_start_ts:flags.0?double
+    flags = _U32(buf, pos)[0]
+    pos = _skip_bytes(buf, pos + 4) + 12
+    return pos + 8 if flags & 1 else pos
+
+
+_skip_video_size = _skip_boxed({
+    0xDE33B094: _skip_video_size_body,
+    0xF85C413C: lambda b, p: _skip_vector(b, p + 8, _skip_int),  # videoSizeEmojiMarkup emoji_id colors
+    0x0DA082FE: lambda b, p: _skip_vector(b, _skip_input_sticker_set(b, p) + 8, _skip_int),  # stickerMarkup
+})
+
+
+def _skip_attr_sticker(buf, pos: int) -> int:
+    # flags:# mask:flags.1?true alt:string stickerset:InputStickerSet mask_coords:flags.0?MaskCoords
+    flags = _U32(buf, pos)[0]
+    pos = _skip_input_sticker_set(buf, _skip_bytes(buf, pos + 4))
+    return pos + 32 if flags & 1 else pos  # maskCoords#aed6dbb2 n:int x y zoom:double
+
+
+def _skip_attr_video(buf, pos: int) -> int:
+    # layer 166: flags:# duration:double w:int h:int preload_prefix_size:flags.2?int
+    flags = _U32(buf, pos)[0]
+    pos += 4 + 16
+    return pos + 4 if flags & 4 else pos
+
+
+def _skip_attr_video_v2(buf, pos: int) -> int:
+    # newer layers add video_start_ts:flags.4?double video_codec:flags.5?string
+    flags = _U32(buf, pos)[0]
+    pos = _skip_attr_video(buf, pos)
+    if flags & 16:
+        pos += 8
+    if flags & 32:
+        pos = _skip_bytes(buf, pos)
+    return pos
+
+
+def _skip_attr_audio(buf, pos: int) -> int:
+    # flags:# duration:int title:flags.0?string performer:flags.1?string waveform:flags.2?bytes
+    flags = _U32(buf, pos)[0]
+    pos += 8
+    for bit in (1, 2, 4):
+        if flags & bit:
+            pos = _skip_bytes(buf, pos)
+    return pos
+
+
+_skip_document_attribute = _skip_boxed({
+    0x6C37C15C: lambda b, p: p + 8,  # imageSize w h
+    0x11B58939: lambda b, p: p,  # animated
+    0x6319D612: _skip_attr_sticker,
+    0xD38FF1C2: _skip_attr_video,
+    0x43C57C48: _skip_attr_video_v2,
+    0x9852F9C6: _skip_attr_audio,
+    0x15590068: _skip_bytes,  # filename
+    0x9801D2F7: lambda b, p: p,  # hasStickers
+    0xFD149899: lambda b, p: _skip_input_sticker_set(b, _skip_bytes(b, p + 4)),  # customEmoji flags alt set
+})
+
+
+def _skip_document_body(buf, pos: int) -> int:
+    # document flags:# id:long access_hash:long file_reference:bytes date:int mime_type:string size:long
+    #   thumbs:flags.0?Vector<PhotoSize> video_thumbs:flags.1?Vector<VideoSize> dc_id:int
+    #   attributes:Vector<DocumentAttribute>
+    flags = _U32(buf, pos)[0]
+    pos = _skip_bytes(buf, pos + 20) + 4
+    pos = _skip_bytes(buf, pos) + 8
+    if flags & 1:
+        pos = _skip_vector(buf, pos, _skip_photo_size)
+    if flags & 2:
+        pos = _skip_vector(buf, pos, _skip_video_size)
+    return _skip_vector(buf, pos + 4, _skip_document_attribute)
+
+
+skip_document = _skip_boxed({
+    0x36F8C871: lambda b, p: p + 8,  # documentEmpty id:long
+    0x8FD4C4D8: _skip_document_body,
+})
+
+_skip_peer = _skip_boxed({
+    0x59511722: lambda b, p: p + 8,  # peerUser
+    0x36C6019A: lambda b, p: p + 8,  # peerChat
+    0xA2A5371E: lambda b, p: p + 8,  # peerChannel
+})
+
+# StarGift layouts across layers, after `flags:# ... id:long sticker:Document stars:long`:
+# (field, flag bit or None, kind). limited = flags.0, sold_out = flags.1 in every layout.
+_REMAINS = ("availability_remains", 0, "int")
+_TOTAL = ("availability_total", 0, "int")
+_CONVERT = ("convert_stars", None, "long")
+_SALE_DATES = (("first_sale_date", 1, "int"), ("last_sale_date", 1, "int"))
+_UPGRADE = ("upgrade_stars", 3, "long")
+_RESALE_TAIL = (("resell_min_stars", 4, "long"), ("title", 5, "string"))
+_STAR_GIFT_LAYOUTS: Dict[int, Tuple] = {
+    0xAEA174EE: (_REMAINS, _TOTAL, _CONVERT),
+    0x49C577CD: (_REMAINS, _TOTAL, _CONVERT, *_SALE_DATES),
+    0x02CC73C8: (_REMAINS, _TOTAL, _CONVERT, *_SALE_DATES, _UPGRADE),
+    0xC62ACA28: (_REMAINS, _TOTAL, ("availability_resale", 4, "long"), _CONVERT, *_SALE_DATES, _UPGRADE,
+                 *_RESALE_TAIL),
+    0x7F853C12: (_REMAINS, _TOTAL, ("availability_resale", 4, "long"), _CONVERT, *_SALE_DATES, _UPGRADE,
+                 *_RESALE_TAIL, ("released_by", 6, "peer")),
+}
+_FIELD_SIZE = {"int": 4, "long": 8}
+
+
+def parse_star_gifts(buf, pos: int = 0):
+    """
+    Parse a payments.StarGifts payload starting at pos (at its constructor id).
+    Returns (None, end) for starGiftsNotModified, else ((hash, [StarGiftRecord]), end).
+    """
+    buf = memoryview(buf)
+    cid = _U32(buf, pos)[0]
+    if cid == STAR_GIFTS_NOT_MODIFIED:
+        return None, pos + 4
+    if cid not in (STAR_GIFTS, STAR_GIFTS_WITH_PEERS):
+        raise ValueError(f"Unexpected constructor id for payments.StarGifts: {hex(cid)}")
+    hash_ = _I32(buf, pos + 4)[0]
+    if _U32(buf, pos + 8)[0] != VECTOR_ID:
+        raise ValueError("Expected Vector constructor for StarGift list")
+    count = _I32(buf, pos + 12)[0]
+    pos += 16
+    records: List[StarGiftRecord] = []
+    append = records.append
+    for _ in range(count):
+        item_cid = _U32(buf, pos)[0]
+        layout = _STAR_GIFT_LAYOUTS.get(item_cid)
+        if layout is None:
+            raise ValueError(f"Unexpected constructor id for StarGift: {hex(item_cid)}")
+        flags = _U32(buf, pos + 4)[0]
+        id_ = _I64(buf, pos + 8)[0]
+        pos = skip_document(buf, pos + 16)
+        stars = _I64(buf, pos)[0]
+        pos += 8
+        remains = 999999
+        for name, bit, kind in layout:
+            if bit is not None and not flags & (1 << bit):
+                continue
+            if name == "availability_remains":
+                remains = _I32(buf, pos)[0]
+            if kind == "string":
+                pos = _skip_bytes(buf, pos)
+            elif kind == "peer":
+                pos = _skip_peer(buf, pos)
+            else:
+                pos += _FIELD_SIZE[kind]
+        limited = bool(flags & 1)
+        sold_out = bool(flags & 2)
+        append(StarGiftRecord(id_, stars, 0 if sold_out else remains, limited, sold_out))
+    return (hash_, records), pos